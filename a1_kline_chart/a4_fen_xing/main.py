@@ -1,52 +1,39 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """
-从通达信5分钟数据导出为本工程所需数据
+从通达信导出目录转换为本工程所需数据(按品种、周期分区的parquet存储)
+只转换有变化的文件, 且只转换上次之后追加的行, 各文件由进程池并行处理
+用法: python main.py [导出目录] [--store 存储目录] [--period 5m] [--workers 进程数]
 """
 import os
 import sys
 work_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 os.chdir(work_dir)     # 设定指定目录为工作目录
 sys.path.append(work_dir)
-from common.logging_cfg import SysLogInit
-from common.ui_main_window import MainWindow, app
+import argparse
 import logging
-from cfg import g_cfg
-from common.http.httpserver import PyHttpServer
-import pandas as pd
-from datetime import date
-file_name = "28#SRL9.txt"
-csv_file = f"D:\\new_tdx\\T0002\\export\\{file_name}"
-with open(csv_file, encoding='gbk') as file:
-    file.readline()
-    content = file.readline().replace('\t', ',').replace("\n", "")
-    content = content.replace(' ', '')
-columns = content.split(',')
-print(content)
-df = pd.read_csv(csv_file, encoding='gbk', skiprows=3, names=columns).replace("\n", "", regex=True)
-df = df[:-1]
-df['时间'] = df['时间'].fillna('').astype(int).astype(str)
-df['时间'] = df['时间'].apply(lambda x: x.zfill(4) if x != '' else x)
-df['dt'] = pd.to_datetime(df['日期'] + ' ' + df['时间'], format='%Y/%m/%d %H%M')
-df = df[['dt'] + [col for col in df.columns if col not in ['日期', '时间', 'dt', '持仓量', '结算价']]]
-df = df.rename(columns={'开盘': 'open', '最高': 'high', '最低': 'low', '收盘': 'close', '成交量': 'volume'})
-file_name = f"./data/{date.today().strftime("%Y%m%d")}_{file_name}"
-print(f"will save_file: {file_name}")
-df.to_csv(file_name, index=False)
-print(df)
+from common.logging_cfg import SysLogInit
+from common.config import KLINE_STORE_PATH
+from common.utils import kline_converter, kline_store
+
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="通达信导出目录转换为K线parquet存储")
+    parser.add_argument("src_dir", nargs="?", default="D:/new_tdx/T0002/export", help="通达信导出目录")
+    parser.add_argument("--store", default=KLINE_STORE_PATH, help="parquet存储目录")
+    parser.add_argument("--period", default="5m", help="K线周期, 作为存储的分区名")
+    parser.add_argument("--workers", type=int, default=None, help="进程数, 默认为CPU核数")
+    return parser.parse_args()
 
 
 if __name__ == '__main__':
-    SysLogInit('a4_fen_xing', 'logs/a1_kline_chart/a3_fen_xing')
-    g_cfg.load_yaml()   # 默认最先加载配置文件
+    SysLogInit('a4_fen_xing', 'logs/a1_kline_chart/a4_fen_xing')
+    args = parse_args()
     logging.info(f"...... ...... work begin... work_dir:{work_dir}")
-    logging.error("abcd")
-    logger = logging.getLogger(__name__)
-    logger.info("color test...")
-    # PyHttpServer().start()
-    #
-    # w = MainWindow(g_cfg.conf)
-    # w.resize(1024, 768)
-    # w.show()
-    # app.exec()
+    if not kline_store.available():
+        logging.error("没有安装pyarrow, 无法写入parquet存储")
+        sys.exit(1)
+    results = kline_converter.convert_dir(args.src_dir, args.store, args.period, args.workers)
+    for r in results:
+        if r["status"] != "skip":
+            logging.info(f"{r['status']:>6} {r['symbol']}: {r['rows']} rows, {r['seconds']:.2f}s")
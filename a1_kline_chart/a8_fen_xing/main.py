@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+全品种缠论选股表: 对通达信导出目录下的每个品种计算笔、段、中枢, 输出每个品种一行的摘要
+文件未变化的品种直接使用上次的结果, 其余由进程池分块计算
+用法: python main.py [导出目录] [--count K线数] [--workers 进程数] [--no-cache] [--sort 列名] [--csv 输出文件]
+"""
+import os
+import sys
+work_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(work_dir)     # 设定指定目录为工作目录
+sys.path.append(work_dir)
+import argparse
+import csv
+import logging
+from common.logging_cfg import SysLogInit
+from common.chanlun import screener
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="全品种缠论选股表")
+    parser.add_argument("base_path", nargs="?", default="D:/new_tdx/T0002/export", help="通达信导出目录")
+    parser.add_argument("--count", type=int, default=screener.DEFAULT_KLINE_COUNT, help="每个品种取最后多少根K线")
+    parser.add_argument("--workers", type=int, default=None, help="进程数, 默认为CPU核数")
+    parser.add_argument("--no-cache", action="store_true", help="不使用上次的结果, 全部重算")
+    parser.add_argument("--sort", default="", help="按该列排序, 例如 fx_bars")
+    parser.add_argument("--csv", default="", help="结果另存为csv文件")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    SysLogInit('a8_fen_xing', 'logs/a1_kline_chart/a8_fen_xing')
+    args = parse_args()
+    logging.info(f"...... ...... work begin... work_dir:{work_dir}")
+    rows = screener.screen_dir(args.base_path, args.count, args.workers, use_cache=not args.no_cache)
+    rows = [row for row in rows if row["bars"]]
+    if args.sort:
+        rows.sort(key=lambda row: (row.get(args.sort) is None, row.get(args.sort)))
+    print(screener.format_table(rows))
+    if args.csv:
+        with open(args.csv, "w", encoding="utf-8-sig", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=screener.COLUMNS, extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(rows)
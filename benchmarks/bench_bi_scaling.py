@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@file: bench_bi_scaling.py
+@desc: 笔的计算耗时随K线数量的变化(1万到100万根)
+  K线为随机游走生成的震荡行情, 分型密集, 最能体现查找下一个分型的开销
+  每一行给出: 独立K线数、分型数、笔数, calculate_bi 的耗时以及每万根K线的耗时
+  每万根K线的耗时基本不变, 即与K线数成线性
+用法: python benchmarks/bench_bi_scaling.py [最大K线数] [重复次数]
+"""
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+work_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(work_dir)     # 设定指定目录为工作目录
+sys.path.append(work_dir)
+import numpy as np
+from common.chanlun.c_bi import cal_independent_klines, cal_fractals, init_independents, init_merges, calculate_bi
+from common.model.kline import KLineSeries
+
+SIZES = [10000, 30000, 100000, 300000, 1000000]
+
+
+def make_klines(n: int, seed: int = 7) -> KLineSeries:
+    """随机游走的5分钟K线, 价格按最小变动价位1取整"""
+    rng = np.random.default_rng(seed)
+    close = 5000 + np.round(np.cumsum(rng.normal(0, 3, n)))
+    open_ = np.r_[close[0], close[:-1]]
+    high = np.maximum(open_, close) + np.round(rng.exponential(2, n))
+    low = np.minimum(open_, close) - np.round(rng.exponential(2, n))
+    t0 = datetime(2015, 1, 5, 9, 0)
+    return KLineSeries([t0 + timedelta(minutes=5 * i) for i in range(n)], open_, high, low, close,
+                       rng.integers(100, 5000, n))
+
+
+def main():
+    max_size = int(sys.argv[1]) if len(sys.argv) > 1 else SIZES[-1]
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    print(f"{'bars':>9} {'combs':>9} {'fractals':>9} {'bi':>7} {'bi ms':>9} {'ms/10k':>8}")
+    for n in [size for size in SIZES if size <= max_size]:
+        klines = make_klines(n)
+        combs = cal_independent_klines(klines)
+        fractals = cal_fractals(combs)
+        independents = init_independents(combs)
+        merges = init_merges(combs, klines, independents)
+        best = float("inf")
+        bi_list = []
+        for _ in range(repeat):
+            t = time.perf_counter()
+            bi_list = calculate_bi(fractals, merges, independents)
+            best = min(best, time.perf_counter() - t)
+        print(f"{n:>9} {len(combs):>9} {len(fractals):>9} {len(bi_list):>7} {best * 1000:>9.1f} "
+              f"{best * 1000 / n * 10000:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
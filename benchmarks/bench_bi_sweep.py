@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@file: bench_bi_sweep.py
+@desc: 笔规则参数扫描的耗时
+  naive:  每组参数都从合并K线开始重算 合并 -> 分型 -> 笔
+  shared: sweep_bi 在本进程计算, 合并K线、分型只算一次
+  pool:   sweep_bi 用进程池计算各组参数
+  之后逐组列出参数、笔数、每笔平均K线数, 看参数的敏感度
+用法: python benchmarks/bench_bi_sweep.py [K线文件] [进程数]
+不指定文件时使用 data/28#SRL9.txt 的全部K线, 参数为 param_grid 的默认取值加上 epsilon 为 0 和 1 两种
+"""
+import os
+import sys
+import time
+work_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(work_dir)     # 设定指定目录为工作目录
+sys.path.append(work_dir)
+from common.chanlun.c_bi import cal_independent_klines, cal_fractals, init_independents, init_merges, calculate_bi
+from common.chanlun.context import ChanlunContext
+from common.chanlun.sweep import param_grid, sweep_bi
+from common.model.kline import KLineSeries
+from common.utils import kline_parser
+
+
+def load(file_path: str) -> KLineSeries:
+    with open(file_path, "rb") as f:
+        cols, _, _ = kline_parser.parse_tdx(f.read())
+    return KLineSeries.from_arrays([cols[name] for name in ("time", "open", "high", "low", "close", "volume")])
+
+
+def naive(klines: KLineSeries, grid):
+    ret = []
+    for params in grid:
+        combs = cal_independent_klines(klines)
+        independents = init_independents(combs)
+        ret.append(calculate_bi(cal_fractals(combs), init_merges(combs, klines, independents), independents, params))
+    return ret
+
+
+def main():
+    file_path = sys.argv[1] if len(sys.argv) > 1 else "data/28#SRL9.txt"
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    klines = load(file_path)
+    grid = param_grid(epsilons=(0.0, 1.0))
+    print(f"{file_path}: {len(klines)} bars, {len(grid)} parameter sets, {os.cpu_count()} cpus")
+
+    t = time.perf_counter()
+    expect = naive(klines, grid)
+    t_naive = time.perf_counter() - t
+
+    t = time.perf_counter()
+    ctx = ChanlunContext(klines)
+    shared = sweep_bi(ctx, grid, workers=1)
+    t_shared = time.perf_counter() - t
+
+    t = time.perf_counter()
+    pooled = sweep_bi(ChanlunContext(klines), grid, workers=workers)
+    t_pool = time.perf_counter() - t
+
+    same = all(repr(a) == repr(b) == repr(c) for a, b, c in zip(expect, shared, pooled))
+    print(f"naive {t_naive * 1000:.0f} ms, shared {t_shared * 1000:.0f} ms, pool {t_pool * 1000:.0f} ms, "
+          f"same result: {same}")
+    print(f"{'rule':>6} {'min':>4} {'eps':>5} {'bi':>6} {'bars/bi':>8}")
+    for params, bi_list in zip(grid, shared):
+        per_bi = len(klines) / len(bi_list) if bi_list else 0
+        print(f"{params.rule.name:>6} {params.min_bars:>4} {params.epsilon:>5} {len(bi_list):>6} {per_bi:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@file: bench_chanlun_memory.py
+@desc: 缠论完整流程(合并 -> 分型 -> 笔 -> 段 -> 中枢)的内存与耗时
+  blocks: 流程结束后仍被结果引用的内存块数(sys.getallocatedblocks 的增量)
+  peak:   tracemalloc 统计的峰值内存
+  time:   不开 tracemalloc 时的最好耗时
+  stages: ChanlunContext 记录的各步骤耗时
+用法: python benchmarks/bench_chanlun_memory.py [K线文件] [K线数量] [重复次数]
+不指定文件时使用 data/28#SRL9.txt, 不指定数量时使用文件中的全部K线
+"""
+import gc
+import os
+import sys
+import time
+import tracemalloc
+work_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(work_dir)     # 设定指定目录为工作目录
+sys.path.append(work_dir)
+from common.chanlun.c_bi import (cal_fractals, cal_independent_klines, calculate_bi, _NCHDUAN,
+                                 compute_bi_pivots, compute_duan_pivots, init_merges, init_independents)
+from common.chanlun.context import ChanlunContext, STAGES
+from common.model.kline import KLineSeries
+from common.utils import kline_parser
+
+
+def load(file_path: str, count: int) -> KLineSeries:
+    with open(file_path, "rb") as f:
+        cols, _, _ = kline_parser.parse_tdx(f.read())
+    names = ("time", "open", "high", "low", "close", "volume")
+    arrays = [cols[name][-count:] if count else cols[name] for name in names]
+    return KLineSeries.from_arrays(arrays)
+
+
+def pipeline(klines: KLineSeries):
+    combs = cal_independent_klines(klines)
+    fractals = cal_fractals(combs)
+    independents = init_independents(combs)
+    merges = init_merges(combs, klines, independents)
+    bi_list = calculate_bi(fractals, merges, independents)
+    bi_pivots = compute_bi_pivots(bi_list)
+    seg_list = _NCHDUAN(bi_list, merges)
+    duan_pivots = compute_duan_pivots(seg_list)
+    return fractals, combs, independents, merges, bi_list, bi_pivots, seg_list, duan_pivots
+
+
+def main():
+    file_path = sys.argv[1] if len(sys.argv) > 1 else "data/28#SRL9.txt"
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+    repeat = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+    klines = load(file_path, count)
+    print(f"file: {file_path}, {len(klines)} bars")
+
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        result = pipeline(klines)
+        best = min(best, time.perf_counter() - t)
+        del result
+
+    gc.collect()
+    blocks = sys.getallocatedblocks()
+    tracemalloc.start()
+    result = pipeline(klines)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    gc.collect()
+    blocks = sys.getallocatedblocks() - blocks
+    print(f"combs: {len(result[1])}, fractals: {len(result[0])}, bi: {len(result[4])}, segment: {len(result[6])}, "
+          f"bi pivot: {len(result[5])}, segment pivot: {len(result[7])}")
+    print(f"blocks: {blocks:,} ({blocks / len(klines):.1f}/bar), peak: {peak / 1024 / 1024:.1f} MB, "
+          f"time: {best * 1000:.0f} ms")
+    ctx = ChanlunContext(klines)
+    for stage in STAGES:
+        getattr(ctx, stage)
+    print("stages: " + ", ".join(f"{stage} {ctx.timings[stage] * 1000:.0f}" for stage in STAGES) + " ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@file: bench_chanlun_store.py
+@desc: 缠论结果持久化的耗时
+  batch:   不用快照, 合并 -> 分型 -> 笔 -> 段 -> 中枢全部重算
+  fresh:   没有快照时的首次计算(含写入快照)
+  append:  快照之后追加了K线, 恢复快照并只计算追加的部分
+  reload:  数据未变化, 再次打开
+  各项结果与 batch 比较是否一致
+用法: python benchmarks/bench_chanlun_store.py [K线文件] [追加K线数]
+不指定文件时使用 data/28#SRL9.txt 的全部K线, 追加K线数默认500, 快照写在临时目录中
+"""
+import os
+import sys
+import tempfile
+import time
+work_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(work_dir)     # 设定指定目录为工作目录
+sys.path.append(work_dir)
+from common.chanlun.context import ChanlunContext
+from common.chanlun.snapshot import load_chanlun
+from common.model.kline import KLineSeries
+from common.utils import kline_parser
+
+
+def load(file_path: str) -> KLineSeries:
+    with open(file_path, "rb") as f:
+        cols, _, _ = kline_parser.parse_tdx(f.read())
+    return KLineSeries.from_arrays([cols[name] for name in ("time", "open", "high", "low", "close", "volume")],
+                                   symbol=os.path.basename(file_path))
+
+
+def result(source) -> str:
+    return repr((source.bi_list, [(s.start_index, s.end_index, s.is_sure) for s in source.segments],
+                 source.bi_pivots, source.duan_pivots))
+
+
+def main():
+    file_path = sys.argv[1] if len(sys.argv) > 1 else "data/28#SRL9.txt"
+    tail = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    klines = load(file_path)
+    print(f"{file_path}: {len(klines)} bars, append {tail} bars")
+
+    t = time.perf_counter()
+    expect = result(ChanlunContext(klines))
+    print(f"{'batch':>7} {(time.perf_counter() - t) * 1000:>8.0f} ms")
+    with tempfile.TemporaryDirectory() as root:
+        for name, data in (("fresh", klines[:len(klines) - tail]), ("append", klines), ("reload", klines)):
+            t = time.perf_counter()
+            engine = load_chanlun(data, root)
+            spend = time.perf_counter() - t
+            same = result(engine) == expect if len(data) == len(klines) else ""
+            print(f"{name:>7} {spend * 1000:>8.0f} ms {same}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@file: bench_kline_parser.py
+@desc: K线文本解析速度对比(bars/sec)
+  per-line: 逐行 gb2312 解码 + DataItem.init_txt(strptime、float)
+  bulk:     kline_parser.parse_tdx 整块字节解析
+用法: python benchmarks/bench_kline_parser.py [通达信导出文件] [重复次数]
+不指定文件时, 由 data/28#SRL9.txt 生成一个带表头表尾的通达信导出文件
+"""
+import os
+import sys
+import tempfile
+import time
+work_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(work_dir)     # 设定指定目录为工作目录
+sys.path.append(work_dir)
+from common.klinechart.chart.object import DataItem
+from common.utils import kline_parser
+
+
+def make_tdx_file(src: str, dst: str):
+    """把 data 下的样例转换成通达信导出格式: gb2312, CRLF, 日期用'/'"""
+    with open(src, "r", encoding="gb2312", errors="ignore") as f:
+        lines = [line.strip() for line in f if line[:1].isdigit()]
+    with open(dst, "wb") as f:
+        f.write("28#SRL9 白糖主连 5分钟 不复权\r\n".encode("gb2312"))
+        f.write("日期,时间,开盘,最高,最低,收盘,成交量,持仓量,结算价\r\n".encode("gb2312"))
+        for line in lines:
+            f.write((line.replace("-", "/", 2) + "\r\n").encode("gb2312"))
+        f.write("数据来源:通达信\r\n".encode("gb2312"))
+
+
+def per_line(buf: bytes) -> int:
+    bars = []
+    for line in buf.decode("gb2312", errors="ignore").split("\n"):
+        line = line.strip()
+        if line and line[0].isdigit():
+            bar = DataItem(line)
+            if bar:
+                bars.append(bar)
+    return len(bars)
+
+
+def bulk(buf: bytes) -> int:
+    cols, _, _ = kline_parser.parse_tdx(buf)
+    return len(cols["time"])
+
+
+def run(name: str, func, buf: bytes, repeat: int):
+    best = float("inf")
+    count = 0
+    for _ in range(repeat):
+        t = time.perf_counter()
+        count = func(buf)
+        best = min(best, time.perf_counter() - t)
+    print(f"{name:>10}: {count} bars, {best * 1000:.1f} ms, {count / best:,.0f} bars/sec")
+    return best
+
+
+def main():
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    if len(sys.argv) > 1:
+        file_path = sys.argv[1]
+    else:
+        file_path = os.path.join(tempfile.mkdtemp(), "28#SRL9.txt")
+        make_tdx_file("data/28#SRL9.txt", file_path)
+    with open(file_path, "rb") as f:
+        buf = f.read()
+    print(f"file: {file_path}, {len(buf)} bytes")
+    t_line = run("per-line", per_line, buf, repeat)
+    t_bulk = run("bulk", bulk, buf, repeat)
+    print(f"speedup: {t_line / t_bulk:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
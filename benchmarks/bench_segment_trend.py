@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@file: bench_segment_trend.py
+@desc: 长趋势行情下线段计算的耗时
+  K线为合成的单边上涨行情: 每一轮先大涨, 再出现一次带缺口的特征序列破坏, 随后又创新高,
+  所以整个序列只有一根向上线段, 跨越数千笔. 每次破坏都要对段内的特征序列做包含处理,
+  特征序列的状态保存在线段上逐笔推进, 每笔的耗时不随线段长度增加
+  每一行给出: K线数、笔数、最长线段的笔数, _NCHDUAN 的耗时以及每千笔的耗时
+用法: python benchmarks/bench_segment_trend.py [最大笔数] [重复次数]
+"""
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+work_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(work_dir)     # 设定指定目录为工作目录
+sys.path.append(work_dir)
+import numpy as np
+from common.chanlun.c_bi import (cal_independent_klines, cal_fractals, init_independents, init_merges, calculate_bi,
+                                 _NCHDUAN)
+from common.model.kline import KLineSeries
+
+SIZES = [1000, 3000, 10000, 30000, 100000]     # 笔数
+CYCLE = (60, -10, 5, -10)   # 每一轮的四笔: 大涨、回调(高于前高, 形成缺口)、反弹不过高、再创回调新低, 下一轮创新高
+BARS_PER_BI = 6
+
+
+def make_klines(n_bi: int, seed: int = 7) -> KLineSeries:
+    """由每笔的涨跌幅生成5分钟K线, 每笔 BARS_PER_BI 根"""
+    rng = np.random.default_rng(seed)
+    moves = np.tile(CYCLE, n_bi // len(CYCLE) + 1)[:n_bi] + rng.integers(0, 2, n_bi)
+    points = 1000 + np.r_[0, np.cumsum(moves)]
+    close = np.concatenate([np.linspace(a, b, BARS_PER_BI + 1)[1:] for a, b in zip(points[:-1], points[1:])])
+    open_ = np.r_[close[0], close[:-1]]
+    t0 = datetime(2015, 1, 5, 9, 0)
+    return KLineSeries([t0 + timedelta(minutes=5 * i) for i in range(len(close))], open_,
+                       np.maximum(open_, close) + 1, np.minimum(open_, close) - 1, close,
+                       rng.integers(100, 5000, len(close)))
+
+
+def main():
+    max_size = int(sys.argv[1]) if len(sys.argv) > 1 else SIZES[-1]
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    print(f"{'bars':>9} {'bi':>7} {'longest':>8} {'duan ms':>9} {'ms/1k bi':>9}")
+    for n in [size for size in SIZES if size <= max_size]:
+        klines = make_klines(n)
+        combs = cal_independent_klines(klines)
+        independents = init_independents(combs)
+        merges = init_merges(combs, klines, independents)
+        bi_list = calculate_bi(cal_fractals(combs), merges, independents)
+        best = float("inf")
+        segments = []
+        for _ in range(repeat):
+            t = time.perf_counter()
+            segments = _NCHDUAN(bi_list, merges)
+            best = min(best, time.perf_counter() - t)
+        longest = max([seg.end_index - seg.start_index for seg in segments], default=0)
+        print(f"{len(klines):>9} {len(bi_list):>7} {longest:>8} {best * 1000:>9.1f} "
+              f"{best * 1000 / len(bi_list) * 1000:>9.2f}")
+
+
+if __name__ == '__main__':
+    main()
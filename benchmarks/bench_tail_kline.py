@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@file: bench_tail_kline.py
+@desc: 从文件尾取最后n根K线的速度对比(不使用缓存和索引)
+  blocks: file_txt._read_in_reverse_blocks 逐块(1KB)逆向读取, 逐行解码
+  mmap:   file_txt._scan_in_reverse 自适应块大小逆向扫描, 一次切片解码
+  +end_dt: 同上, 取倒数第二天之前的n根
+用法: python benchmarks/bench_tail_kline.py [通达信导出文件] [重复次数]
+不指定文件时, 生成一个20万行的通达信导出文件
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+work_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(work_dir)     # 设定指定目录为工作目录
+sys.path.append(work_dir)
+from common.utils import file_txt
+
+SIZES = [1000, 10000, 100000]
+
+
+def make_tdx_file(dst: str, rows: int = 200000):
+    """生成通达信导出格式的5分钟K线: gb2312, CRLF, 带表头表尾"""
+    t = datetime(2015, 1, 5, 9, 0)
+    price = 5000.0
+    with open(dst, "wb") as f:
+        f.write("28#SRL9 白糖主连 5分钟 不复权\r\n".encode("gb2312"))
+        f.write("日期,时间,开盘,最高,最低,收盘,成交量,持仓量,结算价\r\n".encode("gb2312"))
+        lines = []
+        for i in range(rows):
+            t += timedelta(minutes=5)
+            if t.hour >= 15:
+                t = t.replace(hour=9, minute=5) + timedelta(days=1)
+            close = price + (i * 7919 % 21 - 10)
+            lines.append(f"{t:%Y/%m/%d},{t:%H%M},{price:.2f},{max(price, close) + 2:.2f},"
+                         f"{min(price, close) - 2:.2f},{close:.2f},{i % 5000 + 100},{300000 + i % 777},0.00\r\n")
+            price = close
+        f.write("".join(lines).encode("gb2312"))
+        f.write("数据来源:通达信\r\n".encode("gb2312"))
+
+
+def run(name: str, func, repeat: int) -> float:
+    best = float("inf")
+    count = 0
+    for _ in range(repeat):
+        t = time.perf_counter()
+        count = len(func())
+        best = min(best, time.perf_counter() - t)
+    print(f"{name:>16}: {count} lines, {best * 1000:.1f} ms")
+    return best
+
+
+def main():
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    if len(sys.argv) > 1:
+        file_path = sys.argv[1]
+    else:
+        file_path = os.path.join(tempfile.mkdtemp(), "28#SRL9.txt")
+        make_tdx_file(file_path)
+    print(f"file: {file_path}, {os.path.getsize(file_path)} bytes")
+    last = file_txt._scan_in_reverse(file_path, 1, None)[0]
+    end_dt = datetime.strptime(last.split(",")[0], "%Y/%m/%d") - timedelta(days=1)
+    for n in SIZES:
+        print(f"n={n}")
+        for dt in (None, end_dt):
+            suffix = "" if dt is None else " +end_dt"
+            t_old = run("blocks" + suffix, lambda: file_txt._read_in_reverse_blocks(file_path, 1024, n, dt), repeat)
+            t_new = run("mmap" + suffix, lambda: file_txt._scan_in_reverse(file_path, n, dt), repeat)
+            print(f"{'speedup':>16}: {t_old / t_new:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
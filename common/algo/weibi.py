@@ -1,4 +1,4 @@
-from common.model.kline import KLine
+from common.model.kline import KLineSeries
 from common.model.obj import Direction
 from typing import List
 from datetime import datetime
@@ -7,21 +7,21 @@ import math
 
 class WeiBI:
     """微笔"""
-    def __init__(self, symbol: str, direction: Direction, bars: List[KLine]):
+    def __init__(self, symbol: str, direction: Direction, bars: KLineSeries):
         self.symbol = symbol
         self.direction: Direction = direction
-        self.bars: List[KLine] = bars
+        self.bars: KLineSeries = bars   # 原序列的切片视图
         self._sdt = None
         self._edt = None
 
     @property
     def sdt(self):
-        self._sdt = datetime.fromtimestamp(self.bars[0].time)
+        self._sdt = self.bars.datetimes[0]
         return self._sdt
 
     @property
     def edt(self):
-        self._edt = datetime.fromtimestamp(self.bars[-1].time)
+        self._edt = self.bars.datetimes[-1]
         return self._edt
 
     def __str__(self):
@@ -38,20 +38,20 @@ class WeiBI:
     @property
     def high(self):
         if self.direction == Direction.Up:
-            return self.bars[-1].high
+            return float(self.bars.high[-1])
         else:
-            return self.bars[0].high
+            return float(self.bars.high[0])
 
     @property
     def low(self):
         if self.direction == Direction.Up:
-            return self.bars[0].low
+            return float(self.bars.low[0])
         else:
-            return self.bars[-1].low
+            return float(self.bars.low[-1])
 
     @property
     def low_close(self):
-        return min([x.close for x in self.bars])
+        return float(self.bars.close.min())
 
     @property
     def angle(self):  # 角度
@@ -61,8 +61,8 @@ class WeiBI:
             return math.atan2(self.low_close - self.high, max(len(self.bars) - 1, 1)) / math.pi * 180
 
 
-def get_weibi_list(ks: List[KLine], N=5) -> List[WeiBI]:
-    hs, ls = [x.high for x in ks], [x.low for x in ks]
+def get_weibi_list(ks: KLineSeries, N=5) -> List[WeiBI]:
+    hs, ls = ks.high.tolist(), ks.low.tolist()
     sel = 0
     M = len(ks)
     tbs = []
@@ -88,16 +88,12 @@ def get_weibi_list(ks: List[KLine], N=5) -> List[WeiBI]:
 
     bi_list: List[WeiBI] = []
     for i in range(len(tbs) - 1):
-        line: List[KLine] = []
-        for j in range(tbs[i][0], tbs[i + 1][0] + 1):
-            line.append(ks[j])
+        line = ks[tbs[i][0]:tbs[i + 1][0] + 1]
         bi_list.append(
-            WeiBI(symbol=ks[0].symbol, direction=Direction.Up if tbs[i][1] == -1 else Direction.Down, bars=line))
-    line = []
-    for j in ks[tbs[-1][0]:]:
-        line.append(j)
-    if line:
+            WeiBI(symbol=ks.symbol, direction=Direction.Up if tbs[i][1] == -1 else Direction.Down, bars=line))
+    line = ks[tbs[-1][0]:]
+    if len(line):
         bi_list.append(
-            WeiBI(symbol=ks[0].symbol, direction=Direction.Up if tbs[-1][1] == -1 else Direction.Down, bars=line))
+            WeiBI(symbol=ks.symbol, direction=Direction.Up if tbs[-1][1] == -1 else Direction.Down, bars=line))
 
     return bi_list
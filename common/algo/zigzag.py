@@ -2,7 +2,7 @@
 z字型算法实现,通过gpt转换，还需用数据测试和验证，修正
 """
 import numpy as np
-from common.model.kline import KLine
+from common.model.kline import KLineSeries
 # input parameters
 InpDepth = 12
 InpDeviation = 5
@@ -19,17 +19,17 @@ ExtRecalc = 3
 
 
 # ZigZag calculation
-def OnCalculate(k_arr: list[KLine]):
+def OnCalculate(k_arr: KLineSeries):
     """
     未完成状态，源自mt4的逻辑，暂先忽略
     """
     global ZigZagBuffer, HighMapBuffer, LowMapBuffer
     # rates_total, prev_calculated, time, open, high, low, close, tick_volume, volume, spread
-    time = [k.time for k in k_arr]
-    open = [k.open for k in k_arr]
-    close = [k.close for k in k_arr]
-    high = [k.high for k in k_arr]
-    low = [k.low for k in k_arr]
+    time = k_arr.time.tolist()
+    open = k_arr.open.tolist()
+    close = k_arr.close.tolist()
+    high = k_arr.high.tolist()
+    low = k_arr.low.tolist()
     rates_total = prev_calculated = len(k_arr)
     if rates_total < 100:
         return 0
@@ -5,7 +5,7 @@ Created on
 @file: call_back.py
 @desc: 由配置文件回调过程
 """
-from common.model.kline import KLine, KExtreme, KSide, stFxK, stCombineK, Segment, Pivot
+from common.model.kline import KLine, KLineSeries, KExtreme, KSide, stCombineK, Segment, Pivot
 from common.algo.formula import MA
 from common.algo.channel import find_all_channels, find_all_channels2
 from datetime import datetime
@@ -13,28 +13,25 @@ from common.algo.weibi import get_weibi_list
 from typing import List, Any
 from common.util import convert_kline_to_dataframe
 from common.model.obj import Direction
-from common.chanlun.c_bi import Cal_LOWER
-from common.chanlun.c_bi import (Cal_UPPER, cal_independent_klines, calculate_bi, _NCHDUAN, compute_bi_pivots,
-                                 compute_duan_pivots)
+from common.chanlun.context import ChanlunContext
 from typing import Dict
 import logging
 import json
 import talib
 
 
-def fn_calc_ma20_60(klines: list[KLine]):
+def fn_calc_ma20_60(klines: KLineSeries):
     """由配置文件回调ma20,ma60的计算过程"""
     bars = {}
     MA20, MA60 = MA(20), MA(60)
-    for k in klines:
-        dt = datetime.fromtimestamp(k.time)
-        MA20.input(k.close)
-        MA60.input(k.close)
+    for dt, close in zip(klines.datetimes, klines.close.tolist()):
+        MA20.input(close)
+        MA60.input(close)
         bars[dt] = [dt, MA20.ma, MA60.ma]
     return bars
 
 
-def fn_calc_wei_bi(klines: list[KLine]) -> List[Any]:
+def fn_calc_wei_bi(klines: KLineSeries) -> List[Any]:
     """回调计算过程"""
     wbs = get_weibi_list(klines, N=5)
     # logging.info(wbs)
@@ -46,22 +43,20 @@ def fn_calc_wei_bi(klines: list[KLine]) -> List[Any]:
     return items
 
 
-def fn_calc_signal(klines: list[KLine]) -> List[Any]:
+def fn_calc_signal(klines: KLineSeries) -> List[Any]:
     """生成一个整数5倍的signal"""
     bars = {}
-    for i in range(len(klines)):
-        if i % 10 == 0:
-            dt = datetime.fromtimestamp(klines[i].time)
-            bars[dt] = [dt, -(i % 3)]
+    for i in range(0, len(klines), 10):
+        dt = klines.datetimes[i]
+        bars[dt] = [dt, -(i % 3)]
     return bars
 
 
-def fn_calc_volumes(klines: list[KLine]):
+def fn_calc_volumes(klines: KLineSeries):
     """回調計算成交量"""
     bars = {}
-    for k in klines:
-        dt = datetime.fromtimestamp(k.time)
-        bars[dt] = [dt, k.volume]
+    for dt, volume in zip(klines.datetimes, klines.volume.tolist()):
+        bars[dt] = [dt, volume]
     return bars
 
 
@@ -80,50 +75,30 @@ def write_extremes_to_file(fx_list, filename):
         json.dump(data_to_write, f, indent=4)
 
 
-def fn_calc_up_lower_upper(klines: List[KLine]):
-    lower: List[stFxK] = Cal_LOWER(klines)
-    upper: List[stFxK] = Cal_UPPER(klines)
+def fn_calc_up_lower_upper(klines: KLineSeries):
+    fractals = ChanlunContext.of(klines).fractals
     fenxin = {}
     logging.info(f"fn_calc_up_lower_upper begin.")
-    for i in range(len(lower)):
-        dt = datetime.fromtimestamp(klines[i].time)
-        if lower[i].side == KExtreme.BOTTOM:
-            fenxin[dt] = [dt, -1]
-            # logging.info(f"底的时间：[{dt.strftime('%Y-%m-%d %H:%M:%S')}]")
-    for i in range(len(upper)):
-        dt = datetime.fromtimestamp(klines[i].time)
-        if upper[i].side == KExtreme.TOP:
-            fenxin[dt] = [dt, 1]
-            # logging.info(f"顶的时间：[{dt.strftime('%Y-%m-%d %H:%M:%S')}]")
+    index = fractals.index.tolist()
+    side = fractals.side.tolist()
+    for value in (KExtreme.BOTTOM.value, KExtreme.TOP.value):    # 先底后顶, 与原来的插入顺序一致
+        for i, fx_side in zip(index, side):
+            if fx_side == value:
+                dt = klines.datetimes[i]
+                fenxin[dt] = [dt, fx_side]
     lower_count = sum(1 for value in fenxin.values() if value[-1] == 1)
     upper_count = sum(1 for value in fenxin.values() if value[-1] == -1)
-    logging.info(f"fn_calc_up_lower_upper end.K线数量：{len(lower)}, 顶: {lower_count}, 底: {upper_count}")
+    logging.info(f"fn_calc_up_lower_upper end.K线数量：{len(klines)}, 顶: {lower_count}, 底: {upper_count}")
     return fenxin
 
 
-def init_independents(combs: List[stCombineK]):
-    """初始化K线索引和独立K线索引的映射关系"""
-    independents: Dict[int, int] = {}
-    for i in range(len(combs)):
-        for j in range(combs[i].pos_begin, combs[i].pos_end+1):
-            independents[j] = i  # 表达出索引pos_begin至pos_end实际上是第i根独立K线
-    return independents
-
-
-def fn_calc_bi(klines: list[KLine]) -> List[Any]:
+def fn_calc_bi(klines: KLineSeries) -> List[Any]:
     """回调计算过程笔"""
-    lower: List[stFxK] = Cal_LOWER(klines)
-    upper: List[stFxK] = Cal_UPPER(klines)
-    combs = cal_independent_klines(klines)
-    merges = init_merges(combs, klines)
-    independents = init_independents(combs)
-
-    bi_list = calculate_bi(lower, upper, merges, independents)
-
+    bi_list = ChanlunContext.of(klines).bi_list
     items = []
     for w in bi_list:
-        s_dt = datetime.fromtimestamp(klines[w.pos_begin].time)
-        e_dt = datetime.fromtimestamp(klines[w.pos_end].time)
+        s_dt = klines.datetimes[w.pos_begin]
+        e_dt = klines.datetimes[w.pos_end]
         if w.side == KSide.UP:
             items.append([s_dt, w.lowest, e_dt, w.highest, 0, "red"])
         else:
@@ -131,41 +106,40 @@ def fn_calc_bi(klines: list[KLine]) -> List[Any]:
     return items
 
 
-def fn_calc_seg(klines: list[KLine]) -> List[Segment]:
-    """回调计算段"""
-    lower: List[stFxK] = Cal_LOWER(klines)
-    upper: List[stFxK] = Cal_UPPER(klines)
-    combs = cal_independent_klines(klines)
-    merges = init_merges(combs, klines)
-    independents = init_independents(combs)
-
-    bi_list = calculate_bi(lower, upper, merges, independents)
-    seg_list: List[Segment] = _NCHDUAN(bi_list, klines)
+def _segment_items(klines: KLineSeries, seg_list: List[Segment], color: str) -> List[Any]:
     items = []
     for w in seg_list:
-        s_dt = datetime.fromtimestamp(klines[w.pos_begin].time)
-        e_dt = datetime.fromtimestamp(klines[w.pos_end].time)
+        s_dt = klines.datetimes[w.pos_begin]
+        e_dt = klines.datetimes[w.pos_end]
         if w.up:
-            items.append([s_dt, w.lowest, e_dt, w.highest, 0, "yellow"])
+            items.append([s_dt, w.lowest, e_dt, w.highest, 0, color])
         else:
-            items.append([s_dt, w.highest, e_dt, w.lowest, 0, "yellow"])
+            items.append([s_dt, w.highest, e_dt, w.lowest, 0, color])
     return items
 
 
-def fn_calc_bi_pivot(klines: list[KLine]) -> List[Pivot]:
+def fn_calc_seg(klines: KLineSeries) -> List[Segment]:
+    """回调计算段"""
+    return _segment_items(klines, ChanlunContext.of(klines).segments, "yellow")
+
+
+def fn_calc_seg2(klines: KLineSeries) -> List[Any]:
+    """回调计算高一级别的段(以段为笔), 配置了才计算"""
+    return _segment_items(klines, ChanlunContext.of(klines).level_segments(1), "blue")
+
+
+def fn_calc_seg3(klines: KLineSeries) -> List[Any]:
+    """回调计算再高一级别的段"""
+    return _segment_items(klines, ChanlunContext.of(klines).level_segments(2), "magenta")
+
+
+def fn_calc_bi_pivot(klines: KLineSeries) -> List[Pivot]:
     """回调计算笔中枢"""
-    lower: List[stFxK] = Cal_LOWER(klines)
-    upper: List[stFxK] = Cal_UPPER(klines)
-    combs = cal_independent_klines(klines)
-    merges = init_merges(combs, klines)
-    independents = init_independents(combs)
-
-    bi_list = calculate_bi(lower, upper, merges, independents)
-    pivots: List[Pivot] = compute_bi_pivots(bi_list)
+    pivots: List[Pivot] = ChanlunContext.of(klines).bi_pivots
     items = []
     for w in pivots:
-        s_dt = datetime.fromtimestamp(klines[w.bg_pos_index].time)
-        e_dt = datetime.fromtimestamp(klines[w.ed_pos_index].time)
+        s_dt = klines.datetimes[w.bg_pos_index]
+        e_dt = klines.datetimes[w.ed_pos_index]
         if w.up:
             color = "red"
         else:
@@ -177,26 +151,12 @@ def fn_calc_bi_pivot(klines: list[KLine]) -> List[Pivot]:
     return items
 
 
-def fn_calc_duan_pivot(klines: list[KLine]) -> List[Pivot]:
-    """回调计算中枢"""
-    lower: List[stFxK] = Cal_LOWER(klines)
-    upper: List[stFxK] = Cal_UPPER(klines)
-    combs = cal_independent_klines(klines)
-    merges = init_merges(combs, klines)
-    independents = init_independents(combs)
-
-    bi_list = calculate_bi(lower, upper, merges, independents)
-    seg_list = _NCHDUAN(bi_list, klines)
-    pivots: List[Pivot] = compute_duan_pivots(seg_list)
+def _pivot_items(klines: KLineSeries, pivots: List[Pivot], color: str) -> List[Any]:
+    """中枢画成矩形的四条边"""
     items = []
     for w in pivots:
-        s_dt = datetime.fromtimestamp(klines[w.bg_pos_index].time)
-        e_dt = datetime.fromtimestamp(klines[w.ed_pos_index].time)
-        # if w.up:
-        #     color = "red"
-        # else:
-        #     color = "green"
-        color = "yellow"
+        s_dt = klines.datetimes[w.bg_pos_index]
+        e_dt = klines.datetimes[w.ed_pos_index]
         items.append([s_dt, w.lowly_value, e_dt, w.lowly_value, 0, color])
         items.append([s_dt, w.highly_value, e_dt, w.highly_value, 0, color])
         items.append([s_dt, w.lowly_value, s_dt, w.highly_value, 0, color])
@@ -204,31 +164,38 @@ def fn_calc_duan_pivot(klines: list[KLine]) -> List[Pivot]:
     return items
 
 
-def init_merges(combs, klines) -> List[KLine]:
-    merges = [k for k in klines]
-    for item in combs:
-        for i in range(item.pos_begin, item.pos_end + 1):
-            merges[i].low, merges[i].high = item.range_low, item.range_high
-    return merges
+def fn_calc_duan_pivot(klines: KLineSeries) -> List[Pivot]:
+    """回调计算中枢"""
+    return _pivot_items(klines, ChanlunContext.of(klines).duan_pivots, "yellow")
+
+
+def fn_calc_duan_pivot2(klines: KLineSeries) -> List[Any]:
+    """回调计算高一级别的段构成的中枢"""
+    return _pivot_items(klines, ChanlunContext.of(klines).level_pivots(2), "blue")
+
+
+def fn_calc_duan_pivot3(klines: KLineSeries) -> List[Any]:
+    """回调计算再高一级别的段构成的中枢"""
+    return _pivot_items(klines, ChanlunContext.of(klines).level_pivots(3), "magenta")
 
 
-def fn_calc_independent_klines(klines: list[KLine]):
+def fn_calc_independent_klines(klines: KLineSeries):
     """计算独立K线数量"""
-    combs = cal_independent_klines(klines)
+    combs = ChanlunContext.of(klines).combs
     independents = {}
     p = klines
     for i in range(len(combs)):
-        dt = datetime.fromtimestamp(p[combs[i].pos_begin].time)
+        dt = klines.datetimes[combs[i].pos_begin]
         independents[dt] = [dt, combs[i].range_low, combs[i].range_high, combs[i].pos_begin, combs[i].pos_end,
                             combs[i].pos_extreme, combs[i].isUp.value]
     return independents
 
 
-# def fn_calc_bi(klines: list[KLine]) -> List[Any]:
+# def fn_calc_bi(klines: KLineSeries) -> List[Any]:
 #     pass
 #     # Cal_OLD_TEST(klines)
 
-def fn_calc_channel(klines: List[KLine]):
+def fn_calc_channel(klines: KLineSeries):
     """计算通道"""
     fenxin = {}
     logging.info(f"fn_calc_channel begin...")
@@ -250,12 +217,12 @@ def fn_calc_channel(klines: List[KLine]):
         if item['type'] == 'Ascending':
             side = 1
         for i in range(item['start_idx'], item['end_idx']+1):
-            dt = datetime.fromtimestamp(klines[i].time)
+            dt = klines.datetimes[i]
             fenxin[dt] = [dt, side]
     return fenxin
 
 
-def fn_calc_atr(klines: list[KLine]):
+def fn_calc_atr(klines: KLineSeries):
     """计算atr"""
     bars = {}
     datas = convert_kline_to_dataframe(klines)
@@ -266,25 +233,23 @@ def fn_calc_atr(klines: list[KLine]):
         atr = atr.fillna(first_valid_value)  # 填充所有NaN
     else:
         atr = atr  # 如果没有有效值，保持原样
-    for i, k in enumerate(klines):
-        dt = datetime.fromtimestamp(k.time)
+    for i, dt in enumerate(klines.datetimes):
         bars[dt] = [dt, atr[i]]
     return bars
 
 
-def fn_calc_feek(klines: List[KLine]):
-    lower: List[stFxK] = Cal_LOWER(klines)
-    upper: List[stFxK] = Cal_UPPER(klines)
+def fn_calc_feek(klines: KLineSeries):
+    fractals = ChanlunContext.of(klines).fractals
     datas = convert_kline_to_dataframe(klines)
     fenxin = {}
     # logging.info(f"fn_calc_up_lower_upper begin.")
     # for i in range(len(lower)):
-    #     dt = datetime.fromtimestamp(klines[i].time)
+    #     dt = klines.datetimes[i]
     #     if lower[i].side == KExtreme.BOTTOM:
     #         fenxin[dt] = [dt, -1]
     #         # logging.info(f"底的时间：[{dt.strftime('%Y-%m-%d %H:%M:%S')}]")
     # for i in range(len(upper)):
-    #     dt = datetime.fromtimestamp(klines[i].time)
+    #     dt = klines.datetimes[i]
     #     if upper[i].side == KExtreme.TOP:
     #         fenxin[dt] = [dt, 1]
     #         # logging.info(f"顶的时间：[{dt.strftime('%Y-%m-%d %H:%M:%S')}]")
@@ -7,22 +7,24 @@
 2 合并K线：2根有包含关系的K线，如果方向向下，则取其中高点中的低点作为新K线高点，取其中低点中的低点作为新K线低点，由此合并出一根新K线。
 如果方向向上，则取其中高点中的高点作为新K线高点，取其中低点中的高点作为新K线低点，由此合并出一根新K线。
 """
-from common.model.kline import KLine, stCombineK, KSide, stFxK, stBiK, KExtreme, Segment, Pivot
+import numpy as np
+from common.model.kline import KLineSeries, stCombineK, KSide, stFxK, stBiK, KExtreme, Segment, Pivot, Fractals, MergedKLines, \
+    FeatureSequence
 from typing import List, Optional, Union
 from common.chanlun.float_compare import *
-import copy
 import logging
 from datetime import datetime
 from typing import Tuple, Dict
 
 
-def _Cal_MERGE(pData: List[KLine]) -> int:
+def _Cal_MERGE(pData: KLineSeries) -> int:
     """
     合并K线逻辑,接受一个stCombineK类型的列表combs, 返回一个整数值表示独立K线的个数
     :param klines:
     :return:
     """
-    combs = [stCombineK(pData[i].low, pData[i].high, i, i, i, KSide.DOWN) for i in range(len(pData))]
+    combs = [stCombineK(low, high, i, i, i, KSide.DOWN)
+             for i, (low, high) in enumerate(zip(pData.low.tolist(), pData.high.tolist()))]
 
     size = len(combs)
     if len(combs) < 2:    # <=2时，返回本身的长度
@@ -40,7 +42,7 @@ def _Cal_MERGE(pData: List[KLine]) -> int:
         nonlocal pLast
         pPrev = pCur
         pLast += 1  # 每处理一根独立K线，pLast增加1
-        combs[pLast] = copy.deepcopy(combs[pCur])    # 值的拷贝，而不是指针, 总是拷贝第一个
+        combs[pLast] = combs[pCur].copy()    # 值的拷贝，而不是指针, 总是拷贝第一个
         combs[pLast].isUp = b_up
         return
 
@@ -105,68 +107,59 @@ def _Cal_MERGE(pData: List[KLine]) -> int:
     return combs[:pLast - pBegin + 1]
 
 
-def Cal_LOWER(pData: List[KLine]) -> List[stFxK]:
+def cal_fractals(combs: List[stCombineK]) -> Fractals:
     """
-    计算底分型
+    一次遍历独立K线, 同时找出顶分型和底分型, 只返回真正的分型(按K线下标升序)
+    顶分型: 中间独立K线的高点、低点都高于左右两根; 底分型: 都低于左右两根
     """
-    combs = cal_independent_klines(pData)
+    n = len(combs)
+    if n <= 2:  # 小于等于2的，没有分型
+        return Fractals([], [], [], [], [], combs)
+    low = np.array([c.range_low for c in combs], dtype=np.float64)
+    high = np.array([c.range_high for c in combs], dtype=np.float64)
+    h, l = high[1:-1], low[1:-1]
+    top = (greater_than_0(h - high[:-2]) & greater_than_0(h - high[2:]) &
+           greater_than_0(l - low[:-2]) & greater_than_0(l - low[2:]))
+    bottom = (less_than_0(h - high[:-2]) & less_than_0(h - high[2:]) &
+              less_than_0(l - low[:-2]) & less_than_0(l - low[2:]))
+    pos = np.flatnonzero(top | bottom) + 1     # 分型中间独立K线在combs中的位置
+    index = [combs[p].pos_extreme for p in pos.tolist()]
+    side = np.where(top[pos - 1], KExtreme.TOP.value, KExtreme.BOTTOM.value)
+    return Fractals(index, side, low[pos], high[pos], pos, combs)
+
+
+def fractal_side(combs: List[stCombineK], c: int) -> int:
+    """第c根独立K线的分型方向(KExtreme 的值), 规则与 cal_fractals 相同, 用于逐根计算"""
+    cur, prev, nxt = combs[c], combs[c - 1], combs[c + 1]
+    if (greater_than_0(cur.range_high - prev.range_high) and greater_than_0(cur.range_high - nxt.range_high) and
+            greater_than_0(cur.range_low - prev.range_low) and greater_than_0(cur.range_low - nxt.range_low)):
+        return KExtreme.TOP.value
+    if (less_than_0(cur.range_high - prev.range_high) and less_than_0(cur.range_high - nxt.range_high) and
+            less_than_0(cur.range_low - prev.range_low) and less_than_0(cur.range_low - nxt.range_low)):
+        return KExtreme.BOTTOM.value
+    return KExtreme.NORMAL.value
+
+
+def _dense_fractals(pData: KLineSeries, side: KExtreme) -> List[stFxK]:
+    """按K线逐根展开的分型列表, 不是 side 的位置为 NORMAL"""
+    fractals = cal_fractals(cal_independent_klines(pData))
     ret = [stFxK(index=i, side=KExtreme.NORMAL, low=0.0, high=0.0) for i in range(len(pData))]
-
-    nCount = len(combs)
-    if nCount <= 2:  # 小于等于2的，直接退出
-        return ret
-    pPrev = 0
-    pCur = pPrev + 1
-    pNext = pCur + 1
-    pEnd = pPrev + nCount - 1
-
-    while pNext <= pEnd:
-        if (less_than_0(combs[pCur].range_high - combs[pPrev].range_high) and
-                less_than_0(combs[pCur].range_high - combs[pNext].range_high) and
-                less_than_0(combs[pCur].range_low - combs[pPrev].range_low) and
-                less_than_0(combs[pCur].range_low - combs[pNext].range_low)):
-            # ret[combs[pCur].pos_extreme] = [True, combs[pCur].data.low, combs[pCur].data.high]
-            ret[combs[pCur].pos_extreme] = stFxK(index=combs[pCur].pos_extreme, side=KExtreme.BOTTOM,
-                                                 low=combs[pCur].range_low, high=combs[pCur].range_high)
-            ret[combs[pCur].pos_extreme].left = combs[pPrev]
-            ret[combs[pCur].pos_extreme].right = combs[pNext]
-            ret[combs[pCur].pos_extreme].extremal = combs[pCur]
-            # ret[combs[pCur].pos_extreme].highest = max(combs[pPrev].range_high, combs[pNext].range_high)
-        pPrev += 1
-        pCur += 1
-        pNext += 1
+    for k in np.flatnonzero(fractals.side == side.value).tolist():
+        fx = fractals.get(k)
+        ret[fx.index] = fx
     return ret
 
 
-def Cal_UPPER(pData: List[KLine]) -> List[stFxK]:
-    """计算顶分型"""
-    combs = cal_independent_klines(pData)   # combs是实际的独立K线的集合
-    ret = [stFxK(index=i, side=KExtreme.NORMAL, low=0.0, high=0.0) for i in range(len(pData))]
-    nCount = len(combs)
+def Cal_LOWER(pData: KLineSeries) -> List[stFxK]:
+    """
+    计算底分型, 每根K线一个 stFxK, 笔的计算已改用 cal_fractals 的稀疏结果
+    """
+    return _dense_fractals(pData, KExtreme.BOTTOM)
 
-    if nCount <= 2:
-        return ret
 
-    pPrev = 0
-    pCur = pPrev + 1
-    pNext = pCur + 1
-    pEnd = pPrev + nCount - 1
-    while pNext <= pEnd:
-        if (greater_than_0(combs[pCur].range_high - combs[pPrev].range_high) and
-                greater_than_0(combs[pCur].range_high - combs[pNext].range_high) and
-                greater_than_0(combs[pCur].range_low - combs[pPrev].range_low) and
-                greater_than_0(combs[pCur].range_low - combs[pNext].range_low)):
-            ret[combs[pCur].pos_extreme] = stFxK(index=combs[pCur].pos_extreme, side=KExtreme.TOP,
-                                                 low=combs[pCur].range_low, high=combs[pCur].range_high)
-            ret[combs[pCur].pos_extreme].left = combs[pPrev]
-            ret[combs[pCur].pos_extreme].right = combs[pNext]
-            ret[combs[pCur].pos_extreme].extremal = combs[pCur]
-            # ret[combs[pCur].pos_extreme].lowest = min(combs[pPrev].range_low, combs[pNext].range_low)
-
-        pPrev += 1
-        pCur += 1
-        pNext += 1
-    return ret
+def Cal_UPPER(pData: KLineSeries) -> List[stFxK]:
+    """计算顶分型, 每根K线一个 stFxK, 笔的计算已改用 cal_fractals 的稀疏结果"""
+    return _dense_fractals(pData, KExtreme.TOP)
 
 
 def Cal_Fx(lower: List[stFxK], upper: List[stFxK]):
@@ -178,14 +171,14 @@ def Cal_Fx(lower: List[stFxK], upper: List[stFxK]):
     return temp
 
 
-def count_independent_kline(independents: Dict[int, int], b: int, e: int) -> int:
+def count_independent_kline(independents: np.ndarray, b: int, e: int) -> int:
     """计算独立K线数"""
     return independents[e] - independents[b] + 1
 
 
-def is_valid_fx(independents: Dict[int, int], b: int, e: int):
+def is_valid_fx(independents: np.ndarray, b: int, e: int, min_bars: int = 5):
     bmgt = count_independent_kline(independents, b, e)
-    return bmgt >= 5
+    return bmgt >= min_bars
 
 
 def get_independents(combs: List[stCombineK]):
@@ -214,129 +207,182 @@ def generate_bi(fractals: List[stFxK]) -> List[stBiK]:
     return bi_list
 
 
-def deal_same_top_bottom(next: int, temp: List[stFxK], base: int, up: bool, merge: List[KLine], c1: int) -> (int, int):
-    """处理相同顶底的情况"""
-    while next > 0 and temp[next].side == temp[base].side:
-        next = next_(next + 1, temp)
-        if next < 0:
-            break
-        if up:
-            if merge[next].low < merge[c1].low:
-                c1 = next
-        else:
-            if merge[next].high > merge[c1].high:
-                c1 = next
-    return next, c1
+class BiParams:
+    """
+    笔的规则参数
+    min_bars: 顶底之间(含顶底)至少的K线数
+    rule: Trait.OLDEN 老笔, 按包含处理后的独立K线计数; Trait.NEWLY 新笔, 按原始K线计数
+    epsilon: 比较分型高低点时的容差, 含义同 float_compare.EPSINON, 0为精确比较
+    默认值即原来写死的规则: 老笔、5根独立K线、精确比较
+    """
+    __slots__ = ("min_bars", "rule", "epsilon")
+
+    def __init__(self, min_bars: int = 5, rule: Trait = Trait.OLDEN, epsilon: float = 0.0):
+        self.min_bars = min_bars
+        self.rule = rule
+        self.epsilon = epsilon
+
+    def __str__(self):
+        return f"BiParams(min_bars={self.min_bars}, rule={self.rule.name}, epsilon={self.epsilon})"
 
+    def __repr__(self):
+        return self.__str__()
 
-def deal_not_last(next: int, c1: int, base: int, ind: Dict[int, int]) -> (int, int):
-    if next > 0 and c1 > 0:
-        if is_valid_fx(ind, next, base) and not is_valid_fx(ind, c1, base):
-            pass
-    elif is_valid_fx(ind, next, base) and is_valid_fx(ind, c1, base):
-        next = c1
+
+DEFAULT_BI_PARAMS = BiParams()
+
+
+class BiScan:
+    """
+    按分型序号(而不是K线下标)计算笔时用到的查找表, 都是 list, 逐个取值比 numpy 快
+    side: 分型方向; low、high: 分型K线合并后的低点、高点;
+    ind: 计数用的序号, 老笔为分型K线所在独立K线的序号(独立K线数的前缀计数), 新笔为K线下标;
+    next_opposite: 之后第一个方向相反的分型序号, 没有为-1; min_bars、eps: 见 BiParams
+    """
+    __slots__ = ("side", "low", "high", "ind", "next_opposite", "size", "min_bars", "eps")
+
+    def __init__(self, side: List[int], low: List[float], high: List[float], ind: List[int], next_opposite: List[int],
+                 min_bars: int = 5, eps: float = 0.0):
+        self.side = side
+        self.low = low
+        self.high = high
+        self.ind = ind
+        self.next_opposite = next_opposite
+        self.size = len(side)
+        self.min_bars = min_bars
+        self.eps = eps
+
+    @classmethod
+    def of(cls, fractals: Fractals, merge: MergedKLines, ind: np.ndarray,
+           params: BiParams = DEFAULT_BI_PARAMS) -> "BiScan":
+        index = fractals.index
+        counter = index if params.rule == Trait.NEWLY else np.asarray(ind)[index]
+        return cls(fractals.side.tolist(), merge.low[index].tolist(), merge.high[index].tolist(),
+                   counter.tolist(), fractals.next_opposite.tolist(), params.min_bars, params.epsilon)
+
+    def with_params(self, params: BiParams, index: List[int]) -> "BiScan":
+        """共用分型的查找表, 换一组参数; index 为分型的K线下标, 新笔计数时用"""
+        return BiScan(self.side, self.low, self.high, index if params.rule == Trait.NEWLY else self.ind,
+                      self.next_opposite, params.min_bars, params.epsilon)
+
+    def next(self, k: int) -> int:
+        """第k个分型之后的分型序号, 没有返回-1"""
+        return k + 1 if k + 1 < self.size else -1
+
+    def opposite(self, k: int) -> int:
+        """第k个分型之后第一个方向相反的分型序号, 没有返回-1"""
+        return self.next_opposite[k]
+
+    def count(self, b: int, e: int) -> int:
+        """分型b到分型e之间的独立K线数(含两端)"""
+        return self.ind[e] - self.ind[b] + 1
+
+
+def deal_same_top_bottom(next: int, scan: BiScan, base: int) -> int:
+    """处理相同顶底的情况: 跳过与base同向的分型"""
+    while next >= 0 and scan.side[next] == scan.side[base]:
+        next = scan.next(next)
     return next
 
 
-def satisfy_the_number(next: int, temp: List[stFxK], up: bool, merge: List[KLine], ind: Dict[int, int]) -> (int, int):
+def satisfy_the_number(next: int, scan: BiScan, up: bool) -> (int, int):
+    """返回 (是否已到末尾, 分型序号)"""
     bs = next
     bs_next = next
+    eps = scan.eps
     while True:
-        bs_next = next_(bs_next+1, temp)
+        bs_next = scan.next(bs_next)
         if bs_next < 0:
-            return -next, next    # 寻到末尾了，返回前一个，且以负数返回，表示已经到最后了
-        if temp[bs_next].side == temp[next].side:   # 同方向的，即同底分型或是同顶分型
+            return True, next    # 寻到末尾了，返回前一个，表示已经到最后了
+        if scan.side[bs_next] == scan.side[next]:   # 同方向的，即同底分型或是同顶分型
             if up:
-                if merge[bs_next].low < merge[next].low:
+                if scan.low[bs_next] < scan.low[next] - eps:
                     next = bs_next
                     bs = next
                     bs_next = next
                     continue
             else:   # up 在同一级别
-                if merge[bs_next].high > merge[next].high:
+                if scan.high[bs_next] > scan.high[next] + eps:
                     next = bs_next
                     bs = next
                     bs_next = next
             continue
-        bmgt = count_independent_kline(ind, bs, bs_next)
-        if bmgt < 5:
+        bmgt = scan.count(bs, bs_next)
+        if bmgt < scan.min_bars:
             continue
         else:
             if up:
-                if merge[bs_next].high < merge[next].high or (not merge[bs_next].low > merge[next].high):
+                if scan.high[bs_next] < scan.high[next] - eps or (not scan.low[bs_next] > scan.high[next] + eps):
                     continue
             else:
-                if merge[bs_next].low > merge[next].low or (not merge[bs_next].high < merge[next].low):
+                if scan.low[bs_next] > scan.low[next] + eps or (not scan.high[bs_next] < scan.low[next] - eps):
                     continue
             break
-    return 0, next
+    return False, next
 
 
-def get_node(base: int, temp: List[stFxK], merge: List[KLine], ind: Dict[int, int]):
-    norm = 5
-    up = temp[base].side == KExtreme.TOP
-    next = go_util_difference_fx(base, temp)
+def get_node(base: int, scan: BiScan) -> (int, bool):
+    """从分型base找笔的另一端, 返回 (分型序号, 是否已到末尾), 没有找到时分型序号为-1"""
+    norm = scan.min_bars
+    up = scan.side[base] == KExtreme.TOP.value
+    next = go_util_difference_fx(base, scan)
 
-    while next > 0:
-        mgt = count_independent_kline(ind, base, next)  # 计算独立K线的数量
+    while next >= 0:
+        mgt = scan.count(base, next)  # 计算独立K线的数量
         if mgt < norm:
-            next = next_(next+1, temp)
-            c1 = next
-            next, c1 = deal_same_top_bottom(next, temp, base, up, merge, c1)
-            next = deal_not_last(next, c1, base, ind)
+            next = deal_same_top_bottom(scan.next(next), scan, base)
             if next < 0:
                 break
         else:   # 满足笔的K线数量的要求
-            rel, next = satisfy_the_number(next, temp, up, merge, ind)
-            if rel == 0:
+            is_end, next = satisfy_the_number(next, scan, up)
+            if not is_end:
                 break
             else:
-                return rel
-    return next
+                return next, True
+    return next, False
 
 
-def go_util_difference_fx(base, temp):
+def go_util_difference_fx(base: int, scan: BiScan) -> int:
     """往下走，相同的分型就一直走，一直走到遇到不同的分开为止"""
-    next = next_(base + 1, temp)
-    while next > 0 and temp[next].side == temp[base].side:  # 相同的顶或底，再往下走
-        if next > 0:
-            next = next_(base + 1, temp)
-        else:
+    return scan.opposite(base)
+
+
+def next_(base: int, temp: Fractals):
+    """K线下标 >= base 的第一个分型, 没有返回-1"""
+    return temp.next_index(base)
+
+
+def find_bi_nodes(scan: BiScan) -> List[int]:
+    """笔的端点, 为分型序号"""
+    nodes: List[int] = []
+    i = 0 if scan.size else -1
+    while i >= 0:
+        right, is_end = get_node(i, scan)
+        if right < 0:
             break
-    return next
+        if is_end:
+            nodes.append(right)
+            break
+        if not nodes:
+            nodes.append(i)
+        nodes.append(right)
+        i = right
+    return nodes
 
 
-def next_(base: int, temp: List[stFxK]):
-    for i in range(base, len(temp)):
-        if temp[i].side != KExtreme.NORMAL:
-            return i
-    return -1
-
-
-def calculate_bi(lower: List[stFxK], upper: List[stFxK], merge: List[KLine], ind: Dict[int, int]) -> List[stBiK]:
-    """计算笔"""
-    temp = Cal_Fx(lower, upper)
-    old_: List[stFxK] = []
-    i = 0
-    while i < len(temp):
-        if temp[i].side != KExtreme.NORMAL:
-            right = get_node(i, temp, merge, ind)
-            if right < 0:
-                if right < -1:
-                    old_.append(temp[-right])
-                break
-            if not old_:
-                old_.append(temp[i])
-            old_.append(temp[right])
-            i = right - 1
-        i += 1
-    # for item in old_:
-    #     logging.info(f"[{item.index}]:{item.side}")
+def calculate_bi(fractals: Fractals, merge: MergedKLines, ind: np.ndarray,
+                 params: BiParams = DEFAULT_BI_PARAMS) -> List[stBiK]:
+    """
+    计算笔, fractals 为 cal_fractals 的结果, params 为笔的规则参数
+    在分型序号上查找, 下一个分型、下一个反向分型、独立K线数都是查表, 整体耗时与分型数成线性
+    """
+    scan = BiScan.of(fractals, merge, ind, params)
+    old_: List[stFxK] = [fractals.get(k) for k in find_bi_nodes(scan)]
     bis = generate_bi(old_)
     return bis
 
 
-def cal_independent_klines(pData: List[KLine]) -> List[stCombineK]:
+def cal_independent_klines(pData: KLineSeries) -> List[stCombineK]:
     """
     计算出独立K线,返回独立K线对象列表
     """
@@ -344,24 +390,40 @@ def cal_independent_klines(pData: List[KLine]) -> List[stCombineK]:
     return combs
 
 
-def find_first_segment(cur_pos: int, vtDisivion: List[stBiK], pData: List[KLine],
+def init_independents(combs: List[stCombineK]) -> np.ndarray:
+    """
+    初始化K线索引和独立K线索引的映射关系: 下标为K线索引, 值为所在独立K线的序号,
+    即到该K线为止独立K线数的前缀计数减一, 两根K线之间的独立K线数为两者之差加一
+    """
+    counts = [item.pos_end - item.pos_begin + 1 for item in combs]  # 独立K线首尾相接, 覆盖全部K线
+    return np.repeat(np.arange(len(combs), dtype=np.int64), counts)
+
+
+def init_merges(combs: List[stCombineK], klines: KLineSeries, independents: Optional[np.ndarray] = None) -> MergedKLines:
+    """合并后的K线: 每根K线的高低点取其所在独立K线的区间, 以视图给出, 不修改也不复制原序列"""
+    if independents is None:
+        independents = init_independents(combs)
+    return MergedKLines(klines, [item.range_low for item in combs], [item.range_high for item in combs], independents)
+
+
+def find_first_segment(cur_pos: int, vtDisivion: List[stBiK], pData: KLineSeries,
                        max_pos: int, min_pos: int, seg: Segment) -> bool:
     """
     线段一定被后一线段破坏、 且破坏前一线段
     由于第一根线段没有可破坏的线段，所以第一根线段 实际上是 从 第二根线段开始算
     """
     idx = vtDisivion[cur_pos].pos_begin
-    if vtDisivion[cur_pos].side == KSide.UP:   # 向上
+    if vtDisivion[cur_pos].side == KSide.DOWN:   # 向上
         max_idx = vtDisivion[max_pos].pos_begin
-        if greater_than_0(pData[idx].high - pData[max_idx].high):
+        if greater_than_0(pData.high[idx] - pData.high[max_idx]):
             max_pos = cur_pos
         if cur_pos - min_pos < 3:
             return False
         pre_idx = vtDisivion[cur_pos-2].pos_begin
-        if greater_than_0(pData[idx].high - pData[pre_idx].high):
+        if greater_than_0(pData.high[idx] - pData.high[pre_idx]):
             idx = vtDisivion[cur_pos-1].pos_begin
             pre_idx = vtDisivion[cur_pos-3].pos_begin
-            if greater_than_0(pData[idx].high - pData[pre_idx].high):
+            if greater_than_0(pData.high[idx] - pData.high[pre_idx]):
                 # 暂时成段
                 seg.start_index = min_pos
                 seg.end_index = cur_pos
@@ -370,15 +432,15 @@ def find_first_segment(cur_pos: int, vtDisivion: List[stBiK], pData: List[KLine]
     else:
         # 第一段找最低的点作为向上段的起始点
         min_idx = vtDisivion[min_pos].pos_begin
-        if less_than_0(pData[idx].low - pData[min_idx].low):
+        if less_than_0(pData.low[idx] - pData.low[min_idx]):
             min_pos = cur_pos
         if cur_pos - max_pos < 3:
             return False
         pre_idx = vtDisivion[cur_pos-2].pos_begin
-        if less_than_0(pData[idx].low - pData[pre_idx].low):
+        if less_than_0(pData.low[idx] - pData.low[pre_idx]):
             idx = vtDisivion[cur_pos-1].pos_begin
             pre_idx = vtDisivion[cur_pos-3].pos_begin
-            if less_than_0(pData[idx].high - pData[pre_idx].high):
+            if less_than_0(pData.high[idx] - pData.high[pre_idx]):
                 seg.start_index = max_pos
                 seg.end_index = cur_pos
                 seg.up = False
@@ -387,52 +449,112 @@ def find_first_segment(cur_pos: int, vtDisivion: List[stBiK], pData: List[KLine]
     return False
 
 
-def is_overlap(cur_pos: int, vtDisivion: List[stBiK], pData: List[KLine]) -> bool:
+def is_overlap(cur_pos: int, vtDisivion: List[stBiK], pData: KLineSeries) -> bool:
     if cur_pos < 3:
         return False
     # 判断连续三笔是否重叠
     idx = vtDisivion[cur_pos].pos_begin
     pre_idx = vtDisivion[cur_pos-3].pos_begin
-    if vtDisivion[cur_pos].side == KSide.UP:    # 向下笔
-        if less_than_0(pData[idx].high - pData[pre_idx].low):
+    if vtDisivion[cur_pos].side == KSide.DOWN:    # 向下笔
+        if less_than_0(pData.high[idx] - pData.low[pre_idx]):
             return False
     else:                                       # 向上笔
-        if greater_than_0(pData[idx].low - pData[pre_idx].high):
+        if greater_than_0(pData.low[idx] - pData.high[pre_idx]):
             return False
     return True
 
 
-def make_sure_low_segment(segment: Segment, cur_pos: int, vtDisivion: List[stBiK], pData: List[KLine]) -> int:
+def _features(segment: Segment) -> FeatureSequence:
+    if segment.features is None:
+        segment.features = FeatureSequence()
+    return segment.features
+
+
+def _low_segment_features(segment: Segment, vtDisivion: List[stBiK], pData: KLineSeries) -> Tuple[float, float]:
+    """
+    向下线段的特征序列(向上笔)做包含处理, 返回最后一个元素的高低点
+    接着上次处理到的笔继续, 线段终点后移时只处理新增的笔
+    """
+    fs = _features(segment)
+    start = segment.start_index
+    if fs.fold_key != (start, False) or fs.fold_next > segment.end_index + 1:
+        fs.fold_key = (start, False)
+        fs.fold_next = start + 3
+        fs.fold_high = pData.high[vtDisivion[start + 2].pos_begin]
+        fs.fold_low = pData.low[vtDisivion[start + 1].pos_begin]
+    fMaxPrice, fMinPrice = fs.fold_high, fs.fold_low
+    k = fs.fold_next
+    while k < segment.end_index:
+        if less_than_0(fMinPrice - pData.low[vtDisivion[k].pos_begin]):
+            if less_than_0(fMaxPrice - pData.high[vtDisivion[k+1].pos_begin]):
+                fMinPrice = pData.low[vtDisivion[k].pos_begin]
+            fMaxPrice = pData.high[vtDisivion[k+1].pos_begin]
+        else:
+            fMinPrice = pData.low[vtDisivion[k].pos_begin]
+            fMaxPrice = pData.high[vtDisivion[k+1].pos_begin]
+        k += 2
+    fs.fold_next, fs.fold_high, fs.fold_low = k, fMaxPrice, fMinPrice
+    return fMaxPrice, fMinPrice
+
+
+def _up_segment_features(segment: Segment, vtDisivion: List[stBiK], pData: KLineSeries) -> Tuple[float, float]:
+    """向上线段的特征序列(向下笔)做包含处理, 返回最后一个元素的高低点"""
+    fs = _features(segment)
+    start = segment.start_index
+    if fs.fold_key != (start, True) or fs.fold_next > segment.end_index + 1:
+        fs.fold_key = (start, True)
+        fs.fold_next = start + 3
+        fs.fold_high = pData.high[vtDisivion[start + 1].pos_begin]
+        fs.fold_low = pData.low[vtDisivion[start + 2].pos_begin]
+    fMaxPrice, fMinPrice = fs.fold_high, fs.fold_low
+    k = fs.fold_next
+    while k < segment.end_index:
+        if greater_than_0(fMaxPrice - pData.high[vtDisivion[k].pos_begin]):
+            if greater_than_0(fMinPrice - pData.low[vtDisivion[k+1].pos_begin]):
+                fMaxPrice = pData.high[vtDisivion[k].pos_begin]
+            fMinPrice = pData.low[vtDisivion[k+1].pos_begin]
+        else:
+            fMaxPrice = pData.high[vtDisivion[k].pos_begin]
+            fMinPrice = pData.low[vtDisivion[k+1].pos_begin]
+        k += 2
+    fs.fold_next, fs.fold_high, fs.fold_low = k, fMaxPrice, fMinPrice
+    return fMaxPrice, fMinPrice
+
+
+def _scan_start(segment: Segment) -> FeatureSequence:
+    """终点之后的扫描从上次停下的位置继续, 线段起止变了从终点后第3笔重新开始"""
+    fs = _features(segment)
+    key = (segment.start_index, segment.end_index, segment.up)
+    if fs.scan_key != key:
+        fs.scan_key = key
+        fs.scan_next = segment.end_index + 3
+        fs.scan_end = segment.end_index + 1
+    return fs
+
+
+def make_sure_low_segment(segment: Segment, cur_pos: int, vtDisivion: List[stBiK], pData: KLineSeries) -> int:
     status = -1
     while True:
         cur_idx = vtDisivion[cur_pos].pos_begin
         low_idx = vtDisivion[segment.end_index].pos_begin
-        if vtDisivion[cur_pos].side == KSide.DOWN:
+        if vtDisivion[cur_pos].side == KSide.UP:
             # 更低
-            if less_than_0(pData[cur_idx].low - pData[low_idx].low):
+            if less_than_0(pData.low[cur_idx] - pData.low[low_idx]):
                 segment.end_index = cur_pos
             break
         if cur_pos - segment.end_index < 3:
             break
-        i = segment.end_index + 3
-        end_pos = segment.end_index + 1
-        for i in range(segment.end_index + 3, cur_pos + 1, 2):
-            if not greater_than_0(pData[vtDisivion[i].pos_begin].high - pData[vtDisivion[end_pos].pos_begin].high):
-                end_pos = i
+        fs = _scan_start(segment)
+        for i in range(fs.scan_next, cur_pos + 1, 2):
+            if not greater_than_0(pData.high[vtDisivion[i].pos_begin] - pData.high[vtDisivion[fs.scan_end].pos_begin]):
+                fs.scan_end = i
+                fs.scan_next = i + 2
                 continue
+            fs.scan_next = i    # 停在这里, 同样的输入再算一次结果相同
             # 判断是否需要合并K线
-            fMaxPrice = pData[vtDisivion[segment.start_index + 2].pos_begin].high
-            fMinPrice = pData[vtDisivion[segment.start_index + 1].pos_begin].low
-            for k in range(segment.start_index + 3, segment.end_index, 2):
-                if less_than_0(fMinPrice - pData[vtDisivion[k].pos_begin].low):
-                    if less_than_0(fMaxPrice - pData[vtDisivion[k+1].pos_begin].high):
-                        fMinPrice = pData[vtDisivion[k].pos_begin].low
-                    fMaxPrice = pData[vtDisivion[k+1].pos_begin].high
-                else:
-                    fMinPrice = pData[vtDisivion[k].pos_begin].low
-                    fMaxPrice = pData[vtDisivion[k+1].pos_begin].high
-
-            if less_than_0(pData[vtDisivion[end_pos].pos_begin].high - fMinPrice):
+            fMaxPrice, fMinPrice = _low_segment_features(segment, vtDisivion, pData)
+
+            if less_than_0(pData.high[vtDisivion[fs.scan_end].pos_begin] - fMinPrice):
                 # 存在缺口
                 status = 1
             else:
@@ -442,36 +564,29 @@ def make_sure_low_segment(segment: Segment, cur_pos: int, vtDisivion: List[stBiK
     return status
 
 
-def make_sure_up_segment(segment: Segment, cur_pos: int, vtDisivion: List[stBiK], pData: List[KLine]) -> int:
+def make_sure_up_segment(segment: Segment, cur_pos: int, vtDisivion: List[stBiK], pData: KLineSeries) -> int:
     status = -1
     while True:
         cur_idx = vtDisivion[cur_pos].pos_begin
         end_idx = vtDisivion[segment.end_index].pos_begin
-        if vtDisivion[cur_pos].side == KSide.UP:
-            if greater_than_0(pData[cur_idx].high - pData[end_idx].high):
+        if vtDisivion[cur_pos].side == KSide.DOWN:
+            if greater_than_0(pData.high[cur_idx] - pData.high[end_idx]):
                 segment.end_index = cur_pos
             break
 
         if cur_pos - segment.end_index < 3:
             break
 
-        end_pos = segment.end_index + 1
-        for i in range(segment.end_index + 3, cur_pos + 1, 2):
-            if not less_than_0(pData[vtDisivion[i].pos_begin].low - pData[vtDisivion[end_pos].pos_begin].low):
-                end_pos = i
+        fs = _scan_start(segment)
+        for i in range(fs.scan_next, cur_pos + 1, 2):
+            if not less_than_0(pData.low[vtDisivion[i].pos_begin] - pData.low[vtDisivion[fs.scan_end].pos_begin]):
+                fs.scan_end = i
+                fs.scan_next = i + 2
                 continue
-            fMaxPrice = pData[vtDisivion[segment.start_index + 1].pos_begin].high
-            fMinPrice = pData[vtDisivion[segment.start_index + 2].pos_begin].low
-            for k in range(segment.start_index+3, segment.end_index, 2):
-                if greater_than_0(fMaxPrice - pData[vtDisivion[k].pos_begin].high):
-                    if greater_than_0(fMinPrice - pData[vtDisivion[k+1].pos_begin].low):
-                        fMaxPrice = pData[vtDisivion[k].pos_begin].high
-                    fMinPrice = pData[vtDisivion[k+1].pos_begin].low
-                else:
-                    fMaxPrice = pData[vtDisivion[k].pos_begin].high
-                    fMinPrice = pData[vtDisivion[k+1].pos_begin].low
-
-            if greater_than_0(pData[vtDisivion[end_pos].pos_begin].low - fMaxPrice):
+            fs.scan_next = i
+            fMaxPrice, fMinPrice = _up_segment_features(segment, vtDisivion, pData)
+
+            if greater_than_0(pData.low[vtDisivion[fs.scan_end].pos_begin] - fMaxPrice):
                 status = 1
             else:
                 status = 0
@@ -480,13 +595,13 @@ def make_sure_up_segment(segment: Segment, cur_pos: int, vtDisivion: List[stBiK]
     return status
 
 
-def make_sure_segment(segment: Segment, cur_pos: int, vtDisivion: List[stBiK], pData: List[KLine]):
+def make_sure_segment(segment: Segment, cur_pos: int, vtDisivion: List[stBiK], pData: KLineSeries):
     if segment.up:
         return make_sure_up_segment(segment, cur_pos, vtDisivion, pData)
     return make_sure_low_segment(segment, cur_pos, vtDisivion, pData)
 
 
-def update_segment(cur_pos: int, seg: Segment, tmp_seg: Segment, vtDisivion: List[stBiK], ret: List[Segment], pData: List[KLine]):
+def update_segment(cur_pos: int, seg: Segment, tmp_seg: Segment, vtDisivion: List[stBiK], ret: List[Segment], pData: KLineSeries):
     if tmp_seg.start_index == tmp_seg.end_index:
         status = make_sure_segment(seg, cur_pos, vtDisivion, pData)
         if status == -1:
@@ -494,7 +609,7 @@ def update_segment(cur_pos: int, seg: Segment, tmp_seg: Segment, vtDisivion: Lis
         if status == 0:
             # 不存在缺口
             seg.is_sure = True
-            ret.append(copy.deepcopy(seg))
+            ret.append(seg.copy())
 
             seg.start_index = seg.end_index
             seg.end_index = cur_pos
@@ -509,28 +624,28 @@ def update_segment(cur_pos: int, seg: Segment, tmp_seg: Segment, vtDisivion: Lis
     else:
         status = make_sure_segment(tmp_seg, cur_pos, vtDisivion, pData)
         if status == -1:
-            if vtDisivion[cur_pos].side == KSide.UP and not tmp_seg.up:
+            if vtDisivion[cur_pos].side == KSide.DOWN and not tmp_seg.up:
                 if not tmp_seg.up:  # 这儿是否有逻辑漏洞？？？
-                    if greater_than_0(pData[vtDisivion[cur_pos].pos_begin].high -
-                                      pData[vtDisivion[tmp_seg.start_index].pos_begin].high):
+                    if greater_than_0(pData.high[vtDisivion[cur_pos].pos_begin] -
+                                      pData.high[vtDisivion[tmp_seg.start_index].pos_begin]):
                         seg.end_index = cur_pos
                         tmp_seg.start_index = tmp_seg.end_index = 0
             else:
                 if tmp_seg.up:
-                    if less_than_0(pData[vtDisivion[cur_pos].pos_begin].low -
-                                   pData[vtDisivion[tmp_seg.start_index].pos_begin].low):
+                    if less_than_0(pData.low[vtDisivion[cur_pos].pos_begin] -
+                                   pData.low[vtDisivion[tmp_seg.start_index].pos_begin]):
                         seg.end_index = cur_pos
                         tmp_seg.start_index = tmp_seg.end_index = 0
             return
 
         seg.is_sure = True
-        ret.append(copy.deepcopy(seg))
+        ret.append(seg.copy())
 
         seg.is_sure = False
         if status == 0:
             # 不存在缺口
             tmp_seg.is_sure = True
-            ret.append(copy.deepcopy(tmp_seg))
+            ret.append(tmp_seg.copy())
 
             seg.start_index = tmp_seg.end_index
             seg.end_index = cur_pos
@@ -549,53 +664,91 @@ def update_segment(cur_pos: int, seg: Segment, tmp_seg: Segment, vtDisivion: Lis
             tmp_seg.up = not seg.up
 
 
-def _NCHDUAN(vtDisivion: List[stBiK], pData: List[KLine]) -> List[Segment]:
-    # vtDisivion = copy.deepcopy(tDisivion)
-    """计算线段"""
-    for item in vtDisivion:
-        item.side = KSide.UP if item.side == KSide.DOWN else KSide.DOWN
-    ret: List[Segment] = []
-    min_pos = -1
-    max_pos = -1
-    seg, tmp_seg = Segment(), Segment()
-    status = 0
-    nSize = len(vtDisivion)
-    for i in range(3, nSize):
-        if status == 0:
+class DuanBuilder:
+    """
+    线段计算的状态, 按笔的序号逐根推进. 第i步只用到序号 <= i 的笔,
+    所以前面的笔不再变化时, 推进到那里的状态可以保存下来, 之后只需从这里继续
+    """
+    __slots__ = ("status", "min_pos", "max_pos", "seg", "tmp_seg", "ret", "pos")
+
+    def __init__(self):
+        self.status = 0
+        self.min_pos = -1
+        self.max_pos = -1
+        self.seg = Segment()
+        self.tmp_seg = Segment()
+        self.ret: List[Segment] = []    # 已经完成的线段(还没有填高低点和K线位置)
+        self.pos = 3                    # 下一步要处理的笔序号
+
+    def fork(self) -> "DuanBuilder":
+        """拷贝当前状态用于试算, 试算中完成的线段放在新的 ret 里, 不影响本对象"""
+        other = DuanBuilder.__new__(DuanBuilder)
+        other.status, other.min_pos, other.max_pos, other.pos = self.status, self.min_pos, self.max_pos, self.pos
+        other.seg = self.seg.copy()
+        other.tmp_seg = self.tmp_seg.copy()
+        other.ret = []
+        return other
+
+    def feed(self, vtDisivion: List[stBiK], pData: KLineSeries, end: int):
+        """处理序号从 pos 到 end-1 的笔"""
+        for i in range(self.pos, end):
+            self._step(i, vtDisivion, pData)
+        self.pos = max(self.pos, end)
+
+    def _step(self, i: int, vtDisivion: List[stBiK], pData: KLineSeries):
+        if self.status == 0:
             if not is_overlap(i, vtDisivion, pData):
-                min_pos = max_pos = -1
-                continue
-            if min_pos == -1:
-                min_pos = max_pos = i - 3
+                self.min_pos = self.max_pos = -1
+                return
+            if self.min_pos == -1:
+                self.min_pos = self.max_pos = i - 3
                 for k in range(i-2, i):
-                    if greater_than_0(pData[vtDisivion[k].pos_begin].high - pData[vtDisivion[max_pos].pos_begin].high):
-                        max_pos = k
-                    if less_than_0(pData[vtDisivion[k].pos_begin].low - pData[vtDisivion[min_pos].pos_begin].low):
-                        min_pos = k
-            if not find_first_segment(i, vtDisivion, pData, max_pos, min_pos, seg):
-                continue
+                    if greater_than_0(pData.high[vtDisivion[k].pos_begin] -
+                                      pData.high[vtDisivion[self.max_pos].pos_begin]):
+                        self.max_pos = k
+                    if less_than_0(pData.low[vtDisivion[k].pos_begin] - pData.low[vtDisivion[self.min_pos].pos_begin]):
+                        self.min_pos = k
+            if not find_first_segment(i, vtDisivion, pData, self.max_pos, self.min_pos, self.seg):
+                return
+
+            self.status = 1
+            self.min_pos = self.max_pos = 1
+            return
+        update_segment(i, self.seg, self.tmp_seg, vtDisivion, self.ret, pData)
+
+    def pending(self) -> List[Segment]:
+        """还没有完成的线段(拷贝)"""
+        ret = []
+        if self.seg.start_index != self.seg.end_index:
+            ret.append(self.seg.copy())
+        if self.tmp_seg.start_index != self.tmp_seg.end_index:
+            ret.append(self.tmp_seg.copy())
+        return ret
 
-            status = 1
-            min_pos = max_pos = 1
-            continue
-        update_segment(i, seg, tmp_seg, vtDisivion, ret, pData)
 
-    if seg.start_index != seg.end_index:
-        ret.append(copy.deepcopy(seg))
-    if tmp_seg.start_index != tmp_seg.end_index:
-        ret.append(copy.deepcopy(tmp_seg))
+def fill_segment(iter: Segment, vtDisivion: List[stBiK]):
+    """由起止笔填线段的高低点和K线位置"""
+    if iter.up:
+        iter.lowest = vtDisivion[iter.start_index].lowest
+        iter.highest = vtDisivion[iter.end_index].highest
+    else:
+        iter.lowest = vtDisivion[iter.end_index].lowest
+        iter.highest = vtDisivion[iter.start_index].highest
 
-    for iter in ret:
-        if iter.up:
-            iter.lowest = vtDisivion[iter.start_index].lowest
-            iter.highest = vtDisivion[iter.end_index].highest
-        else:
-            iter.lowest = vtDisivion[iter.end_index].lowest
-            iter.highest = vtDisivion[iter.start_index].highest
+    iter.pos_begin = vtDisivion[iter.start_index].pos_begin
+    iter.pos_end = vtDisivion[iter.end_index].pos_begin
 
-        iter.pos_begin = vtDisivion[iter.start_index].pos_begin
-        iter.pos_end = vtDisivion[iter.end_index].pos_begin
 
+def _NCHDUAN(vtDisivion: List[stBiK], pData: KLineSeries) -> List[Segment]:
+    """
+    计算线段
+    笔的方向直接按原值判断, 不再先取反, 不修改传入的笔, 同一组笔可以反复计算
+    """
+    builder = DuanBuilder()
+    builder.feed(vtDisivion, pData, len(vtDisivion))
+    ret = builder.ret + builder.pending()
+    for iter in ret:
+        fill_segment(iter, vtDisivion)
 
     if len(ret) > 0:
         ret.pop(0)
@@ -603,6 +756,30 @@ def _NCHDUAN(vtDisivion: List[stBiK], pData: List[KLine]) -> List[Segment]:
     return ret
 
 
+def segments_to_bis(segments: List[Segment], vtDisivion: List[stBiK]) -> List[stBiK]:
+    """
+    本级别的线段作为高一级别的笔, vtDisivion 为构成这些线段的笔
+    线段的起点也是某一笔的起点, 所以合并K线在该处的高低点同样适用, 高一级别可以用同一份 pData 计算线段
+    """
+    bis = []
+    for seg in segments:
+        bi = stBiK()
+        bi.pos_begin = seg.pos_begin
+        bi.pos_end = seg.pos_end
+        bi.lowest = seg.lowest
+        bi.highest = seg.highest
+        if seg.up:
+            bi.side = KSide.UP
+            bi.bottom = vtDisivion[seg.start_index].bottom
+            bi.top = vtDisivion[seg.end_index].top
+        else:
+            bi.side = KSide.DOWN
+            bi.top = vtDisivion[seg.start_index].top
+            bi.bottom = vtDisivion[seg.end_index].bottom
+        bis.append(bi)
+    return bis
+
+
 def get_anchors(seg: Segment, bi_list: List[stBiK]) -> List[int]:
     """获取线段内的笔索引列表"""
     anchors = []
@@ -847,6 +1024,16 @@ def process_down_up(base: int, bis: Union[List[stBiK], List[Segment]]) -> Tuple[
 
 
 
+def next_pivot_base(base: int, new_base: int) -> int:
+    """
+    process_down_up 之后下一次尝试的位置
+    new_base 也是这一次看到的最后一笔的序号, 它之前的笔都不变时, 这一次的结果就不会再变
+    """
+    if base == new_base - 2:
+        return new_base - 1
+    return new_base - 2
+
+
 def compute_bi_pivots(bi_list: List[stBiK]) -> List[Pivot]:
     """
     计算笔中枢：
@@ -862,10 +1049,7 @@ def compute_bi_pivots(bi_list: List[stBiK]) -> List[Pivot]:
         pivot, new_base = process_down_up(base, bi_list)
         if pivot:
             pivots.append(pivot)
-        if base == new_base - 2:
-            base = new_base - 1
-        else:
-            base = new_base - 2
+        base = next_pivot_base(base, new_base)
 
     return pivots
 
@@ -885,10 +1069,7 @@ def compute_duan_pivots(seg_list: List[Segment]) -> List[Pivot]:
         pivot, new_base = process_down_up(base, seg_list)
         if pivot:
             pivots.append(pivot)
-        if base == new_base - 2:
-            base = new_base - 1
-        else:
-            base = new_base - 2
+        base = next_pivot_base(base, new_base)
 
     return pivots
 
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+@file: context.py
+@author: luhx
+@desc: 同一K线序列上共享的缠论计算结果
+合并K线 -> 分型 -> 笔 -> 段 -> 中枢, 每一步在第一次用到时计算并保存, 之后直接返回。
+笔、段、中枢等回调从同一个 ChanlunContext 取数, 一份K线只合并一次。
+K线序列换了(BarManager.update_history_klines 会生成新序列)或长度变了, 即视为新版本, 重新计算。
+timings 记录各步骤自身的耗时(秒), 不含前置步骤。
+多级别: 第 n 级的线段作为第 n+1 级的笔, 再算线段和中枢, 第0级即笔。高级别只在用到时才计算,
+各级别共用同一份合并K线, 低级别的结果也只算一次。
+enable_store 之后, 笔、段、中枢改由 snapshot.load_chanlun 计算: 同一份数据再次打开或追加了K线时,
+恢复上次保存的已确认状态, 只计算之后的K线。
+"""
+import logging
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from common.chanlun.c_bi import (cal_independent_klines, cal_fractals, init_merges, init_independents, calculate_bi,
+                                 _NCHDUAN, compute_bi_pivots, compute_duan_pivots, segments_to_bis)
+from common.chanlun.incremental import IncrementalChanlun
+from common.chanlun.snapshot import load_chanlun
+from common.config import CHANLUN_STORE_PATH
+from common.model.kline import KLineSeries, MergedKLines, stCombineK, stBiK, Fractals, Segment, Pivot
+
+STAGES = ("combs", "fractals", "independents", "merges", "bi_list", "bi_pivots", "segments", "duan_pivots")
+
+
+class ChanlunContext:
+    """一个K线序列版本上的缠论计算结果, 按需计算"""
+
+    _last: Optional["ChanlunContext"] = None     # 最近一次使用的上下文, 回调之间共享
+    store_path: Optional[str] = None    # 缠论结果的持久化目录, None 时不持久化
+
+    def __init__(self, klines: KLineSeries):
+        self.klines = klines
+        self.size = len(klines)
+        self.timings: Dict[str, float] = {}
+        self._results = {}
+
+    @classmethod
+    def of(cls, klines: KLineSeries) -> "ChanlunContext":
+        """取K线序列对应的上下文, 同一序列同一长度时复用已有结果"""
+        ctx = cls._last
+        if ctx is None or ctx.klines is not klines or ctx.size != len(klines):
+            ctx = cls(klines)
+            cls._last = ctx
+        return ctx
+
+    @classmethod
+    def clear(cls):
+        cls._last = None
+
+    @classmethod
+    def enable_store(cls, path: str = CHANLUN_STORE_PATH):
+        """笔、段、中枢的结果按数据指纹持久化到 path, path 为 None 时关闭"""
+        cls.store_path = path
+        cls._last = None
+
+    def _get(self, stage: str, func):
+        if stage not in self._results:
+            nested = self.total_time()
+            start = time.perf_counter()
+            self._results[stage] = func()
+            # 只计本步骤的耗时, 不含其中第一次用到的前置步骤
+            self.timings[stage] = time.perf_counter() - start - (self.total_time() - nested)
+            logging.debug(f"chanlun {stage}: {self.timings[stage] * 1000:.1f} ms, {self.size} bars")
+        return self._results[stage]
+
+    @property
+    def combs(self) -> List[stCombineK]:
+        """独立K线"""
+        return self._get("combs", lambda: cal_independent_klines(self.klines))
+
+    @property
+    def fractals(self) -> Fractals:
+        """顶底分型"""
+        return self._get("fractals", lambda: cal_fractals(self.combs))
+
+    @property
+    def merges(self) -> MergedKLines:
+        """按独立K线区间合并后的K线视图, 不改动原序列"""
+        return self._get("merges", lambda: init_merges(self.combs, self.klines, self.independents))
+
+    @property
+    def independents(self) -> np.ndarray:
+        """K线下标 -> 独立K线序号"""
+        return self._get("independents", lambda: init_independents(self.combs))
+
+    @property
+    def engine(self) -> IncrementalChanlun:
+        """由快照恢复并补算到最新K线的增量计算, 只在 enable_store 之后使用"""
+        return self._get("engine", lambda: load_chanlun(self.klines, self.store_path))
+
+    @property
+    def bi_list(self) -> List[stBiK]:
+        """笔"""
+        if self.store_path:
+            return self.engine.bi_list
+        return self._get("bi_list", lambda: calculate_bi(self.fractals, self.merges, self.independents))
+
+    @property
+    def bi_pivots(self) -> List[Pivot]:
+        """笔中枢"""
+        if self.store_path:
+            return self.engine.bi_pivots
+        return self._get("bi_pivots", lambda: compute_bi_pivots(self.bi_list))
+
+    @property
+    def segments(self) -> List[Segment]:
+        """线段"""
+        if self.store_path:
+            return self.engine.segments
+        return self._get("segments", lambda: _NCHDUAN(self.bi_list, self.merges))
+
+    @property
+    def duan_pivots(self) -> List[Pivot]:
+        """段中枢"""
+        if self.store_path:
+            return self.engine.duan_pivots
+        return self._get("duan_pivots", lambda: compute_duan_pivots(self.segments))
+
+    def level_strokes(self, level: int) -> List[stBiK]:
+        """第 level 级的笔: 第0级为笔, 更高级别为低一级的线段"""
+        if level == 0:
+            return self.bi_list
+        return self._get(f"strokes_{level}",
+                         lambda: segments_to_bis(self.level_segments(level - 1), self.level_strokes(level - 1)))
+
+    def level_segments(self, level: int) -> List[Segment]:
+        """第 level 级的线段, 第0级即 segments"""
+        if level == 0:
+            return self.segments
+        return self._get(f"segments_{level}", lambda: _NCHDUAN(self.level_strokes(level), self.merges))
+
+    def level_pivots(self, level: int) -> List[Pivot]:
+        """第 level 级的笔构成的中枢: 第0级为笔中枢, 第1级为段中枢"""
+        if level == 0:
+            return self.bi_pivots
+        if level == 1:
+            return self.duan_pivots
+        return self._get(f"pivots_{level}", lambda: compute_duan_pivots(self.level_segments(level - 1)))
+
+    def total_time(self) -> float:
+        return sum(self.timings.values())
+
+    def __str__(self):
+        stages = list(STAGES) + [stage for stage in self.timings if stage not in STAGES]
+        spend = ", ".join(f"{stage}: {self.timings[stage] * 1000:.1f}ms" for stage in stages if stage in self.timings)
+        return f"ChanlunContext(size={self.size}, {spend})"
+
+    def __repr__(self):
+        return self.__str__()
@@ -0,0 +1,434 @@
+# -*- coding: utf-8 -*-
+"""
+@file: incremental.py
+@author: luhx
+@desc: 实时K线上逐根更新的分型和笔
+新K线到来时不再从头计算, 只从最后一个已确认的笔端点开始重算, 每根K线的耗时与历史长度无关。
+  分型: 只有最后一根独立K线会被新K线合并, 盘中的K线还可能被撤销, 所以独立K线序号 <= len(combs)-4 的分型
+        不会再变, 记为已确认; 之后的分型每次重新判断
+  笔: calculate_bi 从一个端点 get_node 找下一个端点, 找的过程只看到已确认的分型(没有走到末尾)时, 这一步就不会再变,
+      端点记为已确认; 其余的笔是未确认的尾部, 每次更新后与上次比较, 给出增加、修改、删除的事件
+  线段: DuanBuilder 第i步只用到序号 <= i 的笔, 保存推进到已确认笔为止的状态, 每次从这里试算未确认的笔
+  中枢: process_down_up 看到的最后一笔已确认时, 这一步的结果就不会再变, 同样只从第一个未确认的步骤开始重算
+线段、中枢都不修改传入的笔或线段, 同样的输入反复更新结果不变。
+结果与对同样的K线批量计算(cal_independent_klines -> cal_fractals -> calculate_bi -> _NCHDUAN、中枢)一致。
+IncrementalChanlun.checkpoint 把已确认的部分存为若干 numpy 数组, restore 恢复后再输入K线, 只重算未确认的尾部。
+"""
+from enum import Enum
+from typing import Dict, List
+
+import numpy as np
+
+from common.chanlun.c_bi import (BiScan, fractal_side, generate_bi, get_node, DuanBuilder, fill_segment,
+                                 process_down_up, next_pivot_base)
+from common.chanlun.merger import KLineMerger
+from common.model.kline import KLineSeries, KExtreme, KSide, stFxK, stBiK, Segment, Pivot, stCombineK
+
+_STABLE = 3     # 最后这么多根独立K线还可能变化, 以其为右侧的分型未确认
+
+
+class BiEventType(Enum):
+    """笔的变化"""
+    ADD = 1         # 新增
+    MODIFY = 2      # 修改
+    REMOVE = 3      # 删除
+
+
+class BiEvent:
+    """笔的变化事件, index 为笔在 bi_list 中的序号, REMOVE 时 bi 为删除前的笔"""
+    __slots__ = ("type", "index", "bi")
+
+    def __init__(self, type: BiEventType, index: int, bi: stBiK):
+        self.type = type
+        self.index = index
+        self.bi = bi
+
+    def __str__(self):
+        return f"{self.type.name}[{self.index}]:{self.bi}"
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class _TailScan(BiScan):
+    """记录 get_node 向后看到的最远分型序号, 用来判断这一步是否只用到了已确认的分型"""
+    __slots__ = ("reach",)
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.reach = 0
+
+    def _see(self, k: int) -> int:
+        reach = self.size if k < 0 else k
+        if reach > self.reach:
+            self.reach = reach
+        return k
+
+    def next(self, k: int) -> int:
+        return self._see(super().next(k))
+
+    def opposite(self, k: int) -> int:
+        return self._see(super().opposite(k))
+
+
+def _next_opposite(side: List[int]) -> List[int]:
+    ret = [-1] * len(side)
+    nxt = -1
+    for k in range(len(side) - 2, -1, -1):
+        if side[k + 1] != side[k]:
+            nxt = k + 1
+        ret[k] = nxt
+    return ret
+
+
+def _same_bi(a: stBiK, b: stBiK) -> bool:
+    """起止、方向、高低点相同, 且顶底分型的区间也相同(线段按起点分型的区间计算)"""
+    return (a.pos_begin == b.pos_begin and a.pos_end == b.pos_end and a.side == b.side and
+            a.lowest == b.lowest and a.highest == b.highest and
+            a.top.lowest == b.top.lowest and a.bottom.highest == b.bottom.highest)
+
+
+class IncrementalBi:
+    """逐根输入K线, 维护独立K线、分型和笔"""
+
+    def __init__(self):
+        self.merger = KLineMerger()
+        self._fx_comb: List[int] = []   # 已确认分型的独立K线序号, 分型序号即下标
+        self._fx_side: List[int] = []
+        self._checked = 1               # 下一根待确认是否为分型的独立K线
+        self._anchors: List[int] = []   # 已确认的笔端点(分型序号)
+        self._confirmed = 0             # bi_list 中已确认的笔数
+        self.bi_list: List[stBiK] = []
+
+    @property
+    def combs(self):
+        return self.merger.combs
+
+    @property
+    def confirmed_count(self) -> int:
+        """已确认的笔数, 之后的笔还可能变化"""
+        return self._confirmed
+
+    def append(self, bar) -> List[BiEvent]:
+        """追加一根已完成的K线"""
+        self.merger.append(bar)
+        return self._update()
+
+    def update_last(self, bar) -> List[BiEvent]:
+        """最后一根K线还在走, 用新的值重算"""
+        self.merger.update_last(bar)
+        return self._update()
+
+    def extend(self, klines: KLineSeries) -> List[BiEvent]:
+        """追加一段K线(例如加载历史数据)"""
+        self.merger.extend(klines)
+        return self._update()
+
+    def _fx(self, combs, c: int, side: int) -> stFxK:
+        cur = combs[c]
+        fx = stFxK(index=cur.pos_extreme, side=KExtreme(side), low=cur.range_low, high=cur.range_high)
+        fx.left = combs[c - 1]
+        fx.right = combs[c + 1]
+        fx.extremal = cur
+        return fx
+
+    def _update(self) -> List[BiEvent]:
+        combs = self.merger.combs
+        # 1 确认分型
+        while self._checked <= len(combs) - 1 - _STABLE:
+            side = fractal_side(combs, self._checked)
+            if side != KExtreme.NORMAL.value:
+                self._fx_comb.append(self._checked)
+                self._fx_side.append(side)
+            self._checked += 1
+        # 2 从最后一个已确认的端点开始找笔的端点, 只用到已确认分型的步骤即确认
+        start = self._anchors[-1] if self._anchors else 0
+        local_comb = self._fx_comb[start:]
+        local_side = self._fx_side[start:]
+        for c in range(self._checked, len(combs) - 1):     # 未确认的分型
+            side = fractal_side(combs, c)
+            if side != KExtreme.NORMAL.value:
+                local_comb.append(c)
+                local_side.append(side)
+        stable = len(self._fx_comb) - start     # 局部序号小于它的分型已确认
+        scan = _TailScan(local_side, [combs[c].range_low for c in local_comb],
+                         [combs[c].range_high for c in local_comb], local_comb, _next_opposite(local_side))
+        new_anchors: List[int] = []     # 本次确认的端点
+        tail: List[int] = []            # 未确认的端点
+        i = 0 if local_comb else -1
+        while i >= 0:
+            scan.reach = 0
+            right, is_end = get_node(i, scan)
+            if right < 0:
+                break
+            if is_end:
+                tail.append(right)
+                break
+            if not tail and scan.reach < stable:
+                if not self._anchors and not new_anchors:
+                    new_anchors.append(i)
+                new_anchors.append(right)
+            else:
+                if not self._anchors and not new_anchors and not tail:
+                    tail.append(i)
+                tail.append(right)
+            i = right
+
+        # 3 生成笔, 与上次的未确认部分比较得到事件
+        def fx_at(k: int) -> stFxK:
+            return self._fx(combs, local_comb[k], local_side[k])
+
+        bi_list = self.bi_list
+        first = self._confirmed
+        old = bi_list[first:]     # 上次未确认的笔
+        del bi_list[first:]
+        if new_anchors:
+            head = [fx_at(0)] if self._anchors else []
+            bi_list.extend(generate_bi(head + [fx_at(k) for k in new_anchors]))
+            self._anchors.extend(start + k for k in new_anchors)
+        self._confirmed = len(bi_list)
+        last = [fx_at(self._anchors[-1] - start)] if self._anchors else []
+        bi_list.extend(generate_bi(last + [fx_at(k) for k in tail]))
+
+        events: List[BiEvent] = []
+        new = bi_list[first:]
+        for k in range(min(len(old), len(new))):
+            if not _same_bi(old[k], new[k]):
+                events.append(BiEvent(BiEventType.MODIFY, first + k, new[k]))
+        for k in range(len(old), len(new)):
+            events.append(BiEvent(BiEventType.ADD, first + k, new[k]))
+        for k in range(len(old) - 1, len(new) - 1, -1):    # 从后往前删, 依次执行时序号不会错位
+            events.append(BiEvent(BiEventType.REMOVE, first + k, old[k]))
+        return events
+
+
+class _BiPrices:
+    """
+    线段计算用到的合并后高低点, 只会按笔的起点K线下标取值, 即起点分型所在独立K线的区间,
+    按笔的事件维护, 代替整根序列的 MergedKLines
+    """
+    __slots__ = ("low", "high")
+
+    def __init__(self):
+        self.low = {}
+        self.high = {}
+
+    def set(self, bi: stBiK):
+        fx = bi.bottom if bi.side == KSide.UP else bi.top
+        self.low[bi.pos_begin] = fx.lowest
+        self.high[bi.pos_begin] = fx.highest
+
+
+class IncrementalSegments:
+    """由笔的事件逐步更新的线段, 已确认的线段 is_sure 的含义与 _NCHDUAN 相同"""
+
+    def __init__(self):
+        self.bis: List[stBiK] = []      # 按事件维护的笔
+        self._prices = _BiPrices()
+        self._builder = DuanBuilder()   # 推进到已确认笔为止的状态
+        self._placed = 0                # _builder.ret 中已经放入 segments 的个数
+        self.segments: List[Segment] = []   # 与 _NCHDUAN 相同, 不含第一段
+
+    @property
+    def confirmed_count(self) -> int:
+        """已确认的线段数, 之后的线段还可能变化"""
+        return max(self._placed - 1, 0)
+
+    def update(self, events: List[BiEvent], confirmed: int) -> List[Segment]:
+        """应用笔的事件, confirmed 为已确认的笔数"""
+        for e in events:
+            if e.type == BiEventType.ADD:
+                self.bis.append(e.bi)
+                self._prices.set(e.bi)
+            elif e.type == BiEventType.MODIFY:
+                self.bis[e.index] = e.bi
+                self._prices.set(e.bi)
+            else:
+                self.bis.pop()
+        self._builder.feed(self.bis, self._prices, confirmed)
+        del self.segments[self.confirmed_count:]
+        ret = self._builder.ret
+        for k in range(self._placed, len(ret)):
+            self._place(k, ret[k])
+        self._placed = len(ret)
+
+        trial = self._builder.fork()
+        trial.feed(self.bis, self._prices, len(self.bis))
+        for k, seg in enumerate(trial.ret + trial.pending(), len(ret)):
+            self._place(k, seg)
+        return self.segments
+
+    def _place(self, k: int, seg: Segment):
+        fill_segment(seg, self.bis)
+        if k > 0:   # 第一段不要
+            self.segments.append(seg)
+
+
+class IncrementalPivots:
+    """逐步更新的中枢(笔中枢或段中枢), 与 compute_bi_pivots/compute_duan_pivots 一致"""
+
+    def __init__(self):
+        self._base = 1      # 第一个未确认的步骤
+        self._sure = 0      # 已确认的中枢数
+        self._pivots: List[Pivot] = []
+        self._size = 0
+
+    @property
+    def pivots(self) -> List[Pivot]:
+        return self._pivots if self._size >= 5 else []     # 不足5笔时没有中枢
+
+    @property
+    def confirmed_count(self) -> int:
+        return self._sure if self._size >= 5 else 0
+
+    def update(self, items: list, confirmed: int) -> List[Pivot]:
+        """items 为笔或线段, 前 confirmed 个已确认"""
+        del self._pivots[self._sure:]
+        while self._base < confirmed - 2:
+            pivot, new_base = process_down_up(self._base, items)
+            if new_base >= confirmed:   # 看到了未确认的笔
+                break
+            if pivot:
+                self._pivots.append(pivot)
+            self._base = next_pivot_base(self._base, new_base)
+        self._sure = len(self._pivots)
+
+        base = self._base
+        while base < len(items) - 2:
+            pivot, new_base = process_down_up(base, items)
+            if pivot:
+                self._pivots.append(pivot)
+            base = next_pivot_base(base, new_base)
+        self._size = len(items)
+        return self.pivots
+
+
+class IncrementalChanlun:
+    """逐根输入K线, 维护笔、线段、笔中枢和段中枢, 返回笔的事件"""
+
+    def __init__(self):
+        self.bi = IncrementalBi()
+        self.segment = IncrementalSegments()
+        self.bi_pivot = IncrementalPivots()
+        self.duan_pivot = IncrementalPivots()
+
+    @property
+    def bi_list(self) -> List[stBiK]:
+        return self.bi.bi_list
+
+    @property
+    def segments(self) -> List[Segment]:
+        return self.segment.segments
+
+    @property
+    def bi_pivots(self) -> List[Pivot]:
+        return self.bi_pivot.pivots
+
+    @property
+    def duan_pivots(self) -> List[Pivot]:
+        return self.duan_pivot.pivots
+
+    def append(self, bar) -> List[BiEvent]:
+        return self._update(self.bi.append(bar))
+
+    def update_last(self, bar) -> List[BiEvent]:
+        return self._update(self.bi.update_last(bar))
+
+    def extend(self, klines: KLineSeries) -> List[BiEvent]:
+        return self._update(self.bi.extend(klines))
+
+    def _update(self, events: List[BiEvent]) -> List[BiEvent]:
+        self.segment.update(events, self.bi.confirmed_count)
+        self.bi_pivot.update(self.bi.bi_list, self.bi.confirmed_count)
+        self.duan_pivot.update(self.segment.segments, self.segment.confirmed_count)
+        return events
+
+    def checkpoint(self) -> Dict[str, np.ndarray]:
+        """
+        已确认部分的状态: 独立K线、已确认的分型和笔端点、推进到已确认笔的线段状态、已确认的中枢.
+        未确认的笔、线段、中枢不保存, restore 之后输入下一段K线时重新生成.
+        最后一根K线的撤销信息不保存, 还可能变化的K线不要放进来
+        """
+        bi, seg, builder = self.bi, self.segment, self.segment._builder
+        combs = bi.combs
+        return {
+            "scalars": np.array([bi.merger.count, bi._checked, builder.status, builder.min_pos, builder.max_pos,
+                                 builder.pos, self.bi_pivot._base, self.duan_pivot._base], dtype=np.int64),
+            "comb_price": np.array([(c.range_low, c.range_high) for c in combs], dtype=np.float64).reshape(-1, 2),
+            "comb_pos": np.array([(c.pos_begin, c.pos_end, c.pos_extreme, c.isUp.value) for c in combs],
+                                 dtype=np.int32).reshape(-1, 4),
+            "fx_comb": np.array(bi._fx_comb, dtype=np.int32),
+            "fx_side": np.array(bi._fx_side, dtype=np.int8),
+            "anchors": np.array(bi._anchors, dtype=np.int32),
+            "builder": _segment_rows([builder.seg, builder.tmp_seg]),
+            "ret": _segment_rows(builder.ret),
+            "bi_pivots": _pivot_rows(self.bi_pivot._pivots[:self.bi_pivot._sure]),
+            "duan_pivots": _pivot_rows(self.duan_pivot._pivots[:self.duan_pivot._sure]),
+        }
+
+    @classmethod
+    def restore(cls, state: Dict[str, np.ndarray]) -> "IncrementalChanlun":
+        """由 checkpoint 的结果恢复, 未确认的部分为空, 之后输入的K线会把它们补上"""
+        engine = cls()
+        bi, seg = engine.bi, engine.segment
+        count, checked, status, min_pos, max_pos, pos, bp_base, dp_base = state["scalars"].tolist()
+        sides = {side.value: side for side in KSide}     # 逐个调用 KSide(side) 较慢
+        bi.merger.combs = [stCombineK(low, high, b, e, x, sides[side]) for (low, high), (b, e, x, side)
+                           in zip(state["comb_price"].tolist(), state["comb_pos"].tolist())]
+        bi.merger.count = count
+        bi._fx_comb = state["fx_comb"].tolist()
+        bi._fx_side = state["fx_side"].tolist()
+        bi._checked = checked
+        bi._anchors = state["anchors"].tolist()
+        combs = bi.combs
+        bi.bi_list = generate_bi([bi._fx(combs, bi._fx_comb[k], bi._fx_side[k]) for k in bi._anchors])
+        bi._confirmed = len(bi.bi_list)
+
+        seg.bis = list(bi.bi_list)
+        for item in seg.bis:
+            seg._prices.set(item)
+        builder = seg._builder
+        builder.status, builder.min_pos, builder.max_pos, builder.pos = status, min_pos, max_pos, pos
+        builder.seg, builder.tmp_seg = _segments_of(state["builder"])
+        builder.ret = _segments_of(state["ret"])
+        seg._placed = len(builder.ret)
+        seg.segments = builder.ret[1:]
+
+        for tracker, rows, base in ((engine.bi_pivot, state["bi_pivots"], bp_base),
+                                    (engine.duan_pivot, state["duan_pivots"], dp_base)):
+            tracker._base = base
+            tracker._pivots = _pivots_of(rows)
+            tracker._sure = len(tracker._pivots)
+        return engine
+
+
+def _segment_rows(segments: List[Segment]) -> np.ndarray:
+    """每段一行: 起止K线、起止笔、上/下、是否确认、最高、最低"""
+    return np.array([(s.pos_begin, s.pos_end, s.start_index, s.end_index, s.up, s.is_sure, s.highest, s.lowest)
+                     for s in segments], dtype=np.float64).reshape(-1, 8)
+
+
+def _segments_of(rows: np.ndarray) -> List[Segment]:
+    ret = []
+    for pos_begin, pos_end, start, end, up, is_sure, highest, lowest in rows.tolist():
+        seg = Segment()
+        seg.pos_begin, seg.pos_end, seg.start_index, seg.end_index = int(pos_begin), int(pos_end), int(start), int(end)
+        seg.up, seg.is_sure = bool(up), bool(is_sure)
+        seg.highest, seg.lowest = highest, lowest
+        ret.append(seg)
+    return ret
+
+
+def _pivot_rows(pivots: List[Pivot]) -> np.ndarray:
+    return np.array([(p.up, p.bg_pos_index, p.ed_pos_index, p.highly_value, p.lowly_value) for p in pivots],
+                    dtype=np.float64).reshape(-1, 5)
+
+
+def _pivots_of(rows: np.ndarray) -> List[Pivot]:
+    ret = []
+    for up, bg, ed, high, low in rows.tolist():
+        pivot = Pivot()
+        pivot.up, pivot.bg_pos_index, pivot.ed_pos_index = bool(up), int(bg), int(ed)
+        pivot.highly_value, pivot.lowly_value = high, low
+        ret.append(pivot)
+    return ret
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+@file: merger.py
+@author: luhx
+@desc: 可续算的K线包含合并
+与 c_bi._Cal_MERGE 的规则相同, 但把状态保存在对象里, 新来一根K线只处理这一根:
+  append(bar): 追加一根已完成的K线
+  update_last(bar): 最后一根K线还在走(盘中), 用新的高低点重算它
+  rollback(): 撤销最后一根K线对独立K线的影响
+批量计算中的 pLast 即 combs 的最后一个, pPrev 在每次比较时的值都与最后一根独立K线相同, 所以只需保存 combs。
+"""
+from typing import List, Optional
+
+from common.chanlun.float_compare import greater_than_0, less_than_0, equ_than_0
+from common.model.kline import KLineSeries, stCombineK, KSide
+
+
+class KLineMerger:
+    """K线包含合并的状态机, 逐根输入, 结果与 _Cal_MERGE 一致"""
+
+    def __init__(self):
+        self.combs: List[stCombineK] = []   # 独立K线
+        self.count = 0      # 已输入的K线数, 即下一根K线的下标
+        self._undo: Optional[tuple] = None  # 最后一根K线输入前的 (combs长度, 最后一根独立K线的拷贝)
+
+    def __len__(self):
+        return len(self.combs)
+
+    def append(self, bar) -> stCombineK:
+        """追加一根K线(有 low、high 属性, 例如 KLine), 返回它所在的独立K线"""
+        return self.append_range(bar.low, bar.high)
+
+    def append_range(self, low: float, high: float) -> stCombineK:
+        self._undo = (len(self.combs), self.combs[-1].copy() if self.combs else None)
+        self._step(low, high)
+        return self.combs[-1]
+
+    def extend(self, klines: KLineSeries):
+        """追加一段K线, 只有最后一根可以撤销"""
+        lows, highs = klines.low.tolist(), klines.high.tolist()
+        for low, high in zip(lows[:-1], highs[:-1]):
+            self._step(low, high)
+        if lows:
+            self.append_range(lows[-1], highs[-1])
+
+    def update_last(self, bar) -> stCombineK:
+        """最后一根K线有变化(还没走完), 撤销后按新的高低点重新合并"""
+        self.rollback()
+        return self.append(bar)
+
+    def rollback(self) -> bool:
+        """撤销最后一根K线, 只能撤销一次, 成功返回 True"""
+        if self._undo is None:
+            return False
+        size, last = self._undo
+        del self.combs[size:]
+        if last is not None:
+            cur = self.combs[-1]    # 原地恢复, 引用这根独立K线的对象看到的也是恢复后的值
+            for name in stCombineK.__slots__:
+                setattr(cur, name, getattr(last, name))
+        self.count -= 1
+        self._undo = None
+        return True
+
+    def _contains(self, low: float, high: float, index: int, pos_end: int):
+        """包含, 合并到最后一根独立K线"""
+        last = self.combs[-1]
+        last.range_low = low
+        last.range_high = high
+        last.pos_end = pos_end
+        last.pos_extreme = index
+
+    def _step(self, low: float, high: float):
+        cur = self.count
+        self.count += 1
+        combs = self.combs
+        if not combs:
+            combs.append(stCombineK(low, high, cur, cur, cur, KSide.DOWN))
+            return
+        prev = combs[-1]
+        d_high = high - prev.range_high
+        d_low = low - prev.range_low
+        if greater_than_0(d_high) and greater_than_0(d_low):
+            combs.append(stCombineK(low, high, cur, cur, cur, KSide.UP))  # 独立K 向上
+        elif less_than_0(d_high) and less_than_0(d_low):
+            combs.append(stCombineK(low, high, cur, cur, cur, KSide.DOWN))    # 独立K 向下
+        elif cur == 1:
+            # 第二根K线, 还没有方向, 都向上合并
+            if greater_than_0(d_high) or less_than_0(d_low):
+                self._contains(prev.range_low, high, cur, cur)
+            else:
+                self._contains(low, prev.range_high, prev.pos_begin, cur)
+        elif greater_than_0(d_high) or less_than_0(d_low):
+            # 右包含
+            if prev.isUp == KSide.UP:    # 向上，一样高取左极值，不一样高肯定是右高，取右值
+                pos_index = prev.pos_extreme if equ_than_0(d_high) else cur
+                self._contains(prev.range_low, high, pos_index, cur)
+            else:         # 向下，一样低取左极值，不一样低肯定是右低，取右值
+                pos_index = prev.pos_extreme if equ_than_0(d_low) else cur
+                self._contains(low, prev.range_high, pos_index, cur)
+        else:   # 左包含
+            pos_index = prev.pos_begin if prev.pos_begin == prev.pos_end else prev.pos_extreme
+            if prev.isUp == KSide.UP:
+                self._contains(low, prev.range_high, pos_index, cur)
+            else:
+                self._contains(prev.range_low, high, pos_index, cur)
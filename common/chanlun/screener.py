@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+@file: screener.py
+@author: luhx
+@desc: 全品种的缠论选股表
+对 base_path 下每个通达信导出文件(与键盘精灵相同, 由 symbol_catalog 列出)取最后 kline_count 根K线,
+计算 合并 -> 分型 -> 笔 -> 段 -> 中枢, 每个品种输出一行: 最后一笔的方向、距最后一个分型的K线数、
+收盘价是否在最近的笔中枢内等。
+  结果按文件的 mtime、size 缓存在缓存目录下, 文件未变化的品种直接使用上次的结果
+  需要重算的文件分块交给进程池, 每块只传文件路径、返回若干行的字典, 减少进程间传输
+"""
+import hashlib
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+from common.chanlun.context import ChanlunContext
+from common.config import KLINE_CACHE_PATH
+from common.model.kline import KLineSeries, KSide
+from common.utils import kline_cache, symbol_catalog
+
+SCREEN_VERSION = 1
+DEFAULT_KLINE_COUNT = 3000
+CHUNKS_PER_WORKER = 4   # 每个进程分到的块数, 块太大时各进程结束时间相差较多
+COLUMNS = ["code", "name", "bars", "close", "bi_count", "bi_dir", "bi_bars", "fx_side", "fx_bars",
+           "seg_count", "seg_dir", "seg_sure", "pivot_low", "pivot_high", "in_pivot", "in_duan_pivot", "seconds"]
+
+
+def _screen_path(base_path: str) -> str:
+    abs_path = os.path.abspath(base_path)
+    digest = hashlib.md5(abs_path.encode("utf-8")).hexdigest()[:8]
+    return os.path.join(KLINE_CACHE_PATH, f"screener.{digest}.json")
+
+
+def _load(path: str, kline_count: int) -> Dict[str, dict]:
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (IOError, ValueError) as e:
+        logging.warning(f"读取选股结果失败: {path}, {e}")
+        return {}
+    if data.get("version") != SCREEN_VERSION or data.get("kline_count") != kline_count:
+        return {}
+    return {row["file_name"]: row for row in data["rows"]}
+
+
+def _save(path: str, kline_count: int, rows: List[dict]):
+    try:
+        os.makedirs(KLINE_CACHE_PATH, exist_ok=True)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"version": SCREEN_VERSION, "kline_count": kline_count, "rows": rows}, f, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+    except OSError as e:
+        logging.warning(f"写入选股结果失败: {path}, {e}")
+
+
+def _in_range(price: float, low: float, high: float) -> bool:
+    return low <= price <= high
+
+
+def screen_klines(klines: KLineSeries) -> dict:
+    """一个品种的缠论摘要, 不含代码、名称等文件信息"""
+    ctx = ChanlunContext(klines)
+    last = len(klines) - 1
+    close = float(klines.close[last])
+    row = {"bars": len(klines), "close": close, "bi_count": 0, "bi_dir": "", "bi_bars": -1, "fx_side": "",
+           "fx_bars": -1, "seg_count": 0, "seg_dir": "", "seg_sure": False, "pivot_low": None, "pivot_high": None,
+           "in_pivot": False, "in_duan_pivot": False}
+    fractals = ctx.fractals
+    if len(fractals):
+        row["fx_side"] = "top" if int(fractals.side[-1]) == 1 else "bottom"
+        row["fx_bars"] = last - int(fractals.index[-1])
+    bi_list = ctx.bi_list
+    row["bi_count"] = len(bi_list)
+    if bi_list:
+        row["bi_dir"] = "up" if bi_list[-1].side == KSide.UP else "down"
+        row["bi_bars"] = last - bi_list[-1].pos_end
+    segments = ctx.segments
+    row["seg_count"] = len(segments)
+    if segments:
+        row["seg_dir"] = "up" if segments[-1].up else "down"
+        row["seg_sure"] = segments[-1].is_sure
+    if ctx.bi_pivots:
+        pivot = ctx.bi_pivots[-1]
+        row["pivot_low"], row["pivot_high"] = float(pivot.lowly_value), float(pivot.highly_value)
+        row["in_pivot"] = _in_range(close, row["pivot_low"], row["pivot_high"])
+    if ctx.duan_pivots:
+        pivot = ctx.duan_pivots[-1]
+        row["in_duan_pivot"] = _in_range(close, float(pivot.lowly_value), float(pivot.highly_value))
+    return row
+
+
+def screen_file(file_path: str, kline_count: int = DEFAULT_KLINE_COUNT) -> Optional[dict]:
+    """读取文件最后 kline_count 根K线并计算, 不是通达信导出格式或没有数据时返回 None"""
+    columns = kline_cache.load_columns(file_path)
+    if columns is None:
+        return None
+    columns = columns[columns.search_tail(kline_count)]
+    klines = KLineSeries.from_arrays(columns.arrays(), symbol=os.path.basename(file_path))
+    return screen_klines(klines)
+
+
+def _screen_chunk(base_path: str, items: List[dict], kline_count: int) -> List[dict]:
+    """在子进程中计算一块文件, items 为目录中的品种记录"""
+    rows = []
+    for item in items:
+        start = time.time()
+        row = {"code": item["code"], "name": item["name"], "file_name": item["file_name"],
+               "mtime": item["mtime"], "size": item["size"]}
+        try:
+            result = screen_file(os.path.join(base_path, item["file_name"]), kline_count)
+        except (OSError, ValueError, IndexError) as e:
+            logging.warning(f"选股计算失败: {item['file_name']}, {e}")
+            result = None
+        row.update(result or {"bars": 0})
+        row["seconds"] = time.time() - start
+        rows.append(row)
+    return rows
+
+
+def _chunks(items: List[dict], count: int) -> List[List[dict]]:
+    size = max(-(-len(items) // count), 1)
+    return [items[b:b + size] for b in range(0, len(items), size)]
+
+
+def screen_dir(base_path: str, kline_count: int = DEFAULT_KLINE_COUNT, workers: int = None,
+               use_cache: bool = True) -> List[dict]:
+    """
+    计算 base_path 下所有品种, 返回按目录顺序排列的结果行(列见 COLUMNS),
+    文件的 mtime、size 未变化时直接使用缓存的结果
+    """
+    start = time.time()
+    path = _screen_path(base_path)
+    old = _load(path, kline_count) if use_cache else {}
+    catalog = symbol_catalog.load_catalog(base_path)
+    rows: Dict[str, dict] = {}
+    stale = []
+    for item in catalog:
+        row = old.get(item["file_name"])
+        if row and row["mtime"] == item["mtime"] and row["size"] == item["size"]:
+            rows[item["file_name"]] = row
+        else:
+            stale.append(item)
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(stale) <= 1:
+        done = _screen_chunk(base_path, stale, kline_count)
+    else:
+        chunks = _chunks(stale, workers * CHUNKS_PER_WORKER)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = pool.map(_screen_chunk, [base_path] * len(chunks), chunks, [kline_count] * len(chunks))
+            done = [row for part in parts for row in part]
+    for row in done:
+        rows[row["file_name"]] = row
+
+    result = [rows[item["file_name"]] for item in catalog]
+    if done or len(result) != len(old):
+        _save(path, kline_count, result)
+    logging.info(f"screen {base_path}: {len(result)} symbols, {len(done)} computed, "
+                 f"{len(result) - len(done)} cached, {time.time() - start:.2f}s")
+    return result
+
+
+def format_table(rows: List[dict], columns: List[str] = COLUMNS) -> str:
+    """按列对齐的文本表格"""
+    def cell(value) -> str:
+        if value is None:
+            return ""
+        if isinstance(value, float):
+            return f"{value:.2f}" if value != int(value) else f"{value:.0f}"
+        return str(value)
+
+    body = [[cell(row.get(name)) for name in columns] for row in rows]
+    widths = [max([len(name)] + [len(line[i]) for line in body]) for i, name in enumerate(columns)]
+    lines = [" ".join(name.rjust(w) for name, w in zip(columns, widths))]
+    lines.extend(" ".join(v.rjust(w) for v, w in zip(line, widths)) for line in body)
+    return "\n".join(lines)
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+@file: snapshot.py
+@author: luhx
+@desc: 缠论计算结果的持久化
+把 IncrementalChanlun 已确认部分的状态(checkpoint)存为 npz, 文件名由 (数据标识, 笔的参数, 引擎版本) 决定:
+  数据标识: 品种、第一根K线的时间和价格, 同一份数据追加K线后标识不变
+  meta: 快照包含的K线数 n, 以及前 n 根K线的指纹(开高低收的摘要)
+再次加载时, 前 n 根K线的指纹相同则恢复状态, 只输入之后的K线, 重算的只有未确认的笔、线段和中枢;
+指纹不同(数据被改写)或没有快照时从头计算, 再写入新的快照。
+最后一根K线可能还没走完, 快照只到倒数第二根, 最后一根每次都重新输入。
+"""
+import hashlib
+import json
+import logging
+import os
+import zipfile
+from typing import Optional
+
+import numpy as np
+
+from common.chanlun.c_bi import DEFAULT_BI_PARAMS
+from common.chanlun.incremental import IncrementalChanlun
+from common.config import CHANLUN_STORE_PATH
+from common.model.kline import KLineSeries
+
+ENGINE_VERSION = 1      # 笔、线段、中枢的算法或快照格式变了就加1, 旧快照自动失效
+MAX_SNAPSHOTS = 200     # 目录中最多保留的快照数, 多了删除最久未用的
+
+
+def fingerprint(klines: KLineSeries, n: int) -> str:
+    """前 n 根K线的指纹"""
+    md5 = hashlib.md5()
+    for values in (klines.open, klines.high, klines.low, klines.close):
+        md5.update(np.ascontiguousarray(values[:n]).tobytes())
+    if n:
+        md5.update(f"{klines.datetimes[0]}|{klines.datetimes[n - 1]}".encode("utf-8"))
+    return md5.hexdigest()
+
+
+def snapshot_path(klines: KLineSeries, root: str = CHANLUN_STORE_PATH) -> str:
+    first = f"{klines.symbol}|{klines.datetimes[0]}|{klines.open[0]}|{klines.high[0]}|{klines.low[0]}|{klines.close[0]}"
+    key = f"{first}|{DEFAULT_BI_PARAMS}|{ENGINE_VERSION}"
+    digest = hashlib.md5(key.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(root, f"chanlun.{digest}.npz")
+
+
+def _read(path: str, klines: KLineSeries) -> Optional[IncrementalChanlun]:
+    """快照存在且与K线的前缀一致时恢复, 返回的引擎已输入快照中的K线; 文件损坏时删除, 由调用方重算"""
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            if meta.get("version") != ENGINE_VERSION or meta.get("params") != str(DEFAULT_BI_PARAMS):
+                return None
+            n = meta["count"]
+            if n > len(klines) or meta["fingerprint"] != fingerprint(klines, n):
+                return None
+            engine = IncrementalChanlun.restore({name: data[name] for name in data.files if name != "meta"})
+    except (OSError, EOFError, ValueError, KeyError, IndexError, zipfile.BadZipFile) as e:
+        logging.warning(f"读取缠论快照失败, 删除后重算: {path}, {e}")
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return None
+    os.utime(path)  # 记录最近使用时间, 清理时保留
+    return engine
+
+
+def _write(path: str, engine: IncrementalChanlun, klines: KLineSeries, n: int):
+    meta = {"version": ENGINE_VERSION, "params": str(DEFAULT_BI_PARAMS), "count": n,
+            "fingerprint": fingerprint(klines, n)}
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "wb") as f:
+            np.savez(f, meta=np.array(json.dumps(meta)), **engine.checkpoint())
+        os.replace(path + ".tmp", path)
+    except OSError as e:
+        logging.warning(f"写入缠论快照失败: {path}, {e}")
+        return
+    _prune(os.path.dirname(path))
+
+
+def _prune(root: str):
+    try:
+        entries = [e for e in os.scandir(root) if e.name.startswith("chanlun.") and e.name.endswith(".npz")]
+        if len(entries) <= MAX_SNAPSHOTS:
+            return
+        entries.sort(key=lambda e: e.stat().st_mtime, reverse=True)
+        for entry in entries[MAX_SNAPSHOTS:]:
+            os.remove(entry.path)
+    except OSError as e:
+        logging.warning(f"清理缠论快照失败: {root}, {e}")
+
+
+def load_chanlun(klines: KLineSeries, root: str = CHANLUN_STORE_PATH) -> IncrementalChanlun:
+    """
+    返回已输入全部K线的 IncrementalChanlun, 结果与批量计算一致.
+    能用快照时只计算快照之后的K线, 快照落后时写入新的快照
+    """
+    engine = IncrementalChanlun()
+    if not len(klines):
+        return engine
+    path = snapshot_path(klines, root)
+    restored = _read(path, klines)
+    done = restored.bi.merger.count if restored else 0
+    engine = restored or engine
+    stable = len(klines) - 1     # 最后一根K线可能还在走, 不放进快照
+    if done < stable:
+        engine.extend(klines[done:stable])
+        _write(path, engine, klines, stable)
+        done = stable
+    engine.extend(klines[done:])
+    logging.debug(f"chanlun snapshot: {path}, restored {restored is not None}, reused {done if restored else 0} bars")
+    return engine
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+@file: sweep.py
+@author: luhx
+@desc: 笔规则的参数扫描
+同一份K线上按多组 BiParams 计算笔, 合并K线、分型只算一次(取自 ChanlunContext), 每组参数只重算笔。
+分型的查找表(BiScan)在主进程生成一次, 进程池的每个进程启动时接收一次, 之后每组参数只传参数、
+只返回笔的端点(分型序号), 由主进程生成笔, 进程间的传输量与K线数无关。
+epsilon 只作用于笔的比较, 合并K线和分型仍按 float_compare.EPSINON 计算, 所以各组参数可以共用。
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Sequence, Tuple, Union
+
+from common.chanlun.c_bi import BiParams, BiScan, find_bi_nodes, generate_bi
+from common.chanlun.context import ChanlunContext
+from common.chanlun.float_compare import Trait
+from common.model.kline import KLineSeries, stBiK
+
+_shared: Optional[Tuple[BiScan, List[int]]] = None     # 子进程中的分型查找表和分型的K线下标
+
+
+def _init_worker(scan: BiScan, index: List[int]):
+    global _shared
+    _shared = (scan, index)
+
+
+def _nodes(params: BiParams) -> List[int]:
+    scan, index = _shared
+    return find_bi_nodes(scan.with_params(params, index))
+
+
+def param_grid(min_bars: Sequence[int] = (4, 5, 6, 7), rules: Sequence[Trait] = (Trait.OLDEN, Trait.NEWLY),
+               epsilons: Sequence[float] = (0.0,)) -> List[BiParams]:
+    """各参数取值的全部组合"""
+    return [BiParams(n, rule, eps) for rule in rules for n in min_bars for eps in epsilons]
+
+
+def sweep_bi(source: Union[KLineSeries, ChanlunContext], params_list: Sequence[BiParams],
+             workers: int = None) -> List[List[stBiK]]:
+    """
+    按每组参数计算笔, 返回与 params_list 顺序一致的笔列表
+    source 为K线序列或已有的 ChanlunContext(其中已算好的合并K线、分型直接使用)
+    workers 为1或只有一组参数时在本进程计算
+    """
+    ctx = source if isinstance(source, ChanlunContext) else ChanlunContext.of(source)
+    fractals = ctx.fractals
+    scan = BiScan.of(fractals, ctx.merges, ctx.independents)
+    index = fractals.index.tolist()
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(params_list) <= 1:
+        nodes = [find_bi_nodes(scan.with_params(params, index)) for params in params_list]
+    else:
+        chunksize = max(len(params_list) // (workers * 4), 1)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(scan, index)) as pool:
+            nodes = list(pool.map(_nodes, params_list, chunksize=chunksize))
+    return [generate_bi([fractals.get(k) for k in ks]) for ks in nodes]
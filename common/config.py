@@ -35,6 +35,9 @@ PICKLE_QUOTE_BQ_KEY = "bq"  # 经纪人队列保存为pickle的特殊名称，
 SQLITE_DB_NAME = os.path.join(work_path, "db/dztec.db")  # 共享的sqlite数据库文件
 CONF_PATH = os.path.join(work_path, "conf")
 TMP_PATH = os.path.join(work_path, "data/tmp")
+KLINE_CACHE_PATH = os.path.join(work_path, "data/kline_cache")  # 通达信导出文件的列式缓存目录
+KLINE_STORE_PATH = os.path.join(work_path, "data/kline_store")  # 按品种、周期分区的K线parquet存储目录
+CHANLUN_STORE_PATH = os.path.join(work_path, "data/chanlun_store")  # 缠论计算结果的持久化目录
 
 # redis key 和 mq的routing_key一样 (mq输出因子calc.output.exchange交换机 对应的routing_key)
 REDIS_MQ_STOCK_FACTOR_OPEN_HK = "stock_factor_open_hk"      # 港股盘中因子
@@ -9,7 +9,7 @@ from common.klinechart.chart.base import to_int
 
 from .base import BLACK_COLOR, UP_COLOR, DOWN_COLOR, PEN_WIDTH
 from .manager import BarManager
-from .object import ChartItemInfo, TIndex
+from .object import ChartItemInfo, TIndex, AlignedSeries
 import logging
 
 
@@ -60,6 +60,7 @@ class ChartBase(pg.GraphicsObject):
         # Very important! Only redraw the visible part and improve speed a lot.
         # self.setFlag(self.ItemUsesExtendedStyleOption)
         self._bars: Dict[datetime, DataItem] = {}
+        self._series: AlignedSeries = None  # 按主图下标对齐的数据, 绘制时按下标直接取
         self._discrete_list: List[DataItem] = []  # 离散数据，例如直线类，不是每个点上都有直线，也可能一个点上多个直线
         self._pens = [self._yellow_pen, self._up_pen, self._down_pen, self._magenta_pen, self._blue_pen]
         colors_ = ["yellow", "red", "green", "magenta", "blue"]
@@ -91,13 +92,9 @@ class ChartBase(pg.GraphicsObject):
         """
         Get bar data with index.
         """
-        # ix = to_int(ix)
-        dt = self._manager.get_dt_from_index(ix)
-        # dt = self._manager._index_datetime_map.get(ix, None)
-        if not dt:
+        if self._series is None:
             return None
-
-        return self._bars[dt] if dt in self._bars else None
+        return self._series.get(to_int(ix))
 
     def get_bar_from_dt(self, dt: datetime) -> DataItem:
         """
@@ -148,10 +145,11 @@ class ChartBase(pg.GraphicsObject):
         self.prepareGeometryChange()  # 在数据改变前调用
         self._discrete_list = info.discrete_list
         self._bars = info.bars
+        self._series = self._manager.get_series(self._layout_index, self._chart_index)
         self._type = info.type
         self._params = info.params
 
-        for ix in range(len(self._manager._datetime_index_map)):
+        for ix in range(self._manager.get_count()):
             self._bar_picutures[ix] = None
         self.update()
 
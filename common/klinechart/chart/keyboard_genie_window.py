@@ -1,5 +1,57 @@
+from typing import List
+
 from PySide6 import QtGui, QtWidgets, QtCore
 
+
+class SymbolListModel(QtCore.QAbstractListModel):
+    """
+    键盘精灵的匹配列表, 只保存匹配品种的下标;
+    行数很多时按 BATCH_SIZE 分批通知视图(canFetchMore/fetchMore), 滚动到底部时再取下一批
+    """
+    BATCH_SIZE = 200
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.items: List[dict] = []     # 全部品种 {code, name, pinyin}
+        self._matches: List[int] = []   # 匹配的品种在 items 中的下标
+        self._rows = 0                  # 已通知视图的行数
+
+    def set_items(self, items: List[dict]):
+        self.beginResetModel()
+        self.items = items
+        self._matches = []
+        self._rows = 0
+        self.endResetModel()
+
+    def set_matches(self, matches: List[int]):
+        self.beginResetModel()
+        self._matches = matches
+        self._rows = min(len(matches), self.BATCH_SIZE)
+        self.endResetModel()
+
+    def rowCount(self, parent=QtCore.QModelIndex()) -> int:
+        return 0 if parent.isValid() else self._rows
+
+    def canFetchMore(self, parent=QtCore.QModelIndex()) -> bool:
+        return not parent.isValid() and self._rows < len(self._matches)
+
+    def fetchMore(self, parent=QtCore.QModelIndex()):
+        count = min(len(self._matches) - self._rows, self.BATCH_SIZE)
+        self.beginInsertRows(QtCore.QModelIndex(), self._rows, self._rows + count - 1)
+        self._rows += count
+        self.endInsertRows()
+
+    def data(self, index: QtCore.QModelIndex, role=QtCore.Qt.DisplayRole):
+        if not index.isValid() or index.row() >= self._rows:
+            return None
+        item = self.items[self._matches[index.row()]]
+        if role == QtCore.Qt.DisplayRole:
+            return f"{item['code']} - {item['name']}"
+        elif role == QtCore.Qt.UserRole:
+            return item['code']
+        return None
+
+
 class KeyboardGenieWindow(QtWidgets.QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -26,25 +78,28 @@ class KeyboardGenieWindow(QtWidgets.QWidget):
         layout.addWidget(self.input_line_edit)
 
         # 匹配的股票代码列表
-        self.matching_list_widget = QtWidgets.QListWidget()
-        layout.addWidget(self.matching_list_widget)
+        self.matching_model = SymbolListModel(self)
+        self.matching_list_view = QtWidgets.QListView()
+        self.matching_list_view.setModel(self.matching_model)
+        self.matching_list_view.setUniformItemSizes(True)   # 行高一致, 视图不必逐行计算大小
+        layout.addWidget(self.matching_list_view)
 
         # 设置列表控件的滚动条策略
-        self.matching_list_widget.setVerticalScrollBarPolicy(QtCore.Qt.ScrollBarAsNeeded)
-        self.matching_list_widget.setHorizontalScrollBarPolicy(QtCore.Qt.ScrollBarAlwaysOff)
+        self.matching_list_view.setVerticalScrollBarPolicy(QtCore.Qt.ScrollBarAsNeeded)
+        self.matching_list_view.setHorizontalScrollBarPolicy(QtCore.Qt.ScrollBarAlwaysOff)
 
-        # 创建一个临时的列表项来获取高度
-        temp_item = QtWidgets.QListWidgetItem("示例文本")
-        self.matching_list_widget.addItem(temp_item)
-        item_height = self.matching_list_widget.sizeHintForRow(0)
-        self.matching_list_widget.clear()  # 清除临时项
+        # 用一个临时的列表项来获取高度
+        self.matching_model.set_items([{'code': "示例文本", 'name': ""}])
+        self.matching_model.set_matches([0])
+        item_height = self.matching_list_view.sizeHintForRow(0)
+        self.matching_model.set_items([])  # 清除临时项
 
         # 计算显示6个列表项所需的高度
         visible_row_count = 6
         list_widget_height = item_height * visible_row_count
 
         # 设置列表控件的固定高度
-        self.matching_list_widget.setFixedHeight(list_widget_height)
+        self.matching_list_view.setFixedHeight(list_widget_height)
 
         self.setLayout(layout)
         self.hide()
@@ -55,7 +110,7 @@ class KeyboardGenieWindow(QtWidgets.QWidget):
         # 连接输入框的信号槽
         self.input_line_edit.textChanged.connect(self.on_input_text_changed)
         self.input_line_edit.returnPressed.connect(self.on_return_pressed)
-        self.matching_list_widget.itemDoubleClicked.connect(self.on_item_double_clicked)
+        self.matching_list_view.doubleClicked.connect(self.on_item_double_clicked)
 
 
     def keyPressEvent(self, event):
@@ -65,7 +120,7 @@ class KeyboardGenieWindow(QtWidgets.QWidget):
             self.parent().setFocus()
         elif key in (QtCore.Qt.Key_Up, QtCore.Qt.Key_Down):
             # 将方向键事件传递给列表框
-            self.matching_list_widget.keyPressEvent(event)
+            self.matching_list_view.keyPressEvent(event)
         else:
             super().keyPressEvent(event)
 
@@ -90,11 +145,17 @@ class KeyboardGenieWindow(QtWidgets.QWidget):
         # 调用父窗口的方法更新匹配列表
         self.parent().update_matching_list(text)
 
+    def set_matches(self, matches: List[int]):
+        """更新匹配列表, 默认选中第一项"""
+        self.matching_model.set_matches(matches)
+        if matches:
+            self.matching_list_view.setCurrentIndex(self.matching_model.index(0))
+
     def on_return_pressed(self):
         # 获取列表中选中的项
-        selected_items = self.matching_list_widget.selectedItems()
-        if selected_items:
-            selected_stock_code = selected_items[0].data(QtCore.Qt.UserRole)
+        index = self.matching_list_view.currentIndex()
+        if index.isValid():
+            selected_stock_code = index.data(QtCore.Qt.UserRole)
             print(f"按下回车选中股票代码：{selected_stock_code}")
             self.funcs(selected_stock_code)
             # 在这里加载股票数据并更新图表
@@ -102,9 +163,8 @@ class KeyboardGenieWindow(QtWidgets.QWidget):
             self.parent().setFocus()
         else:
             # 如果没有选中项，且列表中有内容，默认选中第一项
-            if self.matching_list_widget.count() > 0:
-                item = self.matching_list_widget.item(0)
-                selected_stock_code = item.data(QtCore.Qt.UserRole)
+            if self.matching_model.rowCount() > 0:
+                selected_stock_code = self.matching_model.index(0).data(QtCore.Qt.UserRole)
                 print(f"按下回车默认选中第一项股票代码：{selected_stock_code}")
                 self.funcs(selected_stock_code)
                 # 在这里加载股票数据并更新图表
@@ -114,10 +174,10 @@ class KeyboardGenieWindow(QtWidgets.QWidget):
                 # 如果列表为空，可以根据需要处理
                 print("没有匹配的股票代码")
 
-    def on_item_double_clicked(self, item):
+    def on_item_double_clicked(self, index: QtCore.QModelIndex):
         # 双击列表项，处理选中的股票代码
-        selected_stock_code = item.data(QtCore.Qt.UserRole)
+        selected_stock_code = index.data(QtCore.Qt.UserRole)
         print(f"双击选中股票代码：{selected_stock_code}")
         # 在这里加载股票数据并更新图表
         self.hide()
-        self.parent().setFocus()
\ No newline at end of file
+        self.parent().setFocus()
@@ -5,11 +5,11 @@ from typing import Dict, Tuple, List
 import numpy as np
 import pandas as pd
 
-from .object import PlotItemInfo, TIndex
+from .object import PlotItemInfo, TIndex, AlignedSeries
 from .object import PlotIndex, ItemIndex, ChartItemInfo, MinMaxIdxTuple, MinMaxPriceTuple
 
 from .base import to_int
-from common.model.kline import KLine
+from common.model.kline import KLineSeries
 from datetime import datetime
 import logging
 
@@ -20,55 +20,58 @@ class BarManager:
 
     def __init__(self):
         """"""
-        self._datetime_index_map: Dict[datetime, TIndex] = {}  # 存储dt和index 映射表
-        self._index_datetime_map: Dict[TIndex, datetime] = {}  # 存储index和时间映射表
+        self._datetime_index_map: Dict[datetime, TIndex] = {}  # 存储dt和index 映射表, 供按时间查下标
+        self._datetimes: List[datetime] = []  # 按index排列的时间
 
         self._all_chart_infos: Dict[PlotIndex, PlotItemInfo] = {}
+        self._all_series: Dict[PlotIndex, Dict[ItemIndex, AlignedSeries]] = {}  # 按主图下标对齐的数据
         self._all_ranges: Dict[PlotIndex, Dict[MinMaxIdxTuple, MinMaxPriceTuple]] = {}
-        self.klines: list[KLine] = []
+        self.klines: KLineSeries = KLineSeries.from_bars([])
 
     def clear_all(self):
-        self._datetime_index_map: Dict[datetime, TIndex] = {}  # 存储dt和index 映射表
-        self._index_datetime_map: Dict[TIndex, datetime] = {}  # 存储index和时间映射表
+        self._datetime_index_map: Dict[datetime, TIndex] = {}  # 存储dt和index 映射表, 供按时间查下标
+        self._datetimes: List[datetime] = []  # 按index排列的时间
 
         self._all_chart_infos: Dict[PlotIndex, PlotItemInfo] = {}
+        self._all_series: Dict[PlotIndex, Dict[ItemIndex, AlignedSeries]] = {}  # 按主图下标对齐的数据
         self._all_ranges: Dict[PlotIndex, Dict[MinMaxIdxTuple, MinMaxPriceTuple]] = {}
-        self.klines: list[KLine] = []
+        self.klines: KLineSeries = KLineSeries.from_bars([])
         pass
 
     def update_history_klines(self, bars):
-        for v in bars:
-            k: KLine = KLine()
-            k.time = v[0].timestamp()
-            k.open = v[1]
-            k.high = v[2]
-            k.low = v[3]
-            k.close = v[4]
-            k.volume = v[5]
-            self.klines.append(k)
+        """由主图的bars生成列式K线序列, 各算法回调直接使用"""
+        klines = KLineSeries.from_bars(bars)
+        if len(self.klines):
+            klines = KLineSeries(self.klines.datetimes + klines.datetimes,
+                                 *[np.concatenate([getattr(self.klines, name), getattr(klines, name)])
+                                   for name in ("open", "high", "low", "close", "volume")])
+        self.klines = klines
         logging.info(f"klines.size={len(self.klines)}")
 
-
     def update_history_data(self, plot_index: PlotIndex, chart_index: ItemIndex, info: ChartItemInfo) -> None:
         """
-        设置历史数据
+        设置历史数据, 主图(0, 0)确定下标, 各图表的数据按该下标对齐保存
         """
         if plot_index not in self._all_chart_infos:
             self._all_chart_infos[plot_index] = {}
+            self._all_series[plot_index] = {}
         self._all_chart_infos[plot_index][chart_index] = info
         if plot_index == 0 and chart_index == 0:
-            ix_list = range(len(info.bars))
-            dt_list = info.bars.keys()
-            self._datetime_index_map = dict(zip(dt_list, ix_list))
-            self._index_datetime_map = dict(zip(ix_list, dt_list))
+            self._datetimes = list(info.bars.keys())
+            self._datetime_index_map = dict(zip(self._datetimes, range(len(self._datetimes))))
+        self._all_series[plot_index][chart_index] = AlignedSeries(info.bars, self._datetime_index_map,
+                                                                  len(self._datetimes))
+        self._all_ranges.pop(plot_index, None)
+
+    def get_series(self, plot_index: PlotIndex, chart_index: ItemIndex) -> AlignedSeries:
+        """图表按主图下标对齐的数据"""
+        return self._all_series[plot_index][chart_index]
 
     def get_count(self) -> int:
         """
         Get total number of bars.
         """
-        if self._all_chart_infos and self._all_chart_infos[0]:
-            return len(self._all_chart_infos[0][0].bars)
-        return 0
+        return len(self._datetimes)
 
     def get_index_from_dt(self, dt: datetime) -> int:
         """
@@ -83,7 +86,7 @@ class BarManager:
         获取 时间 通过index
         """
         ix = to_int(ix)
-        return self._index_datetime_map.get(ix, None)
+        return self._datetimes[ix] if 0 <= ix < len(self._datetimes) else None
 
     def get_layout_range(self, layout_index: int, min_ix: float = None, max_ix: float = None) -> Tuple[float, float]:
         """
@@ -113,36 +116,17 @@ class BarManager:
         max_price = float("-inf")  # 无限小，比所有数都小
         min_price = float("inf")  # 无限大，比所有数都大
         chart_items: dict[ItemIndex, ChartItemInfo] = self._all_chart_infos[layout_index]
-        for info in chart_items.values():
+        for chart_index, info in chart_items.items():
             if not info.bars:
                 continue
-            bar_list = list(info.bars.values())[min_ix:max_ix + 1]
-
-            if info.type == "Arrow":    # 对于 "Arrow" 和 "Straight" 类型，跳过不处理。
-                continue  # 对于画箭头型的，大小不在区域范围内
-            if info.type == "Shadow":
-                continue
-            elif info.type == "Straight":
-                continue  # 对于画直线，依附于K线图，大小不在区域范围内
-            elif info.type == "Candle":  # 对于 "Candle" 类型，遍历 bar_list，更新 max_price 和 min_price。
-                for bar in bar_list[:]:
-                    for item in bar[1:-1]:  # bar中分别为：[时间,开，高，低，收，量],1:-1刚好去掉头尾，只算价格
-                        max_price = max(max_price, item)
-                        min_price = min(min_price, item)
-            elif info.type == "Volume":
-                for bar in bar_list[:]:
-                    for item in bar[1:]:
-                        max_price = max(max_price, item)
-                        min_price = min(min_price, item)
-            else:
-                for bar in bar_list[:]:
-                    for item in bar[1:]:
-                        try:
-                            max_price = max(max_price, item)
-                            min_price = min(min_price, item)
-                        except Exception as e:
-                            logging.error(f'[{info.type}]layout_index:{layout_index},min_ix:{min_ix},max_ix:{max_ix},'
-                                          f'{item},{str(e)}')
+            if info.type in ("Arrow", "Shadow", "Straight"):
+                continue  # 箭头、阴影、直线依附于K线图，大小不在区域范围内
+            # bar中分别为：[时间,开，高，低，收，量], Candle 去掉头尾只算价格, 其余去掉时间
+            columns = slice(0, -1) if info.type == "Candle" else slice(None)
+            value_range = self._all_series[layout_index][chart_index].value_range(min_ix, max_ix, columns)
+            if value_range:
+                min_price = min(min_price, value_range[0])
+                max_price = max(max_price, value_range[1])
         if min_price == float("inf"):
             min_price = 0
         if max_price == float("-inf"):
@@ -3,9 +3,11 @@ Basic data structure used for general trading function in the trading platform.
 """
 from __future__ import annotations
 from datetime import datetime
-from typing import List, Dict, NewType, Tuple
+from typing import List, Dict, NewType, Optional, Tuple
 from enum import Enum
 
+import numpy as np
+
 
 TIndex = int
 
@@ -42,6 +44,11 @@ class DataItem(list):
         self.extend(arr)
         return self
 
+    def init_values(self, values):
+        """已是类型化的值, 例如 [datetime, 开, 高, 低, 收, 量], 直接填入"""
+        self.extend(values)
+        return self
+
     def init_line(self, lines):
         arr = [lines[i] if i > 0 else datetime.strptime(lines[0], "%Y-%m-%d %H:%M:%S") for i in
                range(0, len(lines))]
@@ -68,6 +75,55 @@ class ChartItemInfo:
         self.func_name: str = ""    # 获取数据的函数名
         self.data_type: List[str] = []
         self.max_height: int = 0
+        self.file_path: str = ""    # 数据文件路径, 跟踪文件追加的K线时使用
+
+
+class AlignedSeries:
+    """
+    按主图K线下标对齐的图表数据, 绘制、光标信息和纵轴范围都按下标直接取, 不再经过时间查表:
+      bars[ix]: 第ix根K线对应的DataItem, 没有数据时为None(例如Signal、Arrow等稀疏数据)
+      valid[ix]: 第ix根K线是否有数据
+      values[ix]: 除时间外各列的数值, 没有数据或不是数值时为NaN
+    """
+    __slots__ = ("bars", "valid", "values")
+
+    def __init__(self, bar_dict: BarDict, index_map: Dict[datetime, TIndex], count: int):
+        self.bars: List[Optional[DataItem]] = [None] * count
+        for dt, bar in bar_dict.items():
+            ix = index_map.get(dt)
+            if ix is not None:
+                self.bars[ix] = bar
+        self.valid = np.array([bar is not None for bar in self.bars], dtype=bool)
+        self.values = self._to_values()
+
+    def _to_values(self) -> np.ndarray:
+        width = max((len(bar) - 1 for bar in self.bars if bar is not None), default=0)
+        values = np.full((len(self.bars), width), np.nan)
+        rows = np.flatnonzero(self.valid)
+        try:
+            values[rows] = [self.bars[ix][1:] for ix in rows]
+        except (ValueError, TypeError):  # 列数不一或有非数值的列, 逐个转换
+            for ix in rows:
+                for col, item in enumerate(self.bars[ix][1:]):
+                    try:
+                        values[ix, col] = float(item)
+                    except (ValueError, TypeError):
+                        pass
+        return values
+
+    def __len__(self):
+        return len(self.bars)
+
+    def get(self, ix: TIndex) -> Optional[DataItem]:
+        return self.bars[ix] if 0 <= ix < len(self.bars) else None
+
+    def value_range(self, min_ix: TIndex, max_ix: TIndex, columns: slice = slice(None)) -> Optional[Tuple[float, float]]:
+        """[min_ix, max_ix] 内指定列的最小、最大值, 没有数据时返回None"""
+        part = self.values[max(min_ix, 0):max_ix + 1, columns]
+        part = part[~np.isnan(part)]
+        if not part.size:
+            return None
+        return float(part.min()), float(part.max())
 
 
 PlotIndex = NewType('PlotIndex', int)
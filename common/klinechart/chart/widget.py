@@ -156,7 +156,7 @@ class ChartWidget(pg.PlotWidget):
         Add chart item.
         添加图表项目方法，用于在特定绘图区域添加图表项目
         """
-        chart_index = 0 if layout_index not in self._plot_charts_dict else len(self._plot_charts_dict)
+        chart_index = 0 if layout_index not in self._plot_charts_dict else len(self._plot_charts_dict[layout_index])
         chart_item = item_class(layout_index, chart_index, self.manager)
         if layout_index not in self._plot_charts_dict:
             self._plot_charts_dict[layout_index] = []
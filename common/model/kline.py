@@ -6,6 +6,9 @@
 """
 from datetime import datetime
 from enum import Enum
+from typing import Optional
+
+import numpy as np
 
 
 class KLine:
@@ -29,6 +32,138 @@ class KLine:
         return self.__str__()
 
 
+class KLineSeries:
+    """K线序列(列式)
+    开、高、低、收、量各为一个连续的 float64 数组, 切片得到的是共享数组的视图.
+    datetimes 为每根K线的 datetime, 由 bars 构造时直接引用 bars 的时间键, 不再逐根 fromtimestamp.
+    按下标取单根或迭代时生成 KLine, 供还没有改为按列计算的旧代码使用
+    """
+    __slots__ = ("open", "high", "low", "close", "volume", "symbol", "_datetimes", "_time")
+
+    def __init__(self, datetimes, open, high, low, close, volume, symbol=""):
+        self._datetimes = datetimes     # list[datetime]
+        self.open = np.asarray(open, dtype=np.float64)
+        self.high = np.asarray(high, dtype=np.float64)
+        self.low = np.asarray(low, dtype=np.float64)
+        self.close = np.asarray(close, dtype=np.float64)
+        self.volume = np.asarray(volume, dtype=np.float64)
+        self.symbol = symbol
+        self._time = None
+
+    @classmethod
+    def from_bars(cls, bars, symbol=""):
+        """由 [时间, 开, 高, 低, 收, 量, ...] 的序列(例如 ChartItemInfo.bars.values())构造"""
+        bars = list(bars)
+        values = np.array([bar[1:6] for bar in bars], dtype=np.float64).reshape(-1, 5)
+        return cls([bar[0] for bar in bars], *values.T, symbol=symbol)
+
+    @classmethod
+    def from_arrays(cls, arrays, symbol=""):
+        """由 [时间(datetime64), 开, 高, 低, 收, 量] 各列(例如 KLineColumns.arrays())构造"""
+        return cls(np.asarray(arrays[0]).astype("datetime64[us]").tolist(), *arrays[1:6], symbol=symbol)
+
+    @classmethod
+    def from_klines(cls, klines, symbol=""):
+        """由 List[KLine] 构造"""
+        return cls([datetime.fromtimestamp(k.time) for k in klines], [k.open for k in klines],
+                   [k.high for k in klines], [k.low for k in klines], [k.close for k in klines],
+                   [k.volume for k in klines], symbol=symbol or (klines[0].symbol if klines else ""))
+
+    @property
+    def datetimes(self):
+        return self._datetimes
+
+    @property
+    def time(self) -> np.ndarray:
+        """时间戳, 与 KLine.time 相同, 用到时才计算"""
+        if self._time is None:
+            self._time = np.array([dt.timestamp() for dt in self._datetimes], dtype=np.float64)
+        return self._time
+
+    def __len__(self):
+        return len(self.close)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            sub = KLineSeries(self._datetimes[item], self.open[item], self.high[item], self.low[item],
+                              self.close[item], self.volume[item], self.symbol)
+            if self._time is not None:
+                sub._time = self._time[item]
+            return sub
+        return KLine(self._datetimes[item].timestamp(), float(self.open[item]), float(self.high[item]),
+                     float(self.low[item]), float(self.close[item]), float(self.volume[item]), self.symbol)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def copy(self):
+        """复制价格数组(时间共享), 修改副本不影响原序列"""
+        return KLineSeries(self._datetimes, self.open.copy(), self.high.copy(), self.low.copy(),
+                           self.close.copy(), self.volume.copy(), self.symbol)
+
+    def __str__(self):
+        return f"KLineSeries(symbol={self.symbol}, len={len(self)})"
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class MergedKLines:
+    """合并后的K线视图
+    不改动也不复制原K线序列: 高低点由各独立K线的区间按 independents(K线下标 -> 独立K线序号)展开,
+    开、收、量、时间直接取原序列. 同一份原序列可以被所有回调共享
+    """
+    __slots__ = ("raw", "independents", "comb_low", "comb_high", "_low", "_high")
+
+    def __init__(self, raw: KLineSeries, comb_low, comb_high, independents):
+        self.raw = raw
+        self.independents = independents    # np.ndarray[int], 长度与原序列相同
+        self.comb_low = np.asarray(comb_low, dtype=np.float64)
+        self.comb_high = np.asarray(comb_high, dtype=np.float64)
+        self._low = None
+        self._high = None
+
+    @property
+    def low(self) -> np.ndarray:
+        """每根K线所在独立K线的低点, 用到时才展开"""
+        if self._low is None:
+            self._low = self.comb_low[self.independents]
+        return self._low
+
+    @property
+    def high(self) -> np.ndarray:
+        """每根K线所在独立K线的高点, 用到时才展开"""
+        if self._high is None:
+            self._high = self.comb_high[self.independents]
+        return self._high
+
+    @property
+    def open(self) -> np.ndarray:
+        return self.raw.open
+
+    @property
+    def close(self) -> np.ndarray:
+        return self.raw.close
+
+    @property
+    def volume(self) -> np.ndarray:
+        return self.raw.volume
+
+    @property
+    def datetimes(self):
+        return self.raw.datetimes
+
+    def __len__(self):
+        return len(self.raw)
+
+    def __str__(self):
+        return f"MergedKLines(symbol={self.raw.symbol}, len={len(self)}, combs={len(self.comb_low)})"
+
+    def __repr__(self):
+        return self.__str__()
+
+
 class KSide(Enum):
     """K线方向
     """
@@ -47,16 +182,22 @@ class KExtreme(Enum):
 class stCombineK:
     """K线合并类
     """
+    __slots__ = ("range_low", "range_high", "pos_begin", "pos_end", "pos_extreme", "isUp")
+
     def __init__(self, low, high, begin, end, base, isup):
         self.range_low: float = low
         self.range_high: float = high
         self.pos_begin: int = begin      # 起始
         self.pos_end: int = end          # 结束
         self.pos_extreme: int = base     # 最高或者最低位置,极值点位置
-        self.isUp: KSide = KSide(isup)            # 是否向上
+        self.isUp: KSide = isup if isinstance(isup, KSide) else KSide(isup)  # 是否向上
         # self.data: KLine = data
         # print(self.isUp)
 
+    def copy(self) -> "stCombineK":
+        """值的拷贝, 各字段都是不可变值, 不需要 deepcopy"""
+        return stCombineK(self.range_low, self.range_high, self.pos_begin, self.pos_end, self.pos_extreme, self.isUp)
+
     def __str__(self):
         if self.isUp == KSide.UP:
             side = "up"
@@ -76,6 +217,8 @@ class stFxK:
     K线分型，顶或是底
     分型是由顶或底，左，右三个独立K线构成
     """
+    __slots__ = ("index", "side", "lowest", "highest", "extremal", "left", "right", "invalid")
+
     def __init__(self, index: int, side: KExtreme, low: float, high: float):
         self.index: int = index
         self.side: KExtreme = side   # 顶或是底， 0表示非顶或是非底
@@ -102,10 +245,85 @@ class stFxK:
         return self.__str__()
 
 
+class Fractals:
+    """
+    稀疏的顶底分型集合, 只保存真正的分型, 按K线下标升序
+    index: 分型极值所在的K线下标; side: KExtreme 的值(1顶, -1底);
+    low、high: 中间独立K线的区间; comb: 中间独立K线在 combs 中的位置, 左右独立K线为 comb-1、comb+1
+    """
+    __slots__ = ("index", "side", "low", "high", "comb", "combs", "_pos", "_next_opposite")
+
+    def __init__(self, index, side, low, high, comb, combs):
+        self.index = np.asarray(index, dtype=np.int64)
+        self.side = np.asarray(side, dtype=np.int8)
+        self.low = np.asarray(low, dtype=np.float64)
+        self.high = np.asarray(high, dtype=np.float64)
+        self.comb = np.asarray(comb, dtype=np.int64)
+        self.combs = combs      # List[stCombineK]
+        self._pos = None        # K线下标 -> 分型位置, 用到时才生成
+        self._next_opposite = None
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def next_opposite(self) -> np.ndarray:
+        """每个分型之后第一个方向相反的分型位置, 没有为-1"""
+        if self._next_opposite is None:
+            n = len(self.side)
+            run = np.concatenate([[0], np.cumsum(self.side[1:] != self.side[:-1])]) if n else np.zeros(0, np.int64)
+            starts = np.concatenate([np.flatnonzero(np.diff(run)) + 1, [-1]])   # 各段同向分型之后的起点
+            self._next_opposite = starts[run].astype(np.int64)
+        return self._next_opposite
+
+    def position(self, bar_ix: int) -> int:
+        """K线下标对应的分型位置, 不是分型返回-1"""
+        if self._pos is None:
+            self._pos = {ix: k for k, ix in enumerate(self.index.tolist())}
+        return self._pos.get(bar_ix, -1)
+
+    def side_at(self, bar_ix: int) -> KExtreme:
+        """K线下标处的分型方向, 不是分型返回 NORMAL"""
+        k = self.position(bar_ix)
+        return KExtreme.NORMAL if k < 0 else KExtreme(int(self.side[k]))
+
+    def next_index(self, bar_ix: int) -> int:
+        """下标 >= bar_ix 的第一个分型的K线下标, 没有返回-1"""
+        k = int(np.searchsorted(self.index, bar_ix))
+        return int(self.index[k]) if k < len(self.index) else -1
+
+    def get(self, k: int) -> stFxK:
+        """第k个分型生成 stFxK"""
+        c = int(self.comb[k])
+        fx = stFxK(index=int(self.index[k]), side=KExtreme(int(self.side[k])),
+                   low=float(self.low[k]), high=float(self.high[k]))
+        fx.left = self.combs[c - 1]
+        fx.right = self.combs[c + 1]
+        fx.extremal = self.combs[c]
+        return fx
+
+    def fx_at(self, bar_ix: int) -> stFxK:
+        """K线下标处的分型生成 stFxK"""
+        return self.get(self.position(bar_ix))
+
+    def __iter__(self):
+        for k in range(len(self)):
+            yield self.get(k)
+
+    def __str__(self):
+        return f"Fractals(top={int((self.side == KExtreme.TOP.value).sum())}, " \
+               f"bottom={int((self.side == KExtreme.BOTTOM.value).sum())})"
+
+    def __repr__(self):
+        return self.__str__()
+
+
 class stBiK:
     """
     K线笔类
     """
+    __slots__ = ("pos_begin", "pos_end", "top", "bottom", "highest", "lowest", "side")
+
     def __init__(self):
         self.pos_begin: int = 0     # 开始
         self.pos_end: int = 0       # 结束
@@ -115,6 +333,13 @@ class stBiK:
         self.lowest: float = 0.0    # 最低
         self.side: KSide = KSide.Init
 
+    def copy(self) -> "stBiK":
+        """浅拷贝, 顶底分型与原笔共享"""
+        bi = stBiK.__new__(stBiK)
+        for name in stBiK.__slots__:
+            setattr(bi, name, getattr(self, name))
+        return bi
+
     def __str__(self):
         up_str = f"[{self.pos_begin}]{self.lowest}⬈[{self.pos_end}]{self.highest}"
         down_str = f"[{self.pos_begin}]{self.highest}⬊[{self.pos_end}]{self.lowest}"
@@ -130,8 +355,36 @@ class stBiK:
         return self.__str__()
 
 
+class FeatureSequence:
+    """
+    线段的特征序列, 随笔逐步推进的状态
+    fold_*: 段内(start_index+1 到 end_index)特征序列做包含处理后, 最后一个元素的高低点
+    scan_*: 段终点之后反向特征序列的扫描位置, 以及其中的极值笔
+    各自记下计算时的起止笔, 线段的起止变化了就从头再算
+    """
+    __slots__ = ("fold_key", "fold_next", "fold_high", "fold_low", "scan_key", "scan_next", "scan_end")
+
+    def __init__(self):
+        self.fold_key = None
+        self.fold_next = 0
+        self.fold_high = 0.0
+        self.fold_low = 0.0
+        self.scan_key = None
+        self.scan_next = 0
+        self.scan_end = 0
+
+    def copy(self) -> "FeatureSequence":
+        other = FeatureSequence.__new__(FeatureSequence)
+        for name in FeatureSequence.__slots__:
+            setattr(other, name, getattr(self, name))
+        return other
+
+
 class Segment:
     """段"""
+    __slots__ = ("pos_begin", "pos_end", "start_index", "end_index", "highest", "lowest", "side", "up", "is_sure",
+                 "features")
+
     def __init__(self):
         self.pos_begin: int = 0     # K线索引，开始
         self.pos_end: int = 0       # K线索引，结束
@@ -140,7 +393,18 @@ class Segment:
         self.highest: float = 0.0
         self.lowest: float = 0.0
         self.side: KSide = KSide.Init
+        self.up: bool = False       # 方向，True为向上
         self.is_sure = False    # 是否被确认
+        self.features: Optional[FeatureSequence] = None     # 确认线段时的特征序列状态
+
+    def copy(self) -> "Segment":
+        """值的拷贝, 除特征序列外各字段都是不可变值, 不需要 deepcopy"""
+        seg = Segment.__new__(Segment)
+        for name in Segment.__slots__:
+            setattr(seg, name, getattr(self, name))
+        if self.features is not None:
+            seg.features = self.features.copy()
+        return seg
 
     def __str__(self):
         up_seg = f"[{self.is_sure}][{self.pos_begin}]⬈[{self.pos_end}]"
@@ -153,6 +417,8 @@ class Segment:
 
 class Pivot:
     """中枢"""
+    __slots__ = ("up", "bg_pos_index", "ed_pos_index", "highly_value", "lowly_value")
+
     def __init__(self):
         self.up: bool = False  # 中枢方向，True为向上，False为向下
         self.bg_pos_index: int = 0
@@ -1,4 +1,7 @@
 import os, sys, re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Tuple
 from PySide6 import QtCore, QtWidgets
 if "PyQt5" in sys.modules:
     del sys.modules["PyQt5"]
@@ -7,20 +10,24 @@ from common.klinechart.chart import ChartWidget, ChartVolume, ChartCandle, Chart
     ChartArrow, ChartLine, ChartStraight, ChartSignal, ItemIndex, ChartShadow
 from common.klinechart.chart.object import DataItem
 from common.klinechart.chart import PlotIndex, BarDict, PlotItemInfo, ChartItemInfo
-from common.utils import file_txt
+from common.utils import file_txt, kline_parser, kline_store
+from common.config import KLINE_STORE_PATH, CHANLUN_STORE_PATH
+from common.utils.kline_follower import KLineFollower
+from common.chanlun.context import ChanlunContext
 from common.algo.zigzag import OnCalculate
 from common.algo.weibi import get_weibi_list
 from common.callback.call_back import *
 from common.klinechart.chart.keyboard_genie_window import KeyboardGenieWindow
-from common.utils.pinyin_util import get_pinyin_first_letters
+from common.utils import symbol_catalog
+from common.util import time_ctx
 
 
-def calc_zig_zag(klines: List[KLine]):
+def calc_zig_zag(klines: KLineSeries):
     zig_zag = OnCalculate(klines)
     return zig_zag
 
 
-def obtain_data_from_algo(klines: list[KLine], data: Dict[PlotIndex, PlotItemInfo]):
+def obtain_data_from_algo(klines: KLineSeries, data: Dict[PlotIndex, PlotItemInfo]):
     calc_zig_zag(klines)
     for plot_index in data.keys():
         plot_item_info:PlotItemInfo = data[plot_index]
@@ -33,37 +40,103 @@ def obtain_data_from_algo(klines: list[KLine], data: Dict[PlotIndex, PlotItemInf
                     info.bars = globals()[info.func_name](klines)
 
 
+def _read_bars(file_path: str, data_type: List[str], kline_count: int, start_dt: str, end_dt: str,
+               use_cache: bool) -> BarDict:
+    """读取一个文件的K线, 通达信导出格式整块解析为列式K线, data_type格式按列批量解析"""
+    if not data_type:
+        columns = file_txt.tail_kline_columns(file_path, kline_count, start_dt, end_dt, use_cache=use_cache)
+        if columns is not None:
+            return calc_bars_from_arrays(columns.arrays())
+    data_list = file_txt.tail_kline(file_path, kline_count, start_dt, end_dt, use_cache=use_cache)
+    if data_type:
+        return calc_bars_from_arrays(kline_parser.parse_schema("\n".join(data_list).encode("gb2312", errors="ignore"),
+                                                               data_type))
+    return calc_bars(data_list, data_type)
+
+
+def _read_store_bars(store_path: str, symbol: str, period: str, kline_count: int, start_dt: str,
+                     end_dt: str) -> BarDict:
+    """从parquet存储读取一个品种的K线"""
+    dt_start = datetime.strptime(start_dt, '%Y-%m-%d %H:%M:%S') if start_dt else None
+    dt_end = datetime.strptime(end_dt, '%Y-%m-%d %H:%M:%S') if end_dt else None
+    cols = kline_store.read_klines(symbol, period, kline_count, dt_start, dt_end, store_path)
+    return calc_bars_from_arrays(kline_store.arrays(cols)) if cols else {}
+
+
 def load_data_from_conf(conf: Dict[str, any]) -> Dict[PlotIndex, PlotItemInfo]:  # 从文件中读取数据
     """
     返回以layout_index, index为key的各item的kl_data_list
+    先统一解析各item的文件名(目录只列一次), 再把不同的文件放到线程池中并行读取, 相同的文件只读一次
+    conf中 data_source 为 parquet 时, 通达信格式的item从 store_path 下的parquet存储读取, 按文件名匹配品种
     """
+    base_path = conf["conf"]["base_path"]
+    kline_count = conf["conf"]["kline_count"] if conf["conf"]["kline_count"] else 1000
+    start_dt = conf["conf"]["start_dt"] if "start_dt" in conf["conf"] else ""
+    end_dt = conf["conf"]["end_dt"] if "end_dt" in conf["conf"] else ""
+    use_cache = conf["conf"]["kline_cache"] if "kline_cache" in conf["conf"] else True
+    use_store = conf["conf"].get("data_source", "text") == "parquet"
+    if use_store and not kline_store.available():
+        logging.warning("data_source为parquet, 但没有安装pyarrow, 改为读取文本文件")
+        use_store = False
+    store_path = conf["conf"].get("store_path", KLINE_STORE_PATH)
+    period = conf["conf"].get("period", "5m")
+
     local_data: Dict[PlotIndex, PlotItemInfo] = {}
-    plots = conf["plots"]
-    for plot_index, plot in enumerate(plots):
-        plot_info: PlotItemInfo = {}
-        for item_index, item in enumerate(plot["chart_item"]):
-            item_info: ChartItemInfo = ChartItemInfo()
-            item_info.type = item["type"]
-            item_info.params = item["params"] if "params" in item else []
-            item_info.func_name = item["func_name"] if "func_name" in item else ""
-            item_info.data_type = item["data_type"] if "data_type" in item else []
-            file_name = item["file_name"]
-            base_path = conf["conf"]["base_path"]
-            if file_name:   # 存在则读取文件
-                kline_count = conf["conf"]["kline_count"] if conf["conf"]["kline_count"] else 1000
-                file_list = file_txt.list_only_files(base_path)
-                file_name = file_txt.find_first_file(file_name, file_list)
-                start_dt = conf["conf"]["start_dt"] if "start_dt" in conf["conf"] else ""
-                end_dt = conf["conf"]["end_dt"] if "end_dt" in conf["conf"] else ""
-                data_list = file_txt.tail_kline(f'{base_path}/{file_name}', kline_count, start_dt, end_dt)
-            else:
-                data_list = []  # 否则直接返回空列表
-            bar_dict: BarDict = calc_bars(data_list, item_info.data_type)
-            item_info.bars = bar_dict
-            plot_info[ItemIndex(item_index)] = item_info
-            logging.info(F"file_name: {file_name}")
-            logging.info(F"plot_index:{plot_index}, item_index:{item_index}, len(bar_dict)={len(bar_dict)}")
-        local_data[PlotIndex(plot_index)] = plot_info
+    item_tasks: Dict[Tuple[PlotIndex, ItemIndex], tuple] = {}  # 各item对应的读取任务
+    with time_ctx("load_data_from_conf 解析文件名"):
+        plots = conf["plots"]
+        file_list = None
+        symbol_list = None
+        for plot_index, plot in enumerate(plots):
+            plot_info: PlotItemInfo = {}
+            for item_index, item in enumerate(plot["chart_item"]):
+                item_info: ChartItemInfo = ChartItemInfo()
+                item_info.type = item["type"]
+                item_info.params = item["params"] if "params" in item else []
+                item_info.func_name = item["func_name"] if "func_name" in item else ""
+                item_info.data_type = item["data_type"] if "data_type" in item else []
+                file_name = item["file_name"]
+                if file_name and use_store and not item_info.data_type:
+                    if symbol_list is None:
+                        symbol_list = kline_store.list_symbols(store_path)
+                    symbol = file_txt.find_first_file(os.path.splitext(file_name)[0], symbol_list)
+                    if symbol:
+                        item_tasks[(PlotIndex(plot_index), ItemIndex(item_index))] = ("parquet", symbol)
+                elif file_name:   # 存在则读取文件
+                    if file_list is None:
+                        file_list = file_txt.list_only_files(base_path)
+                    file_name = file_txt.find_first_file(file_name, file_list)
+                    if file_name:
+                        item_info.file_path = f'{base_path}/{file_name}'
+                        item_tasks[(PlotIndex(plot_index), ItemIndex(item_index))] = \
+                            ("text", item_info.file_path, tuple(item_info.data_type))
+                plot_info[ItemIndex(item_index)] = item_info
+            local_data[PlotIndex(plot_index)] = plot_info
+
+    # 同一文件(品种)、同一解析格式只读一次
+    tasks = set(item_tasks.values())
+    with time_ctx(f"load_data_from_conf 读取{len(tasks)}个文件"):
+        results: Dict[tuple, BarDict] = {}
+        if tasks:
+            with ThreadPoolExecutor(max_workers=min(len(tasks), 8)) as pool:
+                futures = {}
+                for task in tasks:
+                    if task[0] == "parquet":
+                        futures[task] = pool.submit(_read_store_bars, store_path, task[1], period, kline_count,
+                                                    start_dt, end_dt)
+                    else:
+                        futures[task] = pool.submit(_read_bars, task[1], list(task[2]), kline_count, start_dt,
+                                                    end_dt, use_cache)
+                results = {task: future.result() for task, future in futures.items()}
+
+    with time_ctx("load_data_from_conf 组装数据"):
+        for plot_index, plot_info in local_data.items():
+            for item_index, item_info in plot_info.items():
+                task = item_tasks.get((plot_index, item_index))
+                if task:
+                    item_info.bars = dict(results[task])
+                    logging.info(F"source: {task[:2]}")
+                logging.info(F"plot_index:{plot_index}, item_index:{item_index}, len(bar_dict)={len(item_info.bars)}")
 
     return local_data
 
@@ -78,11 +151,29 @@ def calc_bars(data_list, data_type: List[str]) -> BarDict:
     return bar_dict
 
 
+def calc_bars_from_arrays(arrays) -> BarDict:
+    """由批量解析得到的各列生成bars, 第一列为时间, 省去逐行的文本解析"""
+    bar_dict: BarDict = {}
+    if not arrays:
+        return bar_dict
+    for row in zip(*[a.tolist() for a in arrays]):
+        bar_dict[row[0]] = DataItem().init_values(row)
+    return bar_dict
+
+
 class MainWindow(QtWidgets.QMainWindow):
+    klines_appended = QtCore.Signal(str, object, bool)  # 跟踪线程发出, 切换到主线程处理新K线
+
     def __init__(self, conf):
         super().__init__()
         self.conf = conf
         self.widget = ChartWidget(self)
+        self.datas: Dict[PlotIndex, PlotItemInfo] = {}
+        self.follower = KLineFollower()
+        self.follow_path = ""
+        self.klines_appended.connect(self.on_klines_appended)
+        if conf["conf"].get("chanlun_store", False):
+            ChanlunContext.enable_store(conf["conf"].get("chanlun_store_path", CHANLUN_STORE_PATH))
 
         self.add_chart_item(conf["plots"], self.widget)
 
@@ -94,8 +185,10 @@ class MainWindow(QtWidgets.QMainWindow):
 
         self.setCentralWidget(self.widget)
 
-        # 加载股票代码和名称列表
-        self.code_name_list, self.code_file_dic = self.load_keyboard_sprite_data()
+        # 股票代码和名称列表在首个图表显示后再加载
+        self.code_name_list, self.code_file_dic = [], {}
+        self.symbol_index = symbol_catalog.SymbolIndex([])
+        QtCore.QTimer.singleShot(0, self.load_symbol_catalog)
 
         # 创建键盘精灵窗口
 
@@ -104,13 +197,12 @@ class MainWindow(QtWidgets.QMainWindow):
 
 
     def load_data_from_file_name(self, code=""):
-        self.widget.clear_all()
         if code:
             file_name = self.code_file_dic[code]
             # print(self.conf["plots"])
             self.conf["plots"][0]["chart_item"][0]["file_name"] = file_name
-        datas: Dict[PlotIndex, PlotItemInfo] = load_data_from_conf(self.conf)
-        self.widget.update_all_history_data(datas, obtain_data_from_algo)
+        self.datas = load_data_from_conf(self.conf)
+        self.refresh_chart()
         file_name = self.conf["plots"][0]["chart_item"][0]["file_name"]
         print("file_name: ", file_name)
         # 将 file_name 设置到窗口标题中
@@ -118,12 +210,49 @@ class MainWindow(QtWidgets.QMainWindow):
             self.setWindowTitle(code)
         else:
             self.setWindowTitle(file_name)
+        self.follow_kline_file()
 
+    def refresh_chart(self):
+        self.widget.clear_all()
+        self.widget.update_all_history_data(self.datas, obtain_data_from_algo)
         self.widget.update_all_view()
         self.widget._update_y_range()
         self.widget.scene().update()  # 请求QGraphicsScene更新绘制
         self.widget.viewport().update()  # 请求QGraphicsView更新
 
+    def follow_kline_file(self):
+        """
+        conf中 kline_follow 为True且没有指定end_dt时, 跟踪主图K线文件的追加数据
+        """
+        if self.follow_path:
+            self.follower.unfollow(self.follow_path)
+            self.follow_path = ""
+        if not self.conf["conf"].get("kline_follow", False) or self.conf["conf"].get("end_dt", ""):
+            return
+        info: ChartItemInfo = self.datas[PlotIndex(0)][ItemIndex(0)]
+        if info.data_type or not os.path.isfile(info.file_path):
+            return
+        self.follow_path = os.path.abspath(info.file_path)
+        self.follower.follow(self.follow_path, self.klines_appended.emit)
+        self.follower.start()
+
+    def on_klines_appended(self, file_path: str, columns, reset: bool):
+        """追加的K线并入对应的bars, 由算法回调重新计算指标后刷新图表; 文件被改写时整体重新加载"""
+        if file_path != self.follow_path:
+            return
+        if reset:
+            self.load_data_from_file_name()
+            return
+        new_bars = calc_bars_from_arrays(columns.arrays())
+        for plot_info in self.datas.values():
+            for info in plot_info.values():
+                if info.file_path and os.path.abspath(info.file_path) == file_path:
+                    info.bars.update(new_bars)
+                elif info.func_name:    # 由算法计算的数据, 清空后重新计算
+                    info.bars = {}
+                    info.discrete_list = []
+        self.refresh_chart()
+
     def add_chart_item(self, plots: List[Any], widget: ChartWidget):
         for plot_index, plot in enumerate(plots):
             if plot_index != len(plots) - 1:
@@ -152,42 +281,23 @@ class MainWindow(QtWidgets.QMainWindow):
                     raise "not match item"
 
 
+    def load_symbol_catalog(self):
+        self.code_name_list, self.code_file_dic = self.load_keyboard_sprite_data()
+        self.symbol_index = symbol_catalog.SymbolIndex(self.code_name_list)
+        self.keyboard_genie.matching_model.set_items(self.code_name_list)
+        logging.info(f"symbol catalog loaded: {len(self.code_name_list)}")
+
     def load_keyboard_sprite_data(self):
+        """
+        从品种目录加载代码、名称和拼音首字母, 目录按文件的mtime增量更新
+        """
         base_path = self.conf["conf"]["base_path"]
-        # 示例：从文件或数据库加载股票列表
-        # 此处使用简单的列表作为示例
-        # 定义文件名匹配的正则表达式
-        # ^\d+ 表示文件名以数字开头
-        # # 表示紧跟一个井号
-        # .* 表示任意字符（中间部分可有多种形式）
-        # L9\.txt$ 以 L9.txt 结尾
-
-        pattern = re.compile(r'^\d+#[^#]*L9\.txt$')
         items = []
         dic: Dict[str, str] = {}
-        for file_name in os.listdir(base_path):
-            if pattern.match(file_name):
-                file_path = os.path.join(base_path, file_name)
-                with open(file_path, 'r', encoding='gb2312') as f:
-                    first_line = f.readline().strip()
-                    fields = first_line.split()
-                    if len(fields) >= 2:
-                        code = fields[0].strip()
-                        name = fields[1].strip()
-                        pinyin = get_pinyin_first_letters(name)
-                        items.append({'code': code, 'name': name, 'pinyin': pinyin})
-                        dic[code] = file_name
+        for item in symbol_catalog.load_catalog(base_path):
+            items.append({'code': item["code"], 'name': item["name"], 'pinyin': item["pinyin"]})
+            dic[item["code"]] = item["file_name"]
         return items, dic
-        #
-        # items = [
-        #     {'code': '600519', 'name': '贵州茅台'},
-        #     {'code': '000001', 'name': '平安银行'},
-        #     {'code': '000002', 'name': '万科A'},
-        #     {'code': '600036', 'name': '招商银行'},
-        #     {'code': '600837', 'name': '海通证券'},
-        #     # ... 更多股票代码和名称 ...
-        # ]
-        # return items, []
 
     def keyPressEvent(self, event):
         key = event.key()
@@ -244,24 +354,7 @@ class MainWindow(QtWidgets.QMainWindow):
     #     self.keyboard_genie.close()
 
     def update_matching_list(self, input_text):
-        matching_stocks = []
-        input_upper = input_text.strip().upper()
-        if input_upper:
-            for stock in self.code_name_list:
-                if input_upper in stock['code'] or input_upper in stock['pinyin'].upper():
-                    matching_stocks.append(stock)
-
-        self.keyboard_genie.matching_list_widget.clear()
-        for stock in matching_stocks:
-            item_text = f"{stock['code']} - {stock['name']}"
-            item = QtWidgets.QListWidgetItem(item_text)
-            item.setData(QtCore.Qt.UserRole, stock['code'])
-            self.keyboard_genie.matching_list_widget.addItem(item)
-
-        if matching_stocks:
-            self.keyboard_genie.matching_list_widget.setCurrentRow(0)
-        else:
-            pass
+        self.keyboard_genie.set_matches(self.symbol_index.search(input_text))
 
 
 app = QtWidgets.QApplication(sys.argv)
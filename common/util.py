@@ -16,7 +16,7 @@ import sqlite3
 from functools import wraps
 import pickle
 import threading
-from common.model.kline import KLine
+from common.model.kline import KLineSeries
 from typing import List
 
 
@@ -430,24 +430,24 @@ def cache_init_func_result(func):
     return wrapper
 
 
-def convert_kline_to_dataframe(kline_list: List[KLine]) -> pd.DataFrame:
+def convert_kline_to_dataframe(kline_list: KLineSeries) -> pd.DataFrame:
     """
-    Convert List[KLine] to OHLC DataFrame
+    Convert KLineSeries to OHLC DataFrame
 
     Args:
-        kline_list: List of KLine objects
+        kline_list: KLineSeries, the columns are used directly
 
     Returns:
         pd.DataFrame with columns: ['Date', 'Open', 'High', 'Low', 'Close', 'Volume', 'Symbol']
     """
     data = {
-        'Date': pd.to_datetime([k.time for k in kline_list], unit='s').tz_localize('UTC').tz_convert('Asia/Shanghai'),
-        'Open': [k.open for k in kline_list],
-        'High': [k.high for k in kline_list],
-        'Low': [k.low for k in kline_list],
-        'Close': [k.close for k in kline_list],
-        'Volume': [k.volume for k in kline_list],
-        'Symbol': [k.symbol for k in kline_list]
+        'Date': pd.to_datetime(kline_list.time, unit='s').tz_localize('UTC').tz_convert('Asia/Shanghai'),
+        'Open': kline_list.open,
+        'High': kline_list.high,
+        'Low': kline_list.low,
+        'Close': kline_list.close,
+        'Volume': kline_list.volume,
+        'Symbol': [kline_list.symbol] * len(kline_list)
     }
 
     return pd.DataFrame(data)
@@ -1,8 +1,13 @@
 import os
+import mmap
 from typing import List
 import logging
+import numpy as np
 from dataclasses import dataclass
 from datetime import datetime, timedelta
+from typing import Optional
+from common.utils import kline_cache, kline_index, kline_parser
+from common.utils.kline_cache import KLineColumns
 
 import copy
 def read_file(file_name) -> List[str]:
@@ -164,23 +169,129 @@ def count_klines(data_lines):
     return s
 
 
-def _read_in_reverse(file_path: str, block_size: int, n: int, end_dt) -> list[str]:
+def _reverse_blocks(mm, first_block: int):
     """
-    主函数: 从文件末尾逆向分块读取, 保持 partial_line = lines[0].
-    拼装到 data_lines(从你原代码看, 最后返回从最前到最后的顺序).
-
-    1) 若 end_dt 有值, 解析成 datetime
-    2) 循环读块, split -> partial_line + complete_lines
-    3) complete_lines 解码后, 做时间检查与拼接
-    4) 直到 data_lines数>=n 或到文件开头
-    5) 最后处理 partial_line
-    6) 返回 data_lines
+    从文件尾向前按整行切块, 生成 (begin, end); 由调用方 send 下一块的建议大小(字节), 实现块大小自适应
+    """
+    end = len(mm)
+    block = first_block
+    while end > 0:
+        begin = max(end - block, 0)
+        if begin > 0:
+            nl = mm.rfind(b"\n", 0, begin)   # 对齐到行首, 块头的半行归到下一块
+            begin = nl + 1
+        block = (yield begin, end) or block * 2
+        end = begin
+
+
+def _data_line_starts(buf: bytes, begin: int) -> np.ndarray:
+    """buf(从行首开始)中以数字开头的行的文件偏移"""
+    a = np.frombuffer(buf, dtype=np.uint8)
+    starts = np.concatenate(([0], np.flatnonzero(a[:-1] == 10) + 1))
+    first_byte = a[starts]
+    return begin + starts[(first_byte >= 48) & (first_byte <= 57)]
+
+
+def _find_end(buf: bytes, begin: int, dt_end: datetime):
+    """
+    在块中找文件时间 <= dt_end 的最后一行(与原逐块读取相同, 不按交易时间).
+    文件按交易时间递增, 只解析块的开头判断整块是否都在 dt_end 之后, 是则返回 (False, None, None), 不必解析整块;
+    否则返回 (是否通达信格式, <= dt_end 的行偏移, 最后一行的结束位置)
+    """
+    end = np.datetime64(dt_end, "s")
+    head, _, _ = kline_parser.parse_tdx(buf[:1024], begin, final=False)
+    if len(head["key"]) and head["key"][0] > end:
+        return True, None, None
+    cols, _, _ = kline_parser.parse_tdx(buf, begin)
+    keep = np.flatnonzero(cols["time"] <= end)
+    if not len(keep):
+        return len(cols["time"]) > 0, None, None
+    last = keep[-1]
+    row_end = int(cols["offset"][last + 1]) if last + 1 < len(cols["offset"]) else begin + len(buf)
+    return True, cols["offset"][:last + 1], row_end
+
+
+def _scan_in_reverse(file_path: str, n: int, dt_end: Optional[datetime], encoding: str = "gb2312"):
+    """
+    用 mmap 从文件尾向前找最后 n 个数据行(以数字开头的行), 有 dt_end 时以文件时间 <= dt_end 的最后一行为终点.
+    先按块找到终点行, 再只按行首字节数行数; 第一块按每行64字节估计, 之后按已数过的平均行长估计剩余行需要的字节数.
+    定位到首尾偏移后一次切出这些行的字节并解码, 返回 list[str]; 有 dt_end 但不是通达信格式时返回 None
+    """
+    with open(file_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            blocks = _reverse_blocks(mm, max(n * 64, 1 << 16) if dt_end is None else 1 << 14)
+            found = 0
+            scanned = 0
+            first = last_end = None
+            step = None
+            is_tdx = dt_end is None
+            try:
+                while found < n:
+                    begin, end = blocks.send(step)
+                    buf = mm[begin:end]
+                    if last_end is None and dt_end is not None:
+                        tdx, rows, last_end = _find_end(buf, begin, dt_end)
+                        is_tdx = is_tdx or tdx
+                        if last_end is None:
+                            continue    # 整块都在 dt_end 之后, 块大小继续翻倍
+                    else:
+                        rows = _data_line_starts(buf, begin)
+                        last_end = end if last_end is None else last_end
+                    if len(rows):
+                        take = min(n - found, len(rows))
+                        first = int(rows[-take])
+                        found += take
+                    scanned += end - begin
+                    step = int((n - found) * scanned / max(found, 1) * 1.2) if found else None
+            except StopIteration:
+                pass
+            if not is_tdx:
+                return None
+            if first is None:
+                return []
+            text = mm[first:last_end].decode(encoding, errors="ignore")
+    lines = [line.strip() for line in text.split("\n")]
+    return [line for line in lines if line and line[0].isdigit() and "," in line]   # 去掉表头、表尾
+
+
+def _read_in_reverse(file_path: str, block_size: int, n: int, end_dt, use_cache: bool = True) -> list[str]:
+    """
+    从文件末尾取n行(或 end_dt 之前的n行):
+    1) 列式缓存
+    2) 稀疏索引
+    3) mmap 逆向扫描, 块大小自适应, 最后一次解码
+    4) 以上都不适用时, 逐块逆向读取
     """
     # 1) 处理 end_dt
     dt_end = None
     if end_dt:
         dt_end = datetime.strptime(end_dt, '%Y-%m-%d %H:%M:%S')
 
+    columns = kline_cache.load_columns(file_path) if use_cache else None
+    if columns is not None:
+        return columns[columns.search_tail(n, dt_end)].read_lines()
+    columns = kline_index.read_tail(file_path, n, dt_end)     # 不用缓存时, 由稀疏索引定位
+    if columns is not None:
+        return columns.read_lines()
+    lines = _scan_in_reverse(file_path, n, dt_end)
+    if lines is not None:
+        return lines
+    return _read_in_reverse_blocks(file_path, block_size, n, dt_end)
+
+
+def _read_in_reverse_blocks(file_path: str, block_size: int, n: int, dt_end) -> list[str]:
+    """
+    从文件末尾逆向分块读取, 保持 partial_line = lines[0].
+    拼装到 data_lines(从你原代码看, 最后返回从最前到最后的顺序).
+
+    1) 循环读块, split -> partial_line + complete_lines
+    2) complete_lines 解码后, 做时间检查与拼接
+    3) 直到 data_lines数>=n 或到文件开头
+    4) 最后处理 partial_line
+    5) 返回 data_lines
+    """
     data_lines = DataLines(count=0, lines=[])
     with open(file_path, 'rb') as f:
         # 初始化文件大小
@@ -218,7 +329,14 @@ def _read_in_reverse(file_path: str, block_size: int, n: int, end_dt) -> list[st
     return items
 
 
-def _read_between_dates(file_path, block_size, dt_start, dt_end):
+def _read_between_dates(file_path, block_size, dt_start, dt_end, use_cache: bool = True):
+    columns = kline_cache.load_columns(file_path) if use_cache else None
+    if columns is not None:
+        return columns[columns.search_between(dt_start, dt_end)].read_lines()
+    columns = kline_index.read_between(file_path, dt_start, dt_end)
+    if columns is not None:
+        return columns.read_lines()
+
     lines_in_range = []
     with open(file_path, 'r', encoding='gb2312') as file:
         # 跳过文件的头两行
@@ -238,7 +356,14 @@ def _read_between_dates(file_path, block_size, dt_start, dt_end):
     return lines_in_range
 
 
-def _read_from_start(file_path, block_size, dt_start, n):
+def _read_from_start(file_path, block_size, dt_start, n, use_cache: bool = True):
+    columns = kline_cache.load_columns(file_path) if use_cache else None
+    if columns is not None:
+        return columns[columns.search_from_start(dt_start, n)].read_lines()
+    columns = kline_index.read_from_start(file_path, dt_start, n)
+    if columns is not None:
+        return columns.read_lines()
+
     lines_from_start = []
     with open(file_path, 'r', encoding='gb2312') as file:
         # 跳过文件的头两行
@@ -295,7 +420,8 @@ def _filter_special_lines(lines: list[str]) -> list[str]:
     return lines
 
 
-def tail_kline(file_path: str, n: int = 1000, start_dt="", end_dt="", encoding: str = 'gb2312') -> list[str]:
+def tail_kline(file_path: str, n: int = 1000, start_dt="", end_dt="", encoding: str = 'gb2312',
+               use_cache: bool = True) -> list[str]:
     """
     主函数：返回文件末尾 n 行(经过简单过滤)。
     具体步骤:
@@ -304,6 +430,9 @@ def tail_kline(file_path: str, n: int = 1000, start_dt="", end_dt="", encoding:
       3) 解码并截取最后 n 行(去空行)
       4) 进行"通达信、不复权、成交量"过滤
       5) 返回结果
+    use_cache为True时, 通达信导出文件先通过列式缓存定位行, 再一次读出对应的文本
+    只有 end_dt 时, 终点为文件中K线时间 <= end_dt 的最后一行(夜盘按文件中的日期比较);
+    有 start_dt 时按交易时间(夜盘减一天)检索
     """
     logging.info(f"read_file: {file_path}")
     # 1) 检查文件有效性
@@ -319,13 +448,13 @@ def tail_kline(file_path: str, n: int = 1000, start_dt="", end_dt="", encoding:
     # 根据不同情况调用读取逻辑
     if dt_start and dt_end:
         # 同时存在start和end，忽略n，取两个时间之间的数据
-        decoded_lines = _read_between_dates(file_path, block_size, dt_start, dt_end)
+        decoded_lines = _read_between_dates(file_path, block_size, dt_start, dt_end, use_cache)
     elif dt_start:
         # 只有start，取start开始的n条数据
-        decoded_lines = _read_from_start(file_path, block_size, dt_start, n)
+        decoded_lines = _read_from_start(file_path, block_size, dt_start, n, use_cache)
     else:
         # 原逻辑：以end_dt为终点，向前取n条数据
-        decoded_lines = _read_in_reverse(file_path, block_size, n, end_dt)
+        decoded_lines = _read_in_reverse(file_path, block_size, n, end_dt, use_cache)
 
 
     # decoded_lines = _read_in_reverse(file_path, block_size, n, end_dt)
@@ -340,6 +469,33 @@ def tail_kline(file_path: str, n: int = 1000, start_dt="", end_dt="", encoding:
     return filtered
 
 
+def tail_kline_columns(file_path: str, n: int = 1000, start_dt="", end_dt="",
+                       use_cache: bool = True) -> Optional[KLineColumns]:
+    """
+    与 tail_kline 的取数规则相同, 但直接返回列式K线的切片, 不再逐行解析文本.
+    use_cache为False时不使用列式缓存, 由稀疏索引定位后只解析需要的一段.
+    文件不是通达信导出格式(例如按 data_type 解析的csv)时返回 None
+    """
+    if not _check_file_validity(file_path):
+        return None
+    dt_start = datetime.strptime(start_dt, '%Y-%m-%d %H:%M:%S') if start_dt else None
+    dt_end = datetime.strptime(end_dt, '%Y-%m-%d %H:%M:%S') if end_dt else None
+    if not use_cache:   # 不用列式缓存时, 由稀疏索引定位, 只解析需要的一段
+        if dt_start and dt_end:
+            return kline_index.read_between(file_path, dt_start, dt_end)
+        elif dt_start:
+            return kline_index.read_from_start(file_path, dt_start, n)
+        return kline_index.read_tail(file_path, n, dt_end)
+    columns = kline_cache.load_columns(file_path)
+    if columns is None:
+        return None
+    if dt_start and dt_end:
+        return columns[columns.search_between(dt_start, dt_end)]
+    elif dt_start:
+        return columns[columns.search_from_start(dt_start, n)]
+    return columns[columns.search_tail(n, dt_end)]
+
+
 def write_file(file_name, lines: List[str], append: bool):
     """
     写文件， append为True表示追加，否则重新创新
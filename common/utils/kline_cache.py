@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""
+@file: kline_cache.py
+@author: luhx
+@desc: 通达信导出K线文件的列式缓存
+每个导出文件对应一个二进制缓存(.bin)和一个描述文件(.json)，
+二进制缓存按列存放 时间/交易时间/行偏移/开/高/低/收/量/持仓量，均为8字节定长，
+读取时用 numpy.memmap 映射，只有源文件的 mtime 或 size 变化时才重建。
+"""
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime
+from typing import Optional, List
+
+import numpy as np
+
+from common.config import KLINE_CACHE_PATH
+from common.utils import kline_parser
+
+CACHE_VERSION = 1
+COLUMNS = ["time", "key", "offset", "open", "high", "low", "close", "volume", "open_interest"]
+FLOAT_COLUMNS = COLUMNS[3:]
+
+
+def cache_base(file_path: str) -> str:
+    """
+    缓存文件路径前缀: 源文件名 + 源文件绝对路径的摘要, 避免不同目录下的同名文件互相覆盖
+    """
+    abs_path = os.path.abspath(file_path)
+    digest = hashlib.md5(abs_path.encode("utf-8")).hexdigest()[:8]
+    return os.path.join(KLINE_CACHE_PATH, f"{os.path.basename(abs_path)}.{digest}")
+
+
+def _cache_paths(file_path: str):
+    """返回 (meta_path, bin_path)"""
+    base = cache_base(file_path)
+    return base + ".json", base + ".bin"
+
+
+def _parse_file(file_path: str):
+    """整块读入源文件并批量解析, 返回 (列数据字典, 最后一个数据行的结束偏移)"""
+    with open(file_path, "rb") as f:
+        buf = f.read()
+    cols, data_end, _ = kline_parser.parse_tdx(buf)
+    return cols, data_end
+
+
+def _to_block(cols) -> np.ndarray:
+    """列数据按 COLUMNS 的顺序拼成 (列数, 行数) 的 int64 块, 浮点列按位存放"""
+    block = np.empty((len(COLUMNS), len(cols["time"])), dtype="<i8")
+    for i, name in enumerate(COLUMNS):
+        block[i] = cols[name].view("<i8")
+    return block
+
+
+def _is_sorted(key: np.ndarray) -> bool:
+    return bool(len(key) < 2 or np.all(np.diff(key.view("<i8")) >= 0))
+
+
+def _write_cache(file_path: str, st: os.stat_result, cols, data_end: int) -> dict:
+    """先写临时文件再替换, 避免读到写了一半的缓存"""
+    meta_path, bin_path = _cache_paths(file_path)
+    os.makedirs(KLINE_CACHE_PATH, exist_ok=True)
+    count = len(cols["time"])
+    meta = {
+        "version": CACHE_VERSION,
+        "source": os.path.abspath(file_path),
+        "mtime": st.st_mtime_ns,
+        "size": st.st_size,
+        "count": count,
+        "data_end": data_end,
+        "sorted": _is_sorted(cols["key"]),
+    }
+    block = _to_block(cols)
+    with open(bin_path + ".tmp", "wb") as f:
+        block.tofile(f)
+    with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(bin_path + ".tmp", bin_path)
+    os.replace(meta_path + ".tmp", meta_path)
+    return meta
+
+
+def read_meta(meta_path: str) -> Optional[dict]:
+    if not os.path.exists(meta_path):
+        return None
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (IOError, ValueError) as e:
+        logging.warning(f"读取缓存描述失败: {meta_path}, {e}")
+        return None
+
+
+def _is_fresh(meta: Optional[dict], st: os.stat_result) -> bool:
+    return bool(meta) and meta.get("version") == CACHE_VERSION and \
+        meta.get("mtime") == st.st_mtime_ns and meta.get("size") == st.st_size
+
+
+# 已映射的缓存: 绝对路径 -> (mtime, size, KLineColumns)
+_opened = {}
+
+
+def load_columns(file_path: str) -> Optional["KLineColumns"]:
+    """
+    返回源文件对应的列式K线(内存映射), 缓存过期时自动重建.
+    源文件不存在、不是通达信导出格式或缓存无法写入时返回 None, 由调用方走文本读取逻辑
+    """
+    if not os.path.isfile(file_path):
+        return None
+    abs_path = os.path.abspath(file_path)
+    st = os.stat(abs_path)
+    opened = _opened.get(abs_path)
+    if opened and opened[0] == st.st_mtime_ns and opened[1] == st.st_size:
+        return opened[2]
+    _opened.pop(abs_path, None)     # 先释放旧的映射, 才能替换缓存文件
+
+    meta_path, bin_path = _cache_paths(abs_path)
+    meta = read_meta(meta_path)
+    if not _is_fresh(meta, st) or not os.path.exists(bin_path):
+        logging.info(f"rebuild kline cache: {abs_path}")
+        try:
+            cols, data_end = _parse_file(abs_path)
+            meta = _write_cache(abs_path, st, cols, data_end)
+        except OSError as e:
+            logging.warning(f"写入K线缓存失败: {abs_path}, {e}")
+            return None
+    if not meta["count"]:
+        return None
+    block = np.memmap(bin_path, dtype="<i8", mode="r", shape=(len(COLUMNS), meta["count"]))
+    columns = KLineColumns(abs_path, block, meta["data_end"], meta["sorted"])
+    _opened[abs_path] = (st.st_mtime_ns, st.st_size, columns)
+    return columns
+
+
+def make_columns(file_path: str, cols, data_end: int) -> Optional["KLineColumns"]:
+    """由 kline_parser.parse_tdx 的解析结果生成内存中的列式K线, 没有数据时返回 None"""
+    if not len(cols["time"]):
+        return None
+    return KLineColumns(os.path.abspath(file_path), _to_block(cols), data_end, _is_sorted(cols["key"]))
+
+
+class KLineColumns:
+    """
+    列式K线, 各列为内存映射数组(或内存中的数组)及其切片视图:
+      time: 文件中的K线时间(datetime64[s]), search_tail 的终点按它比较
+      key: 交易时间, 夜盘减一天后的时间, search_between、search_from_start 按它检索
+      offset: 该行在源文件中的字节偏移
+      open/high/low/close/volume/open_interest: float64
+    """
+
+    def __init__(self, file_path: str, block, data_end: int, is_sorted: bool = True):
+        self.file_path = file_path
+        self.time = block[0].view("datetime64[s]")
+        self.key = block[1].view("datetime64[s]")
+        self.offset = block[2]
+        self.open = block[3].view("<f8")
+        self.high = block[4].view("<f8")
+        self.low = block[5].view("<f8")
+        self.close = block[6].view("<f8")
+        self.volume = block[7].view("<f8")
+        self.open_interest = block[8].view("<f8")
+        self.block = block
+        self.data_end = data_end    # 最后一行数据的结束偏移
+        self.is_sorted = is_sorted
+
+    def __len__(self):
+        return len(self.offset)
+
+    def __getitem__(self, s: slice) -> "KLineColumns":
+        b, e, _ = s.indices(len(self))
+        e = max(b, e)
+        data_end = int(self.offset[e]) if e < len(self) else self.data_end
+        return KLineColumns(self.file_path, self.block[:, b:e], data_end, self.is_sorted)
+
+    def _left(self, dt: datetime) -> int:
+        """第一根 key >= dt 的位置"""
+        v = np.datetime64(dt, "s")
+        if self.is_sorted:
+            return int(np.searchsorted(self.key, v, side="left"))
+        hit = np.flatnonzero(self.key >= v)
+        return int(hit[0]) if len(hit) else len(self)
+
+    def _right(self, dt: datetime) -> int:
+        """最后一根 key <= dt 的下一个位置"""
+        v = np.datetime64(dt, "s")
+        if self.is_sorted:
+            return int(np.searchsorted(self.key, v, side="right"))
+        hit = np.flatnonzero(self.key <= v)
+        return int(hit[-1]) + 1 if len(hit) else 0
+
+    def _tail_end(self, dt: datetime) -> int:
+        """
+        文件时间 time <= dt 的最后一行的下一个位置, 与原逆向读取的终点相同.
+        夜盘的 time 比 key 晚一天, time 不一定递增; key 有序时, key <= dt-1天 的行 time 都 <= dt,
+        只需在 key 落在 (dt-1天, dt] 的行中查找
+        """
+        v = np.datetime64(dt, "s")
+        if not self.is_sorted:
+            hit = np.flatnonzero(self.time <= v)
+            return int(hit[-1]) + 1 if len(hit) else 0
+        lo = int(np.searchsorted(self.key, v - np.timedelta64(1, "D"), side="right"))
+        hi = int(np.searchsorted(self.key, v, side="right"))
+        hit = np.flatnonzero(self.time[lo:hi] <= v)
+        return lo + int(hit[-1]) + 1 if len(hit) else lo
+
+    def search_tail(self, n: int, dt_end: Optional[datetime] = None) -> slice:
+        """以 dt_end(为空表示文件末尾)为终点, 向前取 n 根; 终点按文件中的K线时间比较, 不是交易时间"""
+        e = self._tail_end(dt_end) if dt_end else len(self)
+        return slice(max(e - n, 0), e)
+
+    def search_between(self, dt_start: datetime, dt_end: datetime) -> slice:
+        """取 dt_start 至 dt_end 之间(含两端)的K线"""
+        b = self._left(dt_start)
+        return slice(b, max(b, self._right(dt_end)))
+
+    def search_from_start(self, dt_start: datetime, n: int) -> slice:
+        """从 dt_start 开始向后取 n 根"""
+        b = self._left(dt_start)
+        return slice(b, min(b + n, len(self)))
+
+    def read_lines(self, encoding: str = "gb2312") -> List[str]:
+        """按偏移一次读出对应的原始文本行"""
+        if not len(self):
+            return []
+        begin = int(self.offset[0])
+        with open(self.file_path, "rb") as f:
+            f.seek(begin)
+            raw = f.read(self.data_end - begin)
+        text = raw.decode(encoding, errors="ignore")
+        return [line.strip() for line in text.split("\n") if line.strip()]
+
+    def arrays(self) -> List[np.ndarray]:
+        """[时间, 开, 高, 低, 收, 量] 各列, 与 DataItem 解析通达信行得到的字段顺序一致"""
+        return [self.time, self.open, self.high, self.low, self.close, self.volume]
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+@file: kline_converter.py
+@author: luhx
+@desc: 把通达信导出目录整体转换到K线parquet存储(kline_store)
+每个文件在存储中记录一个转换状态(store_path/品种/周期/_source.json): 源文件的 mtime、size、
+已转换到的最后一个数据行的结束偏移, 以及该行之前若干字节的摘要。
+  mtime、size 未变: 跳过
+  最后转换的数据行未变(只追加, 或重新导出后表尾"数据来源:通达信"被新数据替换): 只转换之后的行
+  否则: 整个文件重新转换
+各文件相互独立, 由进程池并行处理。
+"""
+import hashlib
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+from common.config import KLINE_STORE_PATH
+from common.utils import kline_parser, kline_store
+
+STATE_VERSION = 1
+_CHECK_SIZE = 256   # 比对已转换部分末尾的字节数
+
+
+def _state_path(store_path: str, symbol: str, period: str) -> str:
+    return os.path.join(store_path, symbol, period, "_source.json")
+
+
+def _read_state(path: str) -> Optional[dict]:
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except (IOError, ValueError) as e:
+        logging.warning(f"读取转换状态失败: {path}, {e}")
+        return None
+    return state if state.get("version") == STATE_VERSION else None
+
+
+def _write_state(path: str, state: dict):
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
+
+
+def _digest(f, end: int) -> str:
+    begin = max(end - _CHECK_SIZE, 0)
+    f.seek(begin)
+    return hashlib.md5(f.read(end - begin)).hexdigest()
+
+
+def symbol_of(file_path: str) -> str:
+    """品种名取文件名去掉扩展名, 例如 28#SRL9.txt -> 28#SRL9"""
+    return os.path.splitext(os.path.basename(file_path))[0]
+
+
+def convert_file(file_path: str, store_path: str = KLINE_STORE_PATH, period: str = "5m") -> dict:
+    """
+    转换一个导出文件, 返回 {file, symbol, status(skip/append/full/error), rows, bytes, seconds}
+    """
+    start = time.time()
+    symbol = symbol_of(file_path)
+    result = {"file": file_path, "symbol": symbol, "status": "skip", "rows": 0, "bytes": 0, "seconds": 0.0}
+    try:
+        st = os.stat(file_path)
+        state_path = _state_path(store_path, symbol, period)
+        state = _read_state(state_path)
+        if state and state["mtime"] == st.st_mtime_ns and state["size"] == st.st_size:
+            return result
+        with open(file_path, "rb") as f:
+            begin = 0
+            if state and state["data_end"] <= st.st_size and _digest(f, state["data_end"]) == state["digest"]:
+                begin = state["data_end"]
+            f.seek(begin)
+            buf = f.read()
+            cols, data_end, _ = kline_parser.parse_tdx(buf, begin, final=False)   # 没写完的末行留到下次
+            data_end = max(data_end, begin)
+            digest = _digest(f, data_end)
+        if begin == 0 and state:
+            kline_store.remove_klines(symbol, period, store_path)  # 源文件被改写, 丢弃旧数据
+        result["rows"] = kline_store.write_klines(symbol, period, cols, store_path)
+        result["status"] = "append" if begin else "full"
+        result["bytes"] = len(buf)
+        os.makedirs(os.path.dirname(state_path), exist_ok=True)
+        _write_state(state_path, {"version": STATE_VERSION, "source": os.path.abspath(file_path),
+                                  "mtime": st.st_mtime_ns, "size": st.st_size,
+                                  "data_end": data_end, "digest": digest})
+    except (OSError, ValueError) as e:
+        logging.exception(e)
+        result["status"] = "error"
+    result["seconds"] = time.time() - start
+    return result
+
+
+def convert_dir(src_dir: str, store_path: str = KLINE_STORE_PATH, period: str = "5m", workers: int = None,
+                suffix: str = ".txt") -> List[dict]:
+    """
+    用进程池转换目录下所有以 suffix 结尾的文件, 返回各文件的转换结果, 并在日志中输出吞吐量
+    """
+    files = sorted(os.path.join(src_dir, name) for name in os.listdir(src_dir)
+                   if name.endswith(suffix) and os.path.isfile(os.path.join(src_dir, name)))
+    start = time.time()
+    if workers == 1 or len(files) <= 1:
+        results = [convert_file(file, store_path, period) for file in files]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(convert_file, files, [store_path] * len(files), [period] * len(files)))
+    spend = max(time.time() - start, 1e-6)
+    rows = sum(r["rows"] for r in results)
+    size = sum(r["bytes"] for r in results)
+    counts = {status: sum(1 for r in results if r["status"] == status) for status in ("full", "append", "skip", "error")}
+    logging.info(f"convert {src_dir} -> {store_path}: {len(files)} files {counts}, {rows} rows, "
+                 f"{size / 1024 / 1024:.1f} MB in {spend:.2f}s, {rows / spend:,.0f} rows/s, "
+                 f"{size / 1024 / 1024 / spend:.1f} MB/s")
+    return results
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+@file: kline_follower.py
+@author: luhx
+@desc: 跟踪通达信导出文件的追加数据
+盘中通达信会不断向导出文件追加K线, 这里记住每个文件已读到的字节位置,
+文件变化时只读取并解析新追加的字节, 再把新K线推送给订阅者(图表、算法回调等)。
+变化检测: 有 inotify_simple 时(Linux)用 inotify 唤醒, 否则按 interval 轮询 util.check_file_modified。
+最后一行没写完时留到下一次, 文件被截断或改写时从头重读, 并以 reset=True 通知订阅者。
+"""
+import logging
+import os
+import threading
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+from common.util import check_file_modified
+from common.utils import kline_cache, kline_parser
+from common.utils.kline_cache import KLineColumns
+
+try:
+    from inotify_simple import INotify, flags
+except ImportError:     # Windows 等没有 inotify 的环境, 只用轮询
+    INotify = None
+
+# 订阅者: callback(file_path, 新K线, reset), reset为True表示文件被改写, 新K线是重读的全部数据
+Subscriber = Callable[[str, KLineColumns, bool], None]
+
+_MARK_SIZE = 64     # 用已读位置之前的若干字节判断文件是否被改写
+
+
+@dataclass
+class _FollowState:
+    offset: int = 0         # 已解析到的字节位置, 之后是未读或未写完的数据
+    mark: bytes = b""       # offset 之前的 _MARK_SIZE 个字节
+    size: int = 0           # 上次检查时的文件大小
+    subscribers: List[Subscriber] = field(default_factory=list)
+
+
+def _read_mark(f, offset: int) -> bytes:
+    begin = max(offset - _MARK_SIZE, 0)
+    f.seek(begin)
+    return f.read(offset - begin)
+
+
+def _last_line_end(file_path: str) -> int:
+    """文件中最后一个完整行的结束位置, 其后的半行视为未写完"""
+    with open(file_path, "rb") as f:
+        size = f.seek(0, 2)
+        pos = size
+        while pos > 0:
+            begin = max(pos - 4096, 0)
+            f.seek(begin)
+            nl = f.read(pos - begin).rfind(b"\n")
+            if nl >= 0:
+                return begin + nl + 1
+            pos = begin
+    return 0
+
+
+class KLineFollower:
+    """
+    用法:
+        follower = KLineFollower()
+        follower.follow(file_path, on_new_bars)
+        follower.start()    # 后台线程跟踪, 或由调用方定时调用 poll()
+    回调在跟踪线程中执行, 界面需要自行切换到主线程
+    """
+
+    def __init__(self, interval: float = 1.0):
+        self.interval = interval
+        self._files: Dict[str, _FollowState] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def follow(self, file_path: str, callback: Subscriber, offset: Optional[int] = None):
+        """
+        订阅文件的新K线.
+        :param offset: 从该字节位置之后开始跟踪, 为空时从当前最后一个完整行之后开始
+        """
+        abs_path = os.path.abspath(file_path)
+        with self._lock:
+            state = self._files.get(abs_path)
+            if state is None:
+                state = _FollowState(offset=_last_line_end(abs_path) if offset is None else offset)
+                with open(abs_path, "rb") as f:
+                    state.mark = _read_mark(f, state.offset)
+                    state.size = f.seek(0, 2)
+                check_file_modified(abs_path)   # 记下当前的修改时间
+                self._files[abs_path] = state
+            state.subscribers.append(callback)
+
+    def unfollow(self, file_path: str, callback: Optional[Subscriber] = None):
+        """取消订阅, callback为空时取消该文件的全部订阅"""
+        abs_path = os.path.abspath(file_path)
+        with self._lock:
+            state = self._files.get(abs_path)
+            if state is None:
+                return
+            if callback in state.subscribers:
+                state.subscribers.remove(callback)
+            if callback is None or not state.subscribers:
+                del self._files[abs_path]
+
+    def poll(self) -> int:
+        """检查所有跟踪的文件, 解析追加的数据并推送, 返回新K线数"""
+        with self._lock:
+            files = list(self._files.items())
+        total = 0
+        for abs_path, state in files:
+            try:
+                if not check_file_modified(abs_path) and os.path.getsize(abs_path) == state.size:
+                    continue
+                total += self._read_appended(abs_path, state)
+            except OSError as e:
+                logging.warning(f"跟踪K线文件失败: {abs_path}, {e}")
+        return total
+
+    def _read_appended(self, abs_path: str, state: _FollowState) -> int:
+        with open(abs_path, "rb") as f:
+            size = f.seek(0, 2)
+            state.size = size
+            reset = size < state.offset or _read_mark(f, state.offset) != state.mark
+            if reset:
+                logging.info(f"kline file rewritten, read from start: {abs_path}")
+                state.offset = 0
+            if size == state.offset:
+                return 0
+            f.seek(state.offset)
+            buf = f.read(size - state.offset)
+            cols, data_end, consumed = kline_parser.parse_tdx(buf, state.offset, final=False)
+            state.offset = consumed
+            state.mark = _read_mark(f, consumed)
+        columns = kline_cache.make_columns(abs_path, cols, data_end)
+        if columns is None:
+            return 0
+        logging.info(f"follow {abs_path}: {len(cols['time'])} new bars, offset={consumed}")
+        for callback in list(state.subscribers):
+            try:
+                callback(abs_path, columns, reset)
+            except Exception as e:
+                logging.exception(e)
+        return len(cols["time"])
+
+    def start(self):
+        """启动后台跟踪线程"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="kline-follower", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        notify = self._init_inotify()
+        while not self._stop.is_set():
+            if notify is not None:
+                notify.read(timeout=int(self.interval * 1000))     # 有变化时提前唤醒
+            else:
+                self._stop.wait(self.interval)
+            if not self._stop.is_set():
+                self.poll()
+        if notify is not None:
+            notify.close()
+
+    def _init_inotify(self):
+        if INotify is None:
+            return None
+        try:
+            notify = INotify()
+            with self._lock:
+                dirs = {os.path.dirname(p) for p in self._files}
+            for d in dirs:
+                notify.add_watch(d, flags.MODIFY | flags.CLOSE_WRITE | flags.MOVED_TO | flags.CREATE)
+            return notify
+        except OSError as e:
+            logging.warning(f"inotify不可用, 改为轮询: {e}")
+            return None
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+@file: kline_index.py
+@author: luhx
+@desc: 通达信导出K线文件的稀疏索引
+每隔 INDEX_STEP 行记录一次 (交易时间, 行偏移), 存为缓存目录下的 .idx 文件。
+索引只建一次, 源文件追加数据后从上次索引到的位置继续扩展;
+按时间取数时先二分查找索引得到字节范围, 只读取并解析这一段文本。
+与列式缓存相比, 索引很小(每256行16字节), 不使用列式缓存时用它定位。
+"""
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+import numpy as np
+
+from common.config import KLINE_CACHE_PATH
+from common.utils import kline_cache, kline_parser
+from common.utils.kline_cache import KLineColumns
+
+INDEX_VERSION = 1
+INDEX_STEP = 256            # 每隔多少行记录一个索引项
+READ_BLOCK = 1 << 22        # 建索引时每次读取的字节数
+_CHECK_SIZE = 256           # 判断源文件是否只是追加时, 比对的头尾字节数
+
+
+def _index_paths(file_path: str):
+    """返回 (meta_path, idx_path)"""
+    base = kline_cache.cache_base(file_path)
+    return base + ".idx.json", base + ".idx"
+
+
+def _digest(f, begin: int, end: int) -> str:
+    f.seek(max(begin, 0))
+    return hashlib.md5(f.read(max(end - begin, 0))).hexdigest()
+
+
+class SparseIndex:
+    """
+    稀疏索引:
+      key: 第 i*step 行的交易时间(datetime64[s])
+      offset: 第 i*step 行在源文件中的字节偏移
+      count: 已索引的总行数, indexed_end: 已索引到的字节位置
+    """
+
+    def __init__(self, file_path: str, entries: np.ndarray, meta: dict):
+        self.file_path = file_path
+        self.key = entries[:, 0].view("datetime64[s]")
+        self.offset = entries[:, 1]
+        self.step = meta["step"]
+        self.count = meta["count"]
+        self.indexed_end = meta["indexed_end"]
+        self.is_sorted = meta["sorted"]
+
+    def __len__(self):
+        return len(self.offset)
+
+    def _pos(self, i: int) -> Optional[int]:
+        """第 i 个索引项的偏移, 超出索引时返回 None 表示读到文件尾"""
+        return int(self.offset[i]) if i < len(self) else None
+
+    def _before(self, dt: datetime) -> int:
+        """最后一个 key < dt 的索引项, 从它开始读不会漏掉 >= dt 的行"""
+        return max(int(np.searchsorted(self.key, np.datetime64(dt, "s"), side="left")) - 1, 0)
+
+    def _after(self, dt: datetime) -> int:
+        """第一个 key > dt 的索引项, 读到它为止不会漏掉 <= dt 的行"""
+        return int(np.searchsorted(self.key, np.datetime64(dt, "s"), side="right"))
+
+    def range_between(self, dt_start: datetime, dt_end: datetime) -> Tuple[int, Optional[int]]:
+        return int(self.offset[self._before(dt_start)]), self._pos(self._after(dt_end))
+
+    def range_tail(self, n: int, dt_end: Optional[datetime]) -> Tuple[int, Optional[int]]:
+        # 终点按文件时间比较(见 KLineColumns.search_tail), 它在交易时间 (dt_end-1天, dt_end] 之间, 起点从 dt_end-1天 往前推
+        j = self._after(dt_end) if dt_end else len(self)
+        a = self._after(dt_end - timedelta(days=1)) if dt_end else len(self)
+        k = max(a - (n + self.step - 1) // self.step - 1, 0)
+        return int(self.offset[k]), self._pos(j)
+
+    def range_from_start(self, dt_start: datetime, n: int) -> Tuple[int, Optional[int]]:
+        i = self._before(dt_start)
+        return int(self.offset[i]), self._pos(i + (n + self.step - 1) // self.step + 1)
+
+    def read(self, begin: int, end: Optional[int]) -> Optional[KLineColumns]:
+        """读取并解析 [begin, end) 的文本, end 为 None 时读到文件尾"""
+        with open(self.file_path, "rb") as f:
+            f.seek(begin)
+            buf = f.read() if end is None else f.read(end - begin)
+        cols, data_end, _ = kline_parser.parse_tdx(buf, begin)
+        return kline_cache.make_columns(self.file_path, cols, data_end)
+
+
+def _scan(f, begin: int, count: int, step: int, last_key: Optional[int]):
+    """
+    从 begin 开始分块解析, 第 count 行起每 step 行取一个索引项.
+    返回 (新增索引项, 新增行数, 解析到的位置, 是否有序, 最后一行的交易时间)
+    末尾没有换行的半行留到下次扩展
+    """
+    entries = []
+    total = 0
+    pos = begin
+    is_sorted = True
+    f.seek(begin)
+    rest = b""
+    while block := f.read(READ_BLOCK):
+        buf = rest + block
+        cols, _, consumed = kline_parser.parse_tdx(buf, pos, final=False)
+        key = cols["key"].view("<i8")
+        if len(key):
+            if (last_key is not None and key[0] < last_key) or np.any(np.diff(key) < 0):
+                is_sorted = False
+            last_key = int(key[-1])
+            pick = np.flatnonzero((count + total + np.arange(len(key))) % step == 0)
+            entries.append(np.stack([key[pick], cols["offset"][pick]], axis=1))
+            total += len(key)
+        rest = buf[consumed - pos:]
+        pos = consumed
+    entries = np.concatenate(entries).astype("<i8") if entries else np.empty((0, 2), dtype="<i8")
+    return entries, total, pos, is_sorted, last_key
+
+
+def _write_index(meta_path: str, idx_path: str, entries: np.ndarray, meta: dict):
+    os.makedirs(KLINE_CACHE_PATH, exist_ok=True)
+    with open(idx_path + ".tmp", "wb") as f:
+        entries.tofile(f)
+    with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(idx_path + ".tmp", idx_path)
+    os.replace(meta_path + ".tmp", meta_path)
+
+
+def _build(f, st: os.stat_result, meta: Optional[dict], entries: Optional[np.ndarray]):
+    """meta 不为空时从 meta["indexed_end"] 继续扩展, 否则从头建立"""
+    if meta is None:
+        meta = {"version": INDEX_VERSION, "step": INDEX_STEP, "count": 0, "indexed_end": 0,
+                "sorted": True, "last_key": None}
+        entries = np.empty((0, 2), dtype="<i8")
+    new_entries, total, pos, is_sorted, last_key = _scan(f, meta["indexed_end"], meta["count"], meta["step"],
+                                                         meta["last_key"])
+    entries = np.concatenate([entries, new_entries])
+    meta.update({
+        "source": os.path.abspath(f.name),
+        "mtime": st.st_mtime_ns,
+        "size": st.st_size,
+        "count": meta["count"] + total,
+        "indexed_end": pos,
+        "sorted": bool(meta["sorted"] and is_sorted),
+        "last_key": last_key,
+        "head": _digest(f, 0, _CHECK_SIZE),
+        "tail": _digest(f, pos - _CHECK_SIZE, pos),
+    })
+    return entries, meta
+
+
+def _can_extend(f, meta: dict, st: os.stat_result) -> bool:
+    """源文件只是在尾部追加了数据: 变大了, 且已索引部分的头尾字节未变"""
+    pos = meta["indexed_end"]
+    return st.st_size >= meta["size"] and meta.get("head") == _digest(f, 0, _CHECK_SIZE) and \
+        meta.get("tail") == _digest(f, pos - _CHECK_SIZE, pos)
+
+
+# 已加载的索引: 绝对路径 -> (mtime, size, SparseIndex)
+_opened = {}
+
+
+def load_index(file_path: str) -> Optional[SparseIndex]:
+    """
+    返回源文件的稀疏索引, 不存在时建立, 源文件追加数据后扩展, 被改写时重建.
+    不是通达信导出格式、时间不是递增或索引无法写入时返回 None, 由调用方走文本读取逻辑
+    """
+    if not os.path.isfile(file_path):
+        return None
+    abs_path = os.path.abspath(file_path)
+    st = os.stat(abs_path)
+    opened = _opened.get(abs_path)
+    if opened and opened[0] == st.st_mtime_ns and opened[1] == st.st_size:
+        return opened[2]
+
+    meta_path, idx_path = _index_paths(abs_path)
+    meta = kline_cache.read_meta(meta_path)
+    entries = None
+    if meta and meta.get("version") == INDEX_VERSION and os.path.exists(idx_path):
+        entries = np.fromfile(idx_path, dtype="<i8").reshape(-1, 2)
+    else:
+        meta = None
+    try:
+        with open(abs_path, "rb") as f:
+            fresh = bool(meta) and meta["mtime"] == st.st_mtime_ns and meta["size"] == st.st_size
+            if meta and not fresh and not _can_extend(f, meta, st):
+                meta = None
+            if not fresh:
+                logging.info(f"extend kline index: {abs_path}, from {meta['indexed_end']}" if meta
+                             else f"build kline index: {abs_path}")
+                entries, meta = _build(f, st, meta, entries)
+                _write_index(meta_path, idx_path, entries, meta)
+    except OSError as e:
+        logging.warning(f"写入K线索引失败: {abs_path}, {e}")
+        return None
+    if not meta["count"] or not meta["sorted"]:
+        return None
+    index = SparseIndex(abs_path, entries, meta)
+    _opened[abs_path] = (st.st_mtime_ns, st.st_size, index)
+    return index
+
+
+def read_between(file_path: str, dt_start: datetime, dt_end: datetime) -> Optional[KLineColumns]:
+    """取 dt_start 至 dt_end 之间(含两端)的K线, 只读取索引定位到的字节范围"""
+    index = load_index(file_path)
+    columns = index.read(*index.range_between(dt_start, dt_end)) if index else None
+    return columns[columns.search_between(dt_start, dt_end)] if columns is not None else None
+
+
+def read_tail(file_path: str, n: int, dt_end: Optional[datetime] = None) -> Optional[KLineColumns]:
+    """以 dt_end(为空表示文件末尾)为终点, 向前取 n 根"""
+    index = load_index(file_path)
+    columns = index.read(*index.range_tail(n, dt_end)) if index else None
+    return columns[columns.search_tail(n, dt_end)] if columns is not None else None
+
+
+def read_from_start(file_path: str, dt_start: datetime, n: int) -> Optional[KLineColumns]:
+    """从 dt_start 开始向后取 n 根"""
+    index = load_index(file_path)
+    columns = index.read(*index.range_from_start(dt_start, n)) if index else None
+    return columns[columns.search_from_start(dt_start, n)] if columns is not None else None
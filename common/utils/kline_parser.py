@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+@file: kline_parser.py
+@author: luhx
+@desc: K线文本的批量解析
+直接在字节上做向量化解析, 一次把整块文本转换成类型化的 numpy 数组,
+不再逐行 gb2312 解码、strptime 和 float()。
+支持两种格式:
+  1 通达信导出: YYYY/MM/DD,HHMM,开,高,低,收,量,持仓量,结算价 (日期分隔符也可为'-')
+  2 按 data_type 描述的csv: 例如 ["datetime", "float", "float"], datetime 格式为 %Y-%m-%d %H:%M:%S
+表头、表尾("数据来源:通达信")等非数据行自动跳过。
+"""
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+TDX_FIELDS = ["open", "high", "low", "close", "volume", "open_interest", "settle"]
+CHUNK_SIZE = 1 << 20    # 每次最多处理1M字节, 限制中间数组的内存
+
+_NL, _CR, _COMMA, _DOT, _MINUS = ord("\n"), ord("\r"), ord(","), ord("."), ord("-")
+
+
+def _split_chunks(buf: bytes, final: bool):
+    """
+    按换行切成不超过 CHUNK_SIZE 的块, 返回 [(begin, end)] 和已处理到的位置.
+    final为False时, 最后一行若没有换行结尾视为未写完, 不处理
+    """
+    size = len(buf)
+    last_nl = buf.rfind(b"\n")
+    stop = size if final else last_nl + 1
+    chunks = []
+    begin = 0
+    while begin < stop:
+        end = min(begin + CHUNK_SIZE, stop)
+        if end < stop:
+            nl = buf.rfind(b"\n", begin, end)
+            end = nl + 1 if nl >= begin else buf.find(b"\n", end) + 1 or stop
+        chunks.append((begin, end))
+        begin = end
+    return chunks, stop
+
+
+def _chunk_array(buf: bytes, begin: int, end: int) -> np.ndarray:
+    """取一块字节, 保证以换行结尾"""
+    if end > begin and buf[end - 1] != _NL:
+        return np.frombuffer(buf[begin:end] + b"\n", dtype=np.uint8)
+    return np.frombuffer(buf, dtype=np.uint8, count=end - begin, offset=begin)
+
+
+def _data_lines(a: np.ndarray, n_fields: int):
+    """
+    找出数据行: 以数字开头, 且逗号数为 n_fields-1. a 必须以换行结尾.
+    返回 (行首位置, 有效行掩码, 只保留有效行且去掉'\r'后的字节)
+    """
+    is_nl = a == _NL
+    ends = np.flatnonzero(is_nl)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    line_of_byte = np.cumsum(is_nl, dtype=np.int32)
+    line_of_byte -= is_nl
+    commas = np.bincount(line_of_byte[a == _COMMA], minlength=len(starts))
+    first = a[starts]
+    valid = (commas == n_fields - 1) & (first >= 48) & (first <= 57)
+    keep = valid[line_of_byte]
+    keep &= a != _CR
+    return starts, valid, a[keep]
+
+
+def _fields(b: np.ndarray, n_fields: int):
+    """
+    逐字段解析: 字段内的数字按顺序拼成整数尾数, 再除以10的小数位数次方.
+    尾数小于2^53时累加是精确的, 结果与 float() 一致; 日期时间字段得到的是数字拼接, 例如 20200102.
+    返回 (数值, 字段内数字个数, 字段字节长度), 形状均为 (行数, n_fields)
+    """
+    delim = (b == _COMMA) | (b == _NL)
+    ends = np.flatnonzero(delim)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    field = np.cumsum(delim, dtype=np.int32)
+    field -= delim
+    digit = (b >= 48) & (b <= 57)
+    cd = np.cumsum(digit, dtype=np.int32)   # 截至每个位置(含)的数字个数
+    cd_end = cd[ends]
+    n_digits = cd_end - np.concatenate(([0], cd_end[:-1]))
+    pos = np.flatnonzero(digit)
+    fp = field[pos]
+    exp = cd_end[fp] - cd[pos]
+    nf = len(ends)
+    mant = np.bincount(fp, weights=(b[pos] - 48) * np.power(10.0, exp), minlength=nf)
+    frac = np.zeros(nf, dtype=np.int32)
+    dot = np.flatnonzero(b == _DOT)
+    frac[field[dot]] = cd_end[field[dot]] - cd[dot]
+    values = mant / np.power(10.0, frac)
+    values[field[b == _MINUS]] *= -1
+    values[n_digits == 0] = np.nan
+    return values.reshape(-1, n_fields), n_digits.reshape(-1, n_fields), (ends - starts).reshape(-1, n_fields)
+
+
+def _to_datetime64(y, m, d, hh, mm, ss) -> np.ndarray:
+    days = ((y - 1970) * 12 + (m - 1)).astype("datetime64[M]").astype("datetime64[D]") + (d - 1)
+    return days.astype("datetime64[s]") + (hh * 3600 + mm * 60 + ss).astype("timedelta64[s]")
+
+
+def trade_key(time: np.ndarray) -> np.ndarray:
+    """夜盘K线(17点后、7点前)减一天得到交易时间, 与 file_txt._read_between_dates 的处理一致"""
+    hour = (time - time.astype("datetime64[D]")).astype("timedelta64[h]").astype(np.int64)
+    night = ((hour > 17) | (hour < 7)).astype(np.int64)
+    return time - night.astype("timedelta64[D]")
+
+
+def _empty_tdx() -> Dict[str, np.ndarray]:
+    cols = {"time": np.empty(0, "datetime64[s]"), "key": np.empty(0, "datetime64[s]"),
+            "offset": np.empty(0, np.int64)}
+    for name in TDX_FIELDS:
+        cols[name] = np.empty(0, np.float64)
+    return cols
+
+
+def parse_tdx(buf: bytes, base_offset: int = 0, final: bool = True) -> Tuple[Dict[str, np.ndarray], int, int]:
+    """
+    批量解析通达信导出文本.
+    :param buf: 原始字节
+    :param base_offset: buf 在文件中的起始偏移, 用于计算每行的 offset
+    :param final: buf 是否是完整的文件尾; 为 False 时末尾没有换行的半行不解析
+    :return: (列数据, 最后一个数据行的结束偏移, 已处理到的偏移)
+        列数据包括 time/key/offset 及 open/high/low/close/volume/open_interest/settle
+    """
+    chunks, stop = _split_chunks(buf, final)
+    parts = []
+    data_end = base_offset
+    for begin, end in chunks:
+        a = _chunk_array(buf, begin, end)
+        starts, valid, b = _data_lines(a, 9)
+        if not valid.any():
+            continue
+        line_end = np.append(starts[1:], len(a))[valid][-1]
+        data_end = base_offset + begin + min(int(line_end), end - begin)
+        values, n_digits, lens = _fields(b, 9)
+        # 日期必须是 YYYY/MM/DD 的10个字符、8位数字
+        ok = (lens[:, 0] == 10) & (n_digits[:, 0] == 8) & (n_digits[:, 1] > 0)
+        ymd = np.abs(values[ok, 0]).astype(np.int64)
+        hm = values[ok, 1].astype(np.int64)
+        month, day = ymd // 100 % 100, ymd % 100
+        good = (month >= 1) & (month <= 12) & (day >= 1) & (day <= 31)
+        ok[ok] = good
+        ymd, hm = ymd[good], hm[good]
+        time = _to_datetime64(ymd // 10000, ymd // 100 % 100, ymd % 100, hm // 100, hm % 100, 0)
+        cols = {"time": time, "key": trade_key(time), "offset": base_offset + begin + starts[valid][ok]}
+        for i, name in enumerate(TDX_FIELDS):
+            cols[name] = np.ascontiguousarray(values[ok, i + 2])
+        parts.append(cols)
+    if not parts:
+        return _empty_tdx(), data_end, base_offset + stop
+    merged = {k: np.concatenate([p[k] for p in parts]) for k in parts[0]}
+    return merged, data_end, base_offset + stop
+
+
+def parse_schema(buf: bytes, data_type: List[str], encoding: str = "gb2312") -> List[np.ndarray]:
+    """
+    按 data_type 批量解析csv文本, 每种类型对应一列:
+      datetime -> datetime64[s] (格式 %Y-%m-%d %H:%M:%S)
+      float    -> float64
+      其它     -> 原样的字符串
+    """
+    n_fields = len(data_type)
+    chunks, _ = _split_chunks(buf, True)
+    parts: List[List[np.ndarray]] = []
+    for begin, end in chunks:
+        a = _chunk_array(buf, begin, end)
+        _, valid, b = _data_lines(a, n_fields)
+        if not valid.any():
+            continue
+        values, n_digits, _ = _fields(b, n_fields)
+        cols = []
+        for i, t in enumerate(data_type):
+            if t == "datetime":
+                v = np.abs(values[:, i]).astype(np.int64)   # YYYYMMDDHHMMSS
+                ymd, hms = v // 1000000, v % 1000000
+                cols.append(_to_datetime64(ymd // 10000, ymd // 100 % 100, ymd % 100,
+                                           hms // 10000, hms // 100 % 100, hms % 100))
+            elif t == "float":
+                cols.append(np.ascontiguousarray(values[:, i]))
+            else:
+                text = b.tobytes().split(b"\n")[:-1]
+                cols.append(np.array([line.split(b",")[i].decode(encoding, errors="ignore").strip()
+                                      for line in text], dtype=object))
+        parts.append(cols)
+    if not parts:
+        return []
+    return [np.concatenate([p[i] for p in parts]) for i in range(n_fields)]
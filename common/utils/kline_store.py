@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+@file: kline_store.py
+@author: luhx
+@desc: 按品种、周期分区的K线parquet存储
+目录结构: store_path/品种/周期/年份.parquet, 例如 data/kline_store/28#SRL9/5m/2024.parquet
+年份按交易时间(夜盘减一天)划分, 文件内按交易时间排序并按 ROW_GROUP_SIZE 分行组,
+查询时先按年份挑文件, 再用行组的最小/最大值统计跳过不在范围内的行组。
+依赖 pyarrow, 没有安装时 available() 返回 False, 调用方继续使用文本文件。
+"""
+import logging
+import os
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from common.config import KLINE_STORE_PATH
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:     # 只用文本文件时不需要 pyarrow
+    pa = None
+    pq = None
+
+STORE_COLUMNS = ["time", "key", "open", "high", "low", "close", "volume", "open_interest"]
+ROW_GROUP_SIZE = 4096
+
+
+def available() -> bool:
+    return pq is not None
+
+
+def _period_dir(root: str, symbol: str, period: str) -> str:
+    return os.path.join(root, symbol, period)
+
+
+def _years(root: str, symbol: str, period: str) -> List[int]:
+    """已有数据的年份, 升序"""
+    path = _period_dir(root, symbol, period)
+    if not os.path.isdir(path):
+        return []
+    return sorted(int(name[:-8]) for name in os.listdir(path) if name.endswith(".parquet") and name[:-8].isdigit())
+
+
+def _year_path(root: str, symbol: str, period: str, year: int) -> str:
+    return os.path.join(_period_dir(root, symbol, period), f"{year}.parquet")
+
+
+def list_symbols(root: str = KLINE_STORE_PATH) -> List[str]:
+    """存储中的全部品种"""
+    if not os.path.isdir(root):
+        return []
+    return sorted(name for name in os.listdir(root) if os.path.isdir(os.path.join(root, name)))
+
+
+def _to_table(cols: Dict[str, np.ndarray]) -> "pa.Table":
+    return pa.table({name: cols[name] for name in STORE_COLUMNS})
+
+
+def _from_table(table: "pa.Table") -> Dict[str, np.ndarray]:
+    cols = {name: table.column(name).to_numpy() for name in STORE_COLUMNS}
+    cols["time"] = cols["time"].astype("datetime64[s]")
+    cols["key"] = cols["key"].astype("datetime64[s]")
+    return cols
+
+
+def write_klines(symbol: str, period: str, cols: Dict[str, np.ndarray], root: str = KLINE_STORE_PATH) -> int:
+    """
+    写入K线(列数据, 例如 kline_parser.parse_tdx 的结果), 与已有数据按时间合并, 时间相同的以新数据为准.
+    只重写涉及到的年份文件, 返回写入的行数
+    """
+    count = len(cols["time"])
+    if not count:
+        return 0
+    os.makedirs(_period_dir(root, symbol, period), exist_ok=True)
+    key_year = cols["key"].astype("datetime64[Y]").astype(np.int64) + 1970
+    for year in np.unique(key_year):
+        mask = key_year == year
+        part = {name: np.asarray(cols[name])[mask] for name in STORE_COLUMNS}
+        path = _year_path(root, symbol, period, int(year))
+        if os.path.exists(path):
+            old = _from_table(pq.read_table(path))
+            keep = ~np.isin(old["time"], part["time"])
+            part = {name: np.concatenate([old[name][keep], part[name]]) for name in STORE_COLUMNS}
+        order = np.lexsort((part["time"], part["key"]))
+        part = {name: part[name][order] for name in STORE_COLUMNS}
+        pq.write_table(_to_table(part), path + ".tmp", row_group_size=ROW_GROUP_SIZE)
+        os.replace(path + ".tmp", path)
+    logging.info(f"write kline store: {symbol}/{period}, {count} rows")
+    return count
+
+
+def remove_klines(symbol: str, period: str, root: str = KLINE_STORE_PATH):
+    """删除一个品种、周期的全部年份文件"""
+    for year in _years(root, symbol, period):
+        os.remove(_year_path(root, symbol, period, year))
+
+
+def _read_year(root: str, symbol: str, period: str, year: int, filters) -> Dict[str, np.ndarray]:
+    """读取一个年份文件, filters 用于跳过行组"""
+    table = pq.read_table(_year_path(root, symbol, period, year), columns=STORE_COLUMNS, filters=filters or None)
+    return _from_table(table)
+
+
+def _concat(parts: List[Dict[str, np.ndarray]]) -> Optional[Dict[str, np.ndarray]]:
+    parts = [p for p in parts if len(p["time"])]
+    if not parts:
+        return None
+    return {name: np.concatenate([p[name] for p in parts]) for name in STORE_COLUMNS}
+
+
+def read_klines(symbol: str, period: str, n: int = 1000, start_dt: Optional[datetime] = None,
+                end_dt: Optional[datetime] = None, root: str = KLINE_STORE_PATH) -> Optional[Dict[str, np.ndarray]]:
+    """
+    取K线, 规则与 file_txt.tail_kline 相同:
+      start_dt和end_dt都有: 按交易时间取两者之间(含两端)的K线
+      只有start_dt: 按交易时间从start_dt开始向后取n根
+      否则: 以K线时间 <= end_dt(为空表示最后)的最后一根为终点向前取n根
+    没有数据时返回 None
+    """
+    years = _years(root, symbol, period)
+    if not years:
+        return None
+    parts: List[Dict[str, np.ndarray]] = []
+    if start_dt and end_dt:
+        filters = [("key", ">=", start_dt), ("key", "<=", end_dt)]
+        for year in years:
+            if start_dt.year <= year <= end_dt.year:
+                parts.append(_read_year(root, symbol, period, year, filters))
+        return _concat(parts)
+    elif start_dt:
+        filters = [("key", ">=", start_dt)]
+        total = 0
+        for year in years:
+            if year < start_dt.year:
+                continue
+            parts.append(_read_year(root, symbol, period, year, filters))
+            total += len(parts[-1]["time"])
+            if total >= n:
+                break
+        cols = _concat(parts)
+        return {name: v[:n] for name, v in cols.items()} if cols else None
+    # 终点与 KLineColumns.search_tail 相同, 按K线时间 time <= end_dt 比较; 夜盘的 time 比 key 晚一天,
+    # 先用 key <= end_dt 读出(包含全部 time <= end_dt 的行), 再截掉最后一行 time <= end_dt 之后的行
+    filters = [("key", "<=", end_dt)] if end_dt else []
+    end = np.datetime64(end_dt, "s") if end_dt else None
+    total = 0
+    for year in reversed(years):
+        if end_dt and year > end_dt.year:
+            continue
+        parts.insert(0, _read_year(root, symbol, period, year, filters))
+        if end is not None and not total:
+            hit = np.flatnonzero(parts[0]["time"] <= end)
+            total = int(hit[-1]) + 1 if len(hit) else 0
+        else:
+            total += len(parts[0]["time"])
+        if total >= n:
+            break
+    cols = _concat(parts)
+    if cols and end is not None:
+        hit = np.flatnonzero(cols["time"] <= end)
+        cols = {name: v[:int(hit[-1]) + 1] for name, v in cols.items()} if len(hit) else None
+    return {name: v[-n:] for name, v in cols.items()} if cols else None
+
+
+def arrays(cols: Dict[str, np.ndarray]) -> List[np.ndarray]:
+    """[时间, 开, 高, 低, 收, 量] 各列, 与 KLineColumns.arrays() 的顺序一致"""
+    return [cols["time"], cols["open"], cols["high"], cols["low"], cols["close"], cols["volume"]]
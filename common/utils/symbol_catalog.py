@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+@file: symbol_catalog.py
+@author: luhx
+@desc: 键盘精灵的品种目录
+记录 base_path 下每个通达信导出文件的 代码、名称、拼音首字母、文件名、mtime、size,
+保存在缓存目录下, 启动时只重新读取 mtime 或 size 变化了的文件的表头, 其余直接使用目录中的记录。
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+from common.config import KLINE_CACHE_PATH
+
+CATALOG_VERSION = 1
+# 文件名以数字开头, 紧跟一个井号, 以 L9.txt 结尾, 例如 28#SRL9.txt
+FILE_PATTERN = re.compile(r'^\d+#[^#]*L9\.txt$')
+
+
+def _catalog_path(base_path: str) -> str:
+    abs_path = os.path.abspath(base_path)
+    digest = hashlib.md5(abs_path.encode("utf-8")).hexdigest()[:8]
+    return os.path.join(KLINE_CACHE_PATH, f"symbol_catalog.{digest}.json")
+
+
+def _read_header(file_path: str) -> Optional[Tuple[str, str]]:
+    """读取表头第一行, 例如 '28#SRL9 白糖主连 5分钟 不复权', 返回 (代码, 名称)"""
+    with open(file_path, "rb") as f:
+        first_line = f.readline().decode("gb2312", errors="ignore").strip()
+    fields = first_line.split()
+    if len(fields) >= 2:
+        return fields[0].strip(), fields[1].strip()
+    return None
+
+
+def _load(path: str) -> Dict[str, dict]:
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (IOError, ValueError) as e:
+        logging.warning(f"读取品种目录失败: {path}, {e}")
+        return {}
+    if data.get("version") != CATALOG_VERSION:
+        return {}
+    return {item["file_name"]: item for item in data["items"]}
+
+
+def _save(path: str, items: List[dict]):
+    try:
+        os.makedirs(KLINE_CACHE_PATH, exist_ok=True)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"version": CATALOG_VERSION, "items": items}, f, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+    except OSError as e:
+        logging.warning(f"写入品种目录失败: {path}, {e}")
+
+
+def load_catalog(base_path: str) -> List[dict]:
+    """
+    返回 base_path 下的品种列表, 每项为 {code, name, pinyin, file_name, mtime, size},
+    只有新增或变化了的文件才读表头并计算拼音, 有变化时写回目录文件
+    """
+    path = _catalog_path(base_path)
+    old = _load(path)
+    items: List[dict] = []
+    changed = False
+    with os.scandir(base_path) as it:
+        entries = sorted((e for e in it if FILE_PATTERN.match(e.name) and e.is_file()), key=lambda e: e.name)
+    for entry in entries:
+        st = entry.stat()
+        item = old.get(entry.name)
+        if item and item["mtime"] == st.st_mtime_ns and item["size"] == st.st_size:
+            items.append(item)
+            continue
+        changed = True
+        code, name, pinyin = "", "", ""     # 没有表头的文件也记下来, 未变化时不再重复读取
+        header = _read_header(entry.path)
+        if header:
+            from common.utils.pinyin_util import get_pinyin_first_letters    # pypinyin加载较慢, 用到时才导入
+            code, name = header
+            pinyin = get_pinyin_first_letters(name)
+        items.append({"code": code, "name": name, "pinyin": pinyin,
+                      "file_name": entry.name, "mtime": st.st_mtime_ns, "size": st.st_size})
+    if changed or len(items) != len(old):
+        logging.info(f"update symbol catalog: {path}, {len(items)} files")
+        _save(path, items)
+    return [item for item in items if item["code"]]
+
+
+class SymbolIndex:
+    """
+    品种检索: 代码或拼音首字母中包含输入串(不区分大小写)的品种, 结果保持目录顺序.
+    对代码和拼音的所有长度不超过 NGRAM 的子串建立倒排表,
+    输入不超过 NGRAM 个字符时直接取倒排表, 更长时取其中最短的倒排表再逐个确认.
+    """
+    NGRAM = 3
+
+    def __init__(self, items: List[dict]):
+        self.items = items
+        self._keys: List[Tuple[str, str]] = [(item["code"].upper(), item["pinyin"].upper()) for item in items]
+        postings: Dict[str, List[int]] = {}
+        for i, keys in enumerate(self._keys):
+            grams = set()
+            for key in keys:
+                for n in range(1, self.NGRAM + 1):
+                    grams.update(key[b:b + n] for b in range(len(key) - n + 1))
+            for gram in grams:
+                postings.setdefault(gram, []).append(i)
+        self._postings = postings
+
+    def search(self, text: str) -> List[int]:
+        """返回匹配的品种在 items 中的下标"""
+        query = text.strip().upper()
+        if not query:
+            return []
+        if len(query) <= self.NGRAM:
+            return self._postings.get(query, [])
+        candidates = min((self._postings.get(query[b:b + self.NGRAM], []) for b in range(len(query) - self.NGRAM + 1)),
+                         key=len)
+        return [i for i in candidates if query in self._keys[i][0] or query in self._keys[i][1]]
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+"""
+@file: conftest.py
+@author: luhx
+@desc: 测试共用的K线数据和结果比较
+  real_klines: data/28#SRL9.txt 的前 count 根K线
+  summary: 笔、线段、笔中枢、段中枢的可比较形式, 各测试按同样的字段与批量计算比较
+"""
+import os
+import sys
+work_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(work_dir)
+from common.model.kline import KLineSeries
+from common.utils import kline_parser
+
+DATA_FILE = os.path.join(work_dir, "data/28#SRL9.txt")
+SYMBOL = "28#SRL9"
+
+
+def real_klines(count: int = 3000) -> KLineSeries:
+    with open(DATA_FILE, "rb") as f:
+        cols, _, _ = kline_parser.parse_tdx(f.read())
+    klines = KLineSeries.from_arrays([cols[name] for name in ("time", "open", "high", "low", "close", "volume")],
+                                     symbol=SYMBOL)
+    return klines[:count]
+
+
+def summary(source):
+    """source 为 ChanlunContext 或 IncrementalChanlun"""
+    segments = [(s.pos_begin, s.pos_end, s.start_index, s.end_index, s.lowest, s.highest, s.up, s.is_sure)
+                for s in source.segments]
+    return repr(source.bi_list), segments, repr(source.bi_pivots), repr(source.duan_pivots)
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+@file: test_incremental.py
+@author: luhx
+@desc: IncrementalChanlun 与批量计算(ChanlunContext)结果一致
+  逐根 append、先输入未走完的K线再 update_last、中途 checkpoint/restore 之后继续输入,
+  每隔若干根比较 笔、线段、笔中枢、段中枢
+用法: python -m pytest tests
+"""
+import io
+from datetime import datetime, timedelta
+import numpy as np
+import pytest
+from conftest import real_klines, summary
+from common.chanlun.context import ChanlunContext
+from common.chanlun.incremental import IncrementalChanlun
+from common.model.kline import KLine, KLineSeries
+
+CHECK_EVERY = 37    # 每输入多少根比较一次
+
+
+def random_klines(n: int, seed: int, step: float) -> KLineSeries:
+    """随机游走的K线, 价格按 step 取整, 相等的高低点较多"""
+    rng = np.random.default_rng(seed)
+    close = 1000 + np.round(np.cumsum(rng.normal(0, 3, n)) / step) * step
+    open_ = np.r_[close[0], close[:-1]]
+    high = np.maximum(open_, close) + np.round(rng.exponential(1.5, n) / step) * step
+    low = np.minimum(open_, close) - np.round(rng.exponential(1.5, n) / step) * step
+    t0 = datetime(2020, 1, 2, 9, 0)
+    return KLineSeries([t0 + timedelta(minutes=5 * i) for i in range(n)], open_, high, low, close, np.ones(n))
+
+
+def assert_same(engine: IncrementalChanlun, klines: KLineSeries, count: int):
+    got, expect = summary(engine), summary(ChanlunContext(klines[:count]))
+    for name, a, b in zip(("bi_list", "segments", "bi_pivots", "duan_pivots"), got, expect):
+        assert a == b, f"{name} differs after {count} bars"
+
+
+def feed(klines: KLineSeries, seed: int, restore_every: int = 0):
+    """
+    逐根输入: 一半的K线先以中间价输入再 update_last 为最终值;
+    restore_every 大于0时, 每输入这么多根用 checkpoint 的结果重建引擎
+    """
+    rng = np.random.default_rng(seed)
+    engine = IncrementalChanlun()
+    for i in range(len(klines)):
+        bar = klines[i]
+        if rng.random() < 0.5:
+            mid = (bar.high + bar.low) / 2
+            engine.append(KLine(bar.time, bar.open, mid, mid, mid))
+            engine.update_last(bar)
+        else:
+            engine.append(bar)
+        if i % CHECK_EVERY == 0 or i == len(klines) - 1:
+            assert_same(engine, klines, i + 1)
+        if restore_every and i % restore_every == restore_every - 1:
+            engine = IncrementalChanlun.restore(engine.checkpoint())
+
+
+def test_real_bars():
+    feed(real_klines(), seed=0)
+
+
+@pytest.mark.parametrize("seed, step", [(1, 0.5), (2, 1), (3, 2), (4, 1)])
+def test_random_bars(seed, step):
+    feed(random_klines(1500, seed, step), seed)
+
+
+@pytest.mark.parametrize("seed", [5, 6])
+def test_checkpoint_restore(seed):
+    """restore 后只保留已确认的部分, 在下一根K线输入后与批量结果一致"""
+    klines = random_klines(1500, seed, 1)
+    feed(klines, seed, restore_every=CHECK_EVERY * 3 + 1)
+    feed(real_klines(1500), seed, restore_every=CHECK_EVERY * 5 + 1)
+
+
+def test_checkpoint_arrays():
+    """checkpoint 只含 numpy 数组, 经 np.savez 保存后可以原样恢复"""
+    klines = real_klines(2000)
+    engine = IncrementalChanlun()
+    engine.extend(klines[:1500])
+    state = engine.checkpoint()
+    assert all(isinstance(value, np.ndarray) and value.dtype != object for value in state.values())
+    buf = io.BytesIO()
+    np.savez(buf, **state)
+    buf.seek(0)
+    with np.load(buf, allow_pickle=False) as data:
+        restored = IncrementalChanlun.restore({name: data[name] for name in data.files})
+    restored.extend(klines[1500:])
+    engine.extend(klines[1500:])
+    assert summary(restored) == summary(engine) == summary(ChanlunContext(klines))
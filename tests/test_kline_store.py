@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+"""
+@file: test_kline_store.py
+@author: luhx
+@desc: data_source 为 parquet 与 text 时, 同样的 end_dt 取到同样的K线
+  end_dt 落在夜盘中时, 夜盘K线的交易时间比K线时间早一天, 终点按K线时间比较
+用法: python -m pytest tests
+"""
+import pytest
+pytest.importorskip("pyarrow")
+from conftest import DATA_FILE, SYMBOL
+from common.ui_main_window import _read_bars, _read_store_bars
+from common.utils import kline_parser, kline_store
+
+
+@pytest.fixture(scope="module")
+def store_path(tmp_path_factory):
+    root = str(tmp_path_factory.mktemp("kline_store"))
+    with open(DATA_FILE, "rb") as f:
+        cols, _, _ = kline_parser.parse_tdx(f.read())
+    kline_store.write_klines(SYMBOL, "5m", cols, root)
+    return root
+
+
+@pytest.mark.parametrize("end_dt", ["2020-01-05 22:00:00", "2020-01-06 22:00:00", "2020-01-03 21:30:00",
+                                    "2021-12-31 23:00:00", "2024-06-20 21:25:00", ""])
+@pytest.mark.parametrize("count", [1, 300, 3000])
+def test_tail_same_as_text(store_path, end_dt, count):
+    expect = _read_bars(DATA_FILE, [], count, "", end_dt, use_cache=False)
+    got = _read_store_bars(store_path, SYMBOL, "5m", count, "", end_dt)
+    assert len(got) == len(expect) > 0
+    assert list(got.items()) == list(expect.items())
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+@file: test_snapshot.py
+@author: luhx
+@desc: snapshot.load_chanlun 的结果与批量计算一致
+  首次计算、原样再加载、追加K线、改动最后一根、改动历史K线, 以及快照文件损坏时删除并重算
+用法: python -m pytest tests
+"""
+import os
+import pytest
+from conftest import real_klines, summary
+from common.chanlun.context import ChanlunContext
+from common.chanlun.snapshot import load_chanlun, snapshot_path
+from common.model.kline import KLineSeries
+
+
+def assert_batch(klines: KLineSeries, root: str):
+    assert summary(load_chanlun(klines, root)) == summary(ChanlunContext(klines))
+
+
+def test_reuse(tmp_path):
+    klines = real_klines()
+    root = str(tmp_path)
+    assert_batch(klines[:2000], root)
+    assert os.path.exists(snapshot_path(klines, root))
+    assert_batch(klines[:2000], root)
+    assert_batch(klines, root)
+    changed = klines.copy()
+    changed.high[-1] += 30
+    assert_batch(changed, root)
+    changed = klines.copy()
+    changed.low[1000] -= 30
+    assert_batch(changed, root)
+
+
+@pytest.mark.parametrize("damage", ["truncate", "junk", "empty"])
+def test_damaged_file(tmp_path, damage):
+    klines = real_klines()
+    root = str(tmp_path)
+    load_chanlun(klines[:2000], root)
+    path = snapshot_path(klines, root)
+    with open(path, "rb") as f:
+        data = f.read()
+    with open(path, "wb") as f:
+        f.write({"truncate": data[:len(data) // 2], "junk": b"PK\x03\x04" + b"\x00" * 64, "empty": b""}[damage])
+    assert_batch(klines, root)
+    assert os.path.getsize(path) > 64   # 损坏的文件已删除, 重算后写入了新的快照